@@ -23,6 +23,12 @@ def shutdown(*args):
     print("SIG shutdown")
 
 
+def dump_stats(*args):
+    """SIGUSR1 callback"""
+    del args
+    if CONTEXT["APPMGR"]:
+        CONTEXT["APPMGR"].dump_stats()
+
 
 def routine():
     CONTEXT["APPMGR"] = AppMgr()
@@ -35,6 +41,7 @@ def main():
     signal.signal(signal.SIGTERM, shutdown)
     signal.signal(signal.SIGHUP, shutdown)
     signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGUSR1, dump_stats)
 
     thread = threading.Thread(target=routine, name='AppMgr thread')
     thread.start()
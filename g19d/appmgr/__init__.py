@@ -1,8 +1,7 @@
 # coding: utf-8
 """Applet manager"""
-from time import sleep
+import time
 import datetime
-import timeit
 import threading
 import logging
 import PIL.Image as Img
@@ -11,11 +10,13 @@ from g19d.logitech.g19 import G19
 from g19d.logitech.g19_keys import Key
 from g19d.coloradapter import ColorAdapter
 from g19d.appmgr.keybindings import KeyBindings
+from g19d.apps.governor import FrameGovernor
 from g19d.apps.watch import Watch
 from g19d.apps.notify import Notification
 from g19d.apps.backlight_control import BLctl
 from g19d.apps.applets_list import AList
 from g19d.apps.configure import Configure
+from g19d.apps.runtime import AppletRuntime
 import os
 import sys
 
@@ -23,21 +24,32 @@ import sys
 
 class AppMgr(object):
     """docstring for AppMgr."""
-    def __init__(self):
+    FRAME_KEEPALIVE = 1.0
+
+    def __init__(self, frame_keepalive=FRAME_KEEPALIVE):
         fmat = u'%(levelname)-8s [%(asctime)s] <%(funcName)s:%(lineno)s> %(message)s'
         fname = "/var/log/g19d/{}.log".format(os.environ.get("USER", "unknown"))
         logging.basicConfig(format=fmat, filename=fname, level=logging.DEBUG)
         super(AppMgr, self).__init__()
         self.__exit = threading.Event()
-        self.__lcd = G19(True)
+        self.__frame_keepalive = frame_keepalive
+        self.__frame_cond = threading.Condition()
+        self.__governor = FrameGovernor()
+        # G19D_PARTIAL_UPDATES=1 opts in to windowed frames on the usb backend
+        partial = os.environ.get("G19D_PARTIAL_UPDATES")
+        self.__lcd = G19(True, frame_keepalive, os.environ.get("G19D_BACKEND", "usb"),
+                         None if partial is None else partial == "1")
         self.__key_listener = KeyBindings(self.__lcd)
         self.__lcd.add_key_listener(self.__key_listener)
         self.__lcd.start_event_handling()
+        self.__lcd.start_command_scheduler()
         self.__color_adapter = ColorAdapter(self.ambient_callback)
+        self.__runtime = AppletRuntime()
         self.__alist = AList(self)
         self.__apps = [Watch(self), Notification(self), BLctl(self), Configure(self), self.__alist]
         self.__cur_app = None
         self.__prev_app = None
+        self.__switch_lock = threading.RLock()
         self.change_app(self.__apps[0])
         self.__key_listener.register_keybind(self.__cur_app.get_keybind())
         self.__color_adapter.start()
@@ -46,21 +58,78 @@ class AppMgr(object):
         logging.info(u'AppMgr has been inited')
 
     def run(self):
-        """Routine for applet manager"""
+        """Routine for applet manager
+
+        Sends frames of current applet as it publishes them, paced by
+        FrameGovernor; while nothing changes it only wakes up for the frame
+        keep-alive.
+
+        """
+        self.__runtime.start()
         for app in self.__apps:
-            app.run()
+            app.get_buffers().set_listener(self.__wake)
+            app.run(self.__runtime)
 
+        shown_app = None
+        keepalive = 0.0
         while not self.__exit.is_set():
-            start_time = timeit.default_timer()
-            frame = self.__cur_app.get_frame_data()
-            if not frame:
+            app = self.__cur_app
+            buffers = app.get_buffers()
+            if app is not shown_app:
+                self.__governor.reset(*app.get_frame_rate())
+            elif not self.__wait(app, keepalive - time.monotonic(), buffers.has_newer):
+                # G19 resends unchanged frame only once keep-alive expired
+                frame, sequence, checksum = buffers.get_front()
+                self.__lcd.send_frame(frame, checksum)
+                keepalive = time.monotonic() + self.__frame_keepalive
+                continue
+            elif self.__cur_app is not app or self.__exit.is_set():
+                continue
+
+            ready = time.monotonic()
+            delay = self.__governor.get_delay(ready)
+            if delay > 0 and self.__wait(app, delay):
+                continue
+            acquired = buffers.acquire()
+            if acquired and app is shown_app:
+                frame, sequence, checksum, damage = acquired
+            else:
+                # Damage of a newly shown applet is not relative to the display
+                frame, sequence, checksum = buffers.get_front()
+                damage = None
+            if checksum is None:
+                # Nothing published yet
+                self.__wait(app, self.__frame_keepalive, buffers.has_newer)
                 continue
-            self.__lcd.send_frame(frame)
-            cooldown = (self.__cur_app.get_interval() - (timeit.default_timer() - start_time))
-            if cooldown < 0:
-                logging.info("Cooldown is negative")
-                cooldown = 0.001
-            sleep(cooldown)
+
+            start = time.monotonic()
+            self.__lcd.send_frame(frame, checksum, damage)
+            end = time.monotonic()
+            self.__governor.frame_sent(ready, start, end, self.__lcd.get_frame_backlog())
+            keepalive = end + self.__frame_keepalive
+            shown_app = app
+
+    def __wake(self):
+        """Wake up run(), called on frame publish, applet switch and exit"""
+        with self.__frame_cond:
+            self.__frame_cond.notify()
+
+    def __wait(self, app, timeout, ready=None):
+        """Wait at most timeout seconds for ready() to become true, app to
+        leave screen or exit, return False on timeout"""
+        with self.__frame_cond:
+            return self.__frame_cond.wait_for(
+                lambda: self.__cur_app is not app or self.__exit.is_set() or
+                (ready is not None and ready()), max(timeout, 0))
+
+    def dump_stats(self):
+        """Log frame, input and per-stage input latency statistics"""
+        logging.info(u'Frames: %s', self.__lcd.get_frame_stats())
+        logging.info(u'Input: %s', self.__lcd.get_input_stats())
+        logging.info(u'Applet runtime: %s', self.__runtime.get_stats())
+        logging.info(u'Frame governor: %s', self.__governor.get_stats())
+        for line in self.__lcd.get_input_latency().format():
+            logging.info(u'Input latency %s', line)
 
     def disable_ambient(self):
         self.__ambient_enable = False
@@ -82,17 +151,22 @@ class AppMgr(object):
             logging.warn(u'Already shutting')
             return
         self.__exit.set()
+        self.__wake()
 
         for app in self.__apps:
             app.shutdown()
+        logging.debug(u'Applet runtime...')
+        self.__runtime.stop()
 
         logging.debug(u'Color adapter...')
         self.__color_adapter.shutdown()
         self.__color_adapter.join()
 
+        self.dump_stats()
         logging.debug(u'Lcd reset...')
 
         self.__lcd.stop_event_handling()
+        self.__lcd.stop_command_scheduler()
         self.__lcd.reset()
 
         logging.info(u'Success shutdown!')
@@ -101,22 +175,36 @@ class AppMgr(object):
         return tuple(self.__apps)
 
     def change_app(self, app):
-        self.unirq()
-        self.__cur_app = app
-        self.__key_listener.drop_keybind()
-        keybinds = self.__cur_app.get_keybind()
-        keybinds.update(self.__alist.get_keybind_irq())
-        self.__key_listener.register_keybind(keybinds)
+        with self.__switch_lock:
+            self.unirq()
+            self.__show(app)
+            self.__key_listener.drop_keybind()
+            keybinds = self.__cur_app.get_keybind()
+            keybinds.update(self.__alist.get_keybind_irq())
+            self.__key_listener.register_keybind(keybinds)
 
     def irq(self, app):
-        self.unirq()
-        self.__prev_app = self.__cur_app
-        self.__cur_app = app
-        self.__key_listener.register_keybind(self.__cur_app.get_keybind())
+        with self.__switch_lock:
+            self.unirq()
+            self.__prev_app = self.__cur_app
+            self.__show(app)
+            self.__key_listener.register_keybind(self.__cur_app.get_keybind())
 
     def unirq(self):
-        if not self.__prev_app:
+        with self.__switch_lock:
+            if not self.__prev_app:
+                return
+            self.__show(self.__prev_app)
+            self.__key_listener.register_keybind(self.__cur_app.get_keybind())
+            self.__prev_app = None
+
+    def __show(self, app):
+        """Make app current one, hidden applets pause their ticks"""
+        old_app = self.__cur_app
+        self.__cur_app = app
+        if old_app is app:
             return
-        self.__cur_app = self.__prev_app
-        self.__key_listener.register_keybind(self.__cur_app.get_keybind())
-        self.__prev_app = None
+        self.__wake()
+        if old_app:
+            old_app.on_hide()
+        app.on_show()
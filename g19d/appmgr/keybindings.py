@@ -1,5 +1,6 @@
 # coding: utf-8
 """Key listener for G19 (only G19 just bucause of restrictions of original driver)"""
+import time
 import pynput.keyboard as keyboard
 from g19d.logitech.g19_keys import (Data, Key)
 
@@ -11,8 +12,12 @@ class KeyBindings(object):
 
     '''
 
+    # Bitmask of keys from G01 up to multimedia keys
+    __MACRO_KEYS = (1 << Key.WINKEY_SWITCH) - (1 << Key.G01)
+
     def __init__(self, lg19):
         self.__lg19 = lg19
+        self.__latency = lg19.get_input_latency()
         self.__cur_m = Data.LIGHT_KEY_M1
         self.__keyboard = keyboard.Controller()
         self.__macros_list = {
@@ -58,18 +63,22 @@ class KeyBindings(object):
     def __execute_macros(self, evnt):
         """Execute macros which bind on pressed key"""
         processed = False
-        for key in range(Key.G01, Key.WINKEY_SWITCH):
-            if key in evnt.keysDown:
-                state = True
-                callback = self.__macros_list.get((key, True), self.__press_key)
-            elif key in evnt.keysUp:
-                state = False
-                callback = self.__macros_list.get((key, False), self.__press_key)
-            else:
-                continue
+        changed = (evnt.pressed | evnt.released) & self.__MACRO_KEYS
+        while changed:
+            low = changed & -changed
+            changed ^= low
+            key = low.bit_length() - 1
+            state = evnt.pressed & low != 0
+            callback = self.__macros_list.get((key, state), self.__press_key)
 
             if callable(callback):
                 processed = callback(key, state)
+                # Time from packet arrival until keystroke is injected or
+                # applet's callback is done
+                if callback != self.__press_key:
+                    self.__latency.add('callback', time.monotonic() - evnt.timestamp)
+                elif processed:
+                    self.__latency.add('keystroke', time.monotonic() - evnt.timestamp)
 
         return processed
 
@@ -82,13 +91,13 @@ class KeyBindings(object):
         """Handler for keyboard listener"""
         processed = False
         # TODO: Move M-keys to macros
-        if Key.M1 in evt.keysDown:
+        if evt.is_pressed(Key.M1):
             self.__cur_m = Data.LIGHT_KEY_M1
             processed = True
-        if Key.M2 in evt.keysDown:
+        if evt.is_pressed(Key.M2):
             self.__cur_m = Data.LIGHT_KEY_M2
             processed = True
-        if Key.M3 in evt.keysDown:
+        if evt.is_pressed(Key.M3):
             self.__cur_m = Data.LIGHT_KEY_M3
             processed = True
 
@@ -3,6 +3,7 @@ import os
 import configparser
 
 import g19d.libdraw as libdraw
+from g19d.apps.buffers import TripleBuffer
 
 class Applet(object):
     LISTED = 1
@@ -14,35 +15,121 @@ class Applet(object):
         self._appmgr = appmgr
         self._drawer = libdraw.Drawer()
         self._exit = threading.Event()
-
-        self._thread = threading.Thread(target=self._loop)
-
-    def run(self):
+        # Frames published from drawer, taken by AppMgr
+        self._buffers = TripleBuffer()
+        # AppletRuntime running _tick(), set by run()
+        self._runtime = None
+        self.__tick_call = None
+        # Ticks only run while applet is on screen, see on_show()
+        self.__visible = False
+        self.__tick_lock = threading.Lock()
+        # Redraw requested by invalidate(), and whether it is queued
+        self.__dirty = False
+        self.__redraw_queued = False
+
+    def run(self, runtime):
+        """Draw first frame and start ticking on runtime if on screen"""
+        self._runtime = runtime
         self._startup()
         self._save_frame_data()
-        self._thread.start()
+        self.__update_ticks()
+        self.__queue_redraw()
 
     def shutdown(self):
         self._exit.set()
-        self._thread.join()
+        self.__update_ticks()
+
+    def on_show(self):
+        """Called by AppMgr when applet gets on screen
+
+        Resumes ticks; the first one runs right away, so the frame catches up
+        with whatever changed while hidden.
+
+        """
+        self.__visible = True
+        self.__update_ticks()
+        self.__queue_redraw()
+
+    def on_hide(self):
+        """Called by AppMgr when applet leaves screen, pauses ticks"""
+        self.__visible = False
+        self.__update_ticks()
+
+    def is_visible(self):
+        """Getter for whether applet is on screen"""
+        return self.__visible
+
+    def invalidate(self):
+        """Mark applet as changed, thread-safe
+
+        _redraw() runs once on the runtime for any number of calls made
+        before it starts; while hidden, it waits for on_show().
+
+        """
+        with self.__tick_lock:
+            self.__dirty = True
+        self.__queue_redraw()
+
+    def _redraw(self):
+        """Draw and publish frame after invalidate(), run on the runtime"""
+        pass
+
+    def __queue_redraw(self):
+        with self.__tick_lock:
+            if not self.__dirty or self.__redraw_queued or not self.__visible or \
+                    not self._runtime or self._exit.is_set():
+                return
+            self.__redraw_queued = True
+        self._runtime.call_soon(self.__run_redraw)
+
+    def __run_redraw(self):
+        with self.__tick_lock:
+            # Cleared before drawing, so changes made meanwhile queue another
+            self.__dirty = False
+            self.__redraw_queued = False
+        self._redraw()
+
+    def __update_ticks(self):
+        """Schedule or cancel ticks to match visibility"""
+        with self.__tick_lock:
+            running = self.__visible and not self._exit.is_set()
+            interval = self.get_tick_interval()
+            if running and interval and self._runtime and not self.__tick_call:
+                self.__tick_call = self._runtime.call_every(interval, self._tick)
+            elif not running and self.__tick_call:
+                self._runtime.cancel(self.__tick_call)
+                self.__tick_call = None
 
     def _startup(self):
         """Draw init image on screen"""
         pass
 
-    def _loop(self):
-        while not self._exit.is_set():
-            pass
+    def _tick(self):
+        """Periodic work of applet, run by AppletRuntime every
+        get_tick_interval() seconds"""
+        pass
 
-    def get_interval(self):
-        """Getter for _cooldown"""
-        return 0.1
+    def get_tick_interval(self):
+        """Getter for seconds between _tick() calls, None for no ticks"""
+        return None
+
+    def get_frame_rate(self):
+        """Getter for (target, maximum) frames per second sent while on
+        screen, see FrameGovernor"""
+        return (10.0, 30.0)
 
     def _save_frame_data(self):
-        self._frame_data = self._drawer.get_frame_data()
+        """Publish drawer's frame, skipped if it did not change
+
+        Called from one thread at a time: _startup() and then the runtime.
 
-    def get_frame_data(self):
-        return self._frame_data
+        """
+        self._drawer.copy_frame_to(self._buffers.get_back())
+        self._buffers.publish()
+
+    def get_buffers(self):
+        """Getter for TripleBuffer of published frames, AppMgr acquires them"""
+        return self._buffers
 
     def ambient_callback(self, color_rgb):
         """Callback for ambient_light"""
@@ -73,7 +160,7 @@ class Applet(object):
             config.write(config_file)
 
     def update_config(self):
-        pass
+        self._drawer.invalidate_layers()
 
 if __name__ == '__main__':
     exit(1)
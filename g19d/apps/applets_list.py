@@ -1,8 +1,6 @@
 import datetime
-import timeit
 import os
 import logging
-from time import sleep
 import threading
 
 from g19d.apps import Applet
@@ -19,49 +17,48 @@ class AList(Applet):
         self.name = "Applets list"
         self.__bg_color = [0, 0, 0]
         self.__entry = 0
-        self.__changed = threading.Event()
         self.__apps = ()
+        # Recorded entries by (applets, selected one), see __routine()
+        self.__lists = {}
 
     def _startup(self):
         """Draw init image on screen"""
-        drawer = self._drawer
+        self._drawer.add_static_layer("chrome", self.__draw_chrome)
+        self._drawer.restore_base()
+
+    def __draw_chrome(self, drawer):
+        """Static layer: background and header"""
         drawer.draw_rectangle([0, 0], [320, 240], self.__bg_color)
         drawer.draw_rectangle([15, 30], [240, 34], [145, 90, 0])
         drawer.draw_textline([16, 32], 32, "Applets list", 0xffff)
 
-    def _loop(self):
-        while not self._exit.is_set():
-            start_time = timeit.default_timer()
-
-            if not self.__changed:
-                sleep(0.05)
-                continue
-            self.__changed.clear()
-
-            self.__routine()
-            self._save_frame_data()
-
-            cooldown = (0.1 - (timeit.default_timer() - start_time))
-            if cooldown < 0:
-                print("cooldown is negative!")
-                cooldown = 0.001
-            sleep(cooldown)
+    def _redraw(self):
+        self.__routine()
+        self._save_frame_data()
 
     def __routine(self):
         """Applet's routine"""
         drawer = self._drawer
-        drawer.draw_rectangle([0, 80], [320, 120], self.__bg_color)
-
-        margin = 0
-        for key, app in enumerate(self.__apps):
-            pos_y = 80 + margin
-            margin += 30
-            if self.__entry == key:
-                drawer.draw_rectangle([30, pos_y], [240, 30], [0, 0, 155])
-            drawer.draw_textline([31, pos_y + 1], 24, app.name, 0xffff)
+        drawer.restore_base()
+
+        # Keys change state on another thread, so it is read once
+        state = (self.__apps, self.__entry)
+        display_list = self.__lists.get(state)
+        if display_list is None:
+            drawer.begin_list()
+            margin = 0
+            for key, app in enumerate(state[0]):
+                pos_y = 80 + margin
+                margin += 30
+                if state[1] == key:
+                    drawer.draw_rectangle([30, pos_y], [240, 30], [0, 0, 155])
+                drawer.draw_textline([31, pos_y + 1], 24, app.name, 0xffff)
+            display_list = self.__lists[state] = drawer.end_list()
+        drawer.draw_list(display_list)
 
     def get_keybind(self):
         self.__apps = tuple(app for app in self._appmgr.get_apps_list() if app.LISTED)
+        self.invalidate()
 
         def irq(key, state):
             self._appmgr.irq(self)
@@ -74,7 +71,7 @@ class AList(Applet):
                 self.__entry = self.__entry + 1 \
                                        if self.__entry < len(self.__apps) - 1 \
                                        else 0
-            self.__changed.set()
+            self.invalidate()
 
         def change_app(key, state):
             self._appmgr.change_app(self.__apps[self.__entry])
@@ -1,8 +1,6 @@
 import datetime
-import timeit
 import os
 import logging
-from time import sleep
 import threading
 
 from g19d.apps import Applet
@@ -34,12 +32,17 @@ class BLctl(Applet):
         self.__current_color = 0
         self.__bg_color = [0, 0, 0]
         self.__entry = "mode"
-        self.__changed = threading.Event()
-        self.__changed.set()
+        # Recorded menus by (mode, entry, color), see __routine()
+        self.__lists = {}
+        self.invalidate()
 
     def _startup(self):
         """Draw init image on screen"""
-        drawer = self._drawer
+        self._drawer.add_static_layer("chrome", self.__draw_chrome)
+        self._drawer.restore_base()
+
+    def __draw_chrome(self, drawer):
+        """Static layer: background and header"""
         drawer.draw_rectangle([0, 0], [320, 240], self.__bg_color)
         drawer.draw_rectangle([15, 30], [240, 34], [145, 90, 0])
         drawer.draw_textline([16, 32], 32, "Backlight control", 0xffff)
@@ -79,11 +82,11 @@ class BLctl(Applet):
                 self.__entry = "color"
             elif self.__entry == "color":
                 self.__entry = "mode"
-            self.__changed.set()
+            self.invalidate()
 
         def change_state(key, state):
             self.__toggle[self.__entry](key)
-            self.__changed.set()
+            self.invalidate()
 
 
         return { (Key.UP, True): move_trough_list,
@@ -91,39 +94,36 @@ class BLctl(Applet):
                  (Key.LEFT, True): change_state,
                  (Key.RIGHT, True): change_state }
 
-    def _loop(self):
-        while not self._exit.is_set():
-            start_time = timeit.default_timer()
-
-            if not self.__changed.is_set():
-                sleep(0.05)
-                continue
-            self.__changed.clear()
-
-            self.__routine()
-            self._save_frame_data()
-
-            cooldown = (0.1 - (timeit.default_timer() - start_time))
-            if cooldown < 0:
-                print("cooldown is negative!")
-                cooldown = 0.001
-            sleep(cooldown)
+    def _redraw(self):
+        self.__routine()
+        self._save_frame_data()
 
     def __routine(self):
         """Applet's routine"""
         drawer = self._drawer
-        drawer.draw_rectangle([0, 80], [320, 120], self.__bg_color)
-
-        mode_name = BLctl.MODE_NAMES[self.__current_mode]
-        if self.__entry == "mode":
+        drawer.restore_base()
+
+        # Keys change state on another thread, so it is read once
+        state = (self.__current_mode, self.__entry, self.__current_color)
+        display_list = self.__lists.get(state)
+        if display_list is None:
+            drawer.begin_list()
+            self.__draw_menu(drawer, *state)
+            display_list = self.__lists[state] = drawer.end_list()
+        drawer.draw_list(display_list)
+
+    def __draw_menu(self, drawer, mode, entry, color):
+        """Draw entries of given state"""
+        mode_name = BLctl.MODE_NAMES[mode]
+        if entry == "mode":
             drawer.draw_rectangle([30, 80], [240, 20], [0, 0, 155])
             mode_name = "< " + mode_name + " >"
         drawer.draw_textline([31, 81], 18, "Mode:", 0xffff)
         drawer.draw_textline([171, 81], 18, mode_name, 0xffff)
 
-        if self.__current_mode == BLctl.MANUAL:
-            if self.__entry == "color":
+        if mode == BLctl.MANUAL:
+            if entry == "color":
                 drawer.draw_rectangle([30, 110], [240, 20], [0, 0, 155])
                 drawer.draw_textline([186, 111], 18, "<     >", 0xffff)
             drawer.draw_textline([31, 111], 18, "Color:", 0xffff)
-            drawer.draw_rectangle([200, 113], [14, 14], BLctl.COLORS[self.__current_color])
+            drawer.draw_rectangle([200, 113], [14, 14], BLctl.COLORS[color])
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""Triple buffer passing frames from an applet to AppMgr"""
+import threading
+
+from g19d import libcdraw
+from g19d.logitech.g19 import union_window
+
+
+class TripleBuffer(object):
+    """Three libcdraw.Frame handed between one producer and one consumer
+
+    The producer fills get_back() and publish()es it; the consumer acquire()s
+    the newest published frame and keeps it as front until its next
+    acquire(). Frames only change owner by swapping references, the lock is
+    held for that alone, so neither side waits for the other to draw or send
+    and no frame is changed while read.
+
+    Each publish() gets a sequence number; acquire() returns nothing when no
+    newer frame was published, and its damage covers every change since the
+    previous frame acquired, including frames published in between and never
+    acquired.
+
+    """
+    def __init__(self):
+        super(TripleBuffer, self).__init__()
+        self.__lock = threading.Lock()
+        self.__back = libcdraw.Frame()
+        # Latest published frame waiting for acquire(), and its (sequence, checksum)
+        self.__ready = libcdraw.Frame()
+        self.__ready_info = (0, None)
+        # Frame held by consumer
+        self.__front = libcdraw.Frame()
+        self.__front_info = (0, None)
+        self.__sequence = 0
+        # Changes published since last acquire(), meaningful only while
+        # ready frame is newer than front
+        self.__damage = None
+        self.__listener = None
+
+    def set_listener(self, listener):
+        """Call listener() on producer's thread after every publish()"""
+        self.__listener = listener
+
+    def get_back(self):
+        """Getter for frame to draw into, owned by producer until publish()"""
+        return self.__back
+
+    def publish(self):
+        """Hand back frame to consumer, return False if it did not change
+
+        Back frame must hold last published frame plus changes recorded in
+        its damage; it is left that way for the next call.
+
+        """
+        back = self.__back
+        damage = back.get_damage()
+        if damage is None:
+            return False
+        checksum = back.get_checksum()
+        with self.__lock:
+            if self.__ready_info[0] > self.__front_info[0]:
+                # Ready frame was never acquired, its changes still count
+                damage = union_window(self.__damage, damage)
+            self.__sequence += 1
+            self.__back, self.__ready = self.__ready, back
+            self.__ready_info = (self.__sequence, checksum)
+            self.__damage = damage
+        # New back frame is older, catch up; published one is only read
+        self.__back.copy_from(back)
+        self.__back.clear_damage()
+        listener = self.__listener
+        if listener:
+            listener()
+        return True
+
+    def acquire(self):
+        """Take newest published frame as front
+
+        Return (frame, sequence, checksum, damage) or None if no frame newer
+        than front was published. Damage is (x, y, width, height) relative to
+        previous front.
+
+        """
+        with self.__lock:
+            if self.__ready_info[0] <= self.__front_info[0]:
+                return None
+            self.__front, self.__ready = self.__ready, self.__front
+            self.__front_info, self.__ready_info = self.__ready_info, self.__front_info
+            damage, self.__damage = self.__damage, None
+            sequence, checksum = self.__front_info
+        return (self.__front, sequence, checksum, damage)
+
+    def has_newer(self):
+        """Getter for whether acquire() would return a frame"""
+        return self.__ready_info[0] > self.__front_info[0]
+
+    def get_front(self):
+        """Getter for (frame, sequence, checksum) held by consumer
+
+        Sequence is 0 and checksum None until first acquire().
+
+        """
+        sequence, checksum = self.__front_info
+        return (self.__front, sequence, checksum)
+
+    def get_sequence(self):
+        """Getter for sequence number of last published frame"""
+        return self.__sequence
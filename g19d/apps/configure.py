@@ -1,8 +1,6 @@
 import datetime
-import timeit
 import os
 import logging
-from time import sleep
 import threading
 import PySimpleGUI as sg
 import gc
@@ -26,10 +24,8 @@ class Configure(Applet):
         self.name = "Configure"
         self.__bg_color = [0, 0, 0]
         self.__state = self.WAITING
-        self.__changed = threading.Event()
-        self.__changed.set()
+        self.invalidate()
         self.__thread = None
-        self.__window_closed = threading.Event()
         self.__show_window = threading.Event()
         self.__first_try = True
 
@@ -106,14 +102,19 @@ class Configure(Applet):
                         break
 
                 window.hide()
-                self.__window_closed.set()
+                self.__state = self.WAITING
+                self.invalidate()
 
         self.__thread = threading.Thread(target=open_window, name='Config window')
         self.__thread.start()
 
     def _startup(self):
         """Draw init image on screen"""
-        drawer = self._drawer
+        self._drawer.add_static_layer("chrome", self.__draw_chrome)
+        self._drawer.restore_base()
+
+    def __draw_chrome(self, drawer):
+        """Static layer: background and header"""
         drawer.draw_rectangle([0, 0], [320, 240], self.__bg_color)
         drawer.draw_rectangle([15, 30], [240, 34], [145, 90, 0])
         drawer.draw_textline([16, 32], 32, "Configure", 0xffff)
@@ -129,37 +130,19 @@ class Configure(Applet):
             if self.__state != self.WAITING:
                 return
             self.__state = self.CONFIGURING
-            self.__changed.set()
+            self.invalidate()
             self.__show_window.set()
 
         return { (Key.OK, True): open_config_window }
 
-    def _loop(self):
-        while not self._exit.is_set():
-            start_time = timeit.default_timer()
-            if self.__window_closed.is_set():
-                self.__window_closed.clear()
-                self.__state = self.WAITING
-                self.__changed.set()
-
-            if not self.__changed.is_set():
-                sleep(0.05)
-                continue
-            self.__changed.clear()
-
-            self.__routine()
-            self._save_frame_data()
-
-            cooldown = (0.1 - (timeit.default_timer() - start_time))
-            if cooldown < 0:
-                print("cooldown is negative!")
-                cooldown = 0.001
-            sleep(cooldown)
+    def _redraw(self):
+        self.__routine()
+        self._save_frame_data()
 
     def __routine(self):
         """Applet's routine"""
         drawer = self._drawer
-        drawer.draw_rectangle([0, 80], [320, 120], self.__bg_color)
+        drawer.restore_base()
 
         state_name = self.STATE_NAMES[self.__state]
         drawer.draw_textline([31, 81], 18, state_name, 0xffff)
@@ -0,0 +1,104 @@
+# coding: utf-8
+"""Pacing of frames sent by AppMgr"""
+import threading
+import time
+
+from g19d.logitech.latency import LatencyStats
+
+
+class FrameGovernor(object):
+    """Decides when the next frame of shown applet may be sent
+
+    Frames go out on a grid of deadlines 1/rate apart, like periodic calls of
+    AppletRuntime, so animations get steady pacing and frames published in
+    between are coalesced. A frame published after the applet was idle goes
+    out right away; one sent late lets the next follow sooner to get back on
+    the grid, but never sooner than 1/maximum after it.
+
+    A frame sent more than a period late, or whose send took longer than a
+    period, is a deadline miss; a frame waiting behind another for the bus is
+    a stall. Both lower the rate, each frame sent in time raises it back
+    towards the target.
+
+    """
+    MIN_RATE = 1.0
+    DECREASE = 0.75
+    INCREASE = 0.5
+
+    def __init__(self):
+        super(FrameGovernor, self).__init__()
+        self.__lock = threading.Lock()
+        self.__target = 10.0
+        self.__maximum = 30.0
+        self.__rate = self.__target
+        self.__deadline = 0.0
+        self.__last = None
+        self.__started = time.monotonic()
+        self.__frames = 0
+        self.__misses = 0
+        self.__stalls = 0
+        self.__frame_time = LatencyStats()
+        self.__send_time = LatencyStats()
+
+    def reset(self, target, maximum):
+        """Start pacing another applet at target frames per second, at most
+        maximum"""
+        with self.__lock:
+            self.__target = max(float(target), self.MIN_RATE)
+            self.__maximum = max(float(maximum), self.__target)
+            self.__rate = self.__target
+            self.__deadline = 0.0
+            self.__last = None
+
+    def get_delay(self, now):
+        """Getter for seconds to wait before sending a frame at now"""
+        with self.__lock:
+            due = self.__deadline
+            if self.__last is not None:
+                due = max(due, self.__last + 1.0 / self.__maximum)
+        return due - now
+
+    def frame_sent(self, ready, start, end, backlog):
+        """Record a frame
+
+        ready is when the frame was noticed, start and end bound its send and
+        backlog is number of frames queued for the bus right after it.
+
+        """
+        with self.__lock:
+            period = 1.0 / self.__rate
+            due = max(self.__deadline, ready)
+            missed = start - due > period or end - start > period
+            stalled = backlog > 1
+            if missed or stalled:
+                self.__misses += missed
+                self.__stalls += stalled
+                self.__rate = max(self.__rate * self.DECREASE, self.MIN_RATE)
+            else:
+                self.__rate = min(self.__rate + self.INCREASE, self.__target)
+            period = 1.0 / self.__rate
+            # Missed periods are skipped rather than caught up
+            self.__deadline = start + period if missed else due + period
+            if self.__last is not None:
+                self.__frame_time.add(start - self.__last)
+            self.__last = start
+            self.__frames += 1
+        self.__send_time.add(end - start)
+
+    def get_rate(self):
+        """Getter for frames per second currently allowed"""
+        return self.__rate
+
+    def get_stats(self):
+        """Getter for frames sent, their mean rate, deadline misses, stalls,
+        current rate and summaries of time between frames and of sends"""
+        with self.__lock:
+            frames = self.__frames
+            stats = {'frames': frames,
+                     'fps': frames / (time.monotonic() - self.__started),
+                     'misses': self.__misses,
+                     'stalls': self.__stalls,
+                     'rate': self.__rate}
+        stats['frame_time'] = self.__frame_time.get_summary()
+        stats['send_time'] = self.__send_time.get_summary()
+        return stats
@@ -1,11 +1,11 @@
 import datetime
-import timeit
 import os
 from gi.repository import GLib
 import dbus
 from dbus.mainloop.glib import DBusGMainLoop
 import threading
 import logging
+import collections
 
 from g19d.apps import Applet
 import PIL.Image as Img
@@ -20,12 +20,17 @@ class Notification(Applet):
         self.name = "Notification"
         DBusGMainLoop(set_as_default=True)
         self.__background = Img.open(os.path.dirname(os.path.abspath(__file__)) + "/../background.png")
-        self.__background = self.__background.resize((320, 240), Img.CUBIC)
+        self.__background = self.__background.resize((320, 240), Img.BICUBIC)
         self.__watch_alpha = 0.6
         self.__bg_color = [66, 240, 120, self.__watch_alpha]
         self._cooldown = 1
+        self._drawer.add_static_layer("background", self.__draw_background)
+        # Received on the GLib thread, shown one by one on the runtime
+        self.__pending = collections.deque()
+        self.__shown = None
+        self.__hide_call = None
         self.__notification_loop = GLib.MainLoop()
-        self.__notification_thread = threading.Thread(target=self._loop, name='Notification thread')
+        self.__notification_thread = threading.Thread(target=self.__listen, name='Notification thread')
         self.__notification_thread.start()
 
     def __draw_message(self, message):
@@ -33,8 +38,7 @@ class Notification(Applet):
         drawer = self._drawer
         time = datetime.datetime.now().strftime("%H:%M")
 
-        drawer.draw_image([0, 0], [320, 240], self.__background)
-        drawer.draw_rectangle([0, 0], [320, 240], self.__bg_color)
+        drawer.restore_base()
         drawer.draw_textline([15, 200], 32, time)
         drawer.draw_textline([15, 10], 32, message["summary"])
         try:
@@ -42,7 +46,12 @@ class Notification(Applet):
         except Exception as e:
             logging.error(e)
 
-    def _loop(self):
+    def __draw_background(self, drawer):
+        """Static layer: tinted background"""
+        drawer.draw_image([0, 0], [320, 240], self.__background)
+        drawer.draw_rectangle([0, 0], [320, 240], self.__bg_color)
+
+    def __listen(self):
         if self._exit.wait(timeout=10):
             return
         session_bus = dbus.SessionBus()
@@ -58,28 +67,45 @@ class Notification(Applet):
         keys = ["app_name", "replaces_id", "app_icon", "summary",
                 "body", "actions", "hints", "expire_timeout"]
         args = message.get_args_list()
-        if len(args) == 8:
+        if len(args) == 8 and self._runtime:
             notification = dict([(keys[i], args[i]) for i in range(8)])
+            self._runtime.call_soon(self.__queue, notification)
 
-            self.__draw_message(notification)
-            self._save_frame_data()
-            self._appmgr.irq(self)
-            timeout = notification["expire_timeout"] / 1000 \
-                      if 2000 <= notification["expire_timeout"] <= 10000 \
-                      else 4
-            self._exit.wait(timeout=timeout)
+    def __queue(self, notification):
+        self.__pending.append(notification)
+        if self.__shown is None:
+            self.__show_next()
+
+    def __show_next(self):
+        """Show oldest pending notification, or give screen back if none"""
+        if not self.__pending:
+            self.__shown = None
             self._appmgr.unirq()
+            return
+        notification = self.__shown = self.__pending.popleft()
+
+        self.__draw_message(notification)
+        self._save_frame_data()
+        self._appmgr.irq(self)
+        timeout = notification["expire_timeout"] / 1000 \
+                  if 2000 <= notification["expire_timeout"] <= 10000 \
+                  else 4
+        self.__hide_call = self._runtime.call_later(timeout, self.__show_next)
+
+    def __close(self):
+        if self.__shown is None:
+            return
+        self._runtime.cancel(self.__hide_call)
+        self.__show_next()
 
     def shutdown(self):
         logging.debug(u'Notify loop...')
-        self._exit.set()
+        super(Notification, self).shutdown()
         if self.__notification_loop.is_running():
             self.__notification_loop.quit()
 
     def get_keybind(self):
         def close_notification(key, state):
-            # Notifications are less depending on _exit flag, let's hack it to interrupt __print_notification
-            self._exit.set()
-            self._exit.clear()
+            self._runtime.call_soon(self.__close)
 
         return { (Key.BACK, True): close_notification }
@@ -0,0 +1,117 @@
+# coding: utf-8
+"""Single thread running ticks and redraws of all applets"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from g19d.logitech.latency import LatencyStats
+
+
+class ScheduledCall(object):
+    """Handle of a call queued in AppletRuntime, see AppletRuntime.cancel()"""
+    def __init__(self, deadline, interval, callback, args):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class AppletRuntime(object):
+    """Runs queued calls of all applets on one thread
+
+    Calls wait in a heap ordered by deadline, the thread sleeps until the
+    earliest one is due, so nothing runs between ticks. Periodic calls are
+    rescheduled from their previous deadline rather than from when they ran,
+    so they do not drift; periods missed while running late are skipped.
+
+    """
+    def __init__(self):
+        super(AppletRuntime, self).__init__()
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__cond = threading.Condition()
+        self.__running = False
+        self.__thread = None
+        self.__calls = 0
+        self.__lateness = LatencyStats()
+
+    def start(self):
+        """Start the thread running calls"""
+        with self.__cond:
+            if self.__running:
+                return
+            self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='Applet runtime')
+        self.__thread.start()
+
+    def stop(self):
+        """Stop the thread, calls not run yet are dropped"""
+        with self.__cond:
+            self.__running = False
+            self.__heap = []
+            self.__cond.notify()
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.__thread = None
+
+    def call_at(self, deadline, callback, *args):
+        """Run callback(*args) at time.monotonic() deadline"""
+        return self.__push(ScheduledCall(deadline, None, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) in delay seconds"""
+        return self.call_at(time.monotonic() + delay, callback, *args)
+
+    def call_soon(self, callback, *args):
+        """Run callback(*args) as soon as possible, after calls already due"""
+        return self.call_at(time.monotonic(), callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) every interval seconds, first time now"""
+        return self.__push(ScheduledCall(time.monotonic(), interval, callback, args))
+
+    def cancel(self, call):
+        """Drop call returned by one of call_* methods, if it did not run yet"""
+        if call is not None:
+            call.cancelled = True
+
+    def get_stats(self):
+        """Getter for number of calls run and summary of how late they ran"""
+        return {'calls': self.__calls, 'lateness': self.__lateness.get_summary()}
+
+    def __push(self, call):
+        with self.__cond:
+            heapq.heappush(self.__heap, (call.deadline, next(self.__sequence), call))
+            self.__cond.notify()
+        return call
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                while self.__running:
+                    while self.__heap and self.__heap[0][2].cancelled:
+                        heapq.heappop(self.__heap)
+                    now = time.monotonic()
+                    if self.__heap and self.__heap[0][0] <= now:
+                        break
+                    self.__cond.wait(self.__heap[0][0] - now if self.__heap else None)
+                if not self.__running:
+                    return
+                deadline, sequence, call = heapq.heappop(self.__heap)
+
+            self.__lateness.add(now - deadline)
+            self.__calls += 1
+            try:
+                call.callback(*call.args)
+            except Exception:
+                logging.exception(u'Applet call %s failed', call.callback)
+
+            if call.interval and not call.cancelled:
+                call.deadline += call.interval
+                now = time.monotonic()
+                if call.deadline <= now:
+                    call.deadline += call.interval * int((now - call.deadline) / call.interval + 1)
+                self.__push(call)
@@ -1,11 +1,10 @@
 import datetime
-import timeit
 import os
 import logging
-from time import sleep
 import configparser
 import threading
 import random
+from array import array
 
 from g19d.apps import Applet
 import PIL.Image as Img
@@ -42,25 +41,30 @@ class Watch(Applet):
         snow_enable = self._get_config("snow_flakes")
         if snow_enable == "yes":
             self.__snow = Img.open(os.path.dirname(os.path.abspath(__file__)) + "/../flake.png")
-            self.__snow_pos = []
-            while len(self.__snow_pos) < 50:
-                self.__snow_pos.append([random.randint(-10, 330), random.randint(-10, 250)])
+            self.__snow_pos = array('h')
+            while len(self.__snow_pos) < 100:
+                self.__snow_pos.extend([random.randint(-10, 330), random.randint(-10, 250)])
         else:
             self.__snow = False
 
     def _startup(self):
         """Draw init image on screen"""
         self.__background = Img.open(self.__background_path)
-        self.__background = self.__background.resize((320, 240), Img.CUBIC)
-        self.__background_crop = self.__background.crop((0, 90, 320, 175))
+        self.__background = self.__background.resize((320, 240), Img.BICUBIC)
 
         drawer = self._drawer
         time = datetime.datetime.now().strftime("%H:%M:%S")
 
-        drawer.draw_image([0, 0], [320, 240], self.__background)
-        drawer.draw_rectangle([0, 90], [320, 85], self.__bg_color)
+        drawer.add_static_layer("background", self.__draw_background)
+        drawer.restore_base()
         drawer.draw_textline([32, 90], 72, time)
 
+    def __draw_background(self, drawer):
+        """Static layer: background and, unless flakes fall over it, the band"""
+        drawer.draw_image([0, 0], [320, 240], self.__background)
+        if not self.__snow:
+            drawer.draw_rectangle([0, 90], [320, 85], self.__bg_color)
+
     def get_keybind(self):
         def reset_timer(key, state):
             self.__time_offset = datetime.datetime.now()
@@ -87,16 +91,12 @@ class Watch(Applet):
                  (Key.MENU, True): switch,
                  (Key.OK, True):   pause }
 
-    def _loop(self):
-        while not self._exit.is_set():
-            start_time = timeit.default_timer()
-            self.__routine()
-            self._save_frame_data()
-            cooldown = (0.1 - (timeit.default_timer() - start_time))
-            if cooldown < 0:
-                print("cooldown is negative!")
-                cooldown = 0.001
-            self._exit.wait(timeout=cooldown)
+    def get_tick_interval(self):
+        return 0.1
+
+    def _tick(self):
+        self.__routine()
+        self._save_frame_data()
 
     def __routine(self):
         """Applet's routine"""
@@ -107,35 +107,37 @@ class Watch(Applet):
         drawer = self._drawer
         time = self.__timer()
 
+        drawer.restore_base()
         if self.__snow:
-            background = self.__background
             flake_img = self.__snow
 
-            drawer.draw_image([0, 0], [320, 240], background)
-            for flake in self.__snow_pos:
-                flake[0] = flake[0] + random.randint(-1, 1)
-                flake[1] = flake[1] + random.randint(1, 5)
-                if flake[0] > 330:
-                    flake[0] = flake[0] % 25 * -1
-                if flake[1] > 250:
-                    flake[1] = flake[1] % 25 * -1
-                if flake[0] < -10:
-                    flake[0] = flake[0] % 25 + 310
-                if flake[1] < -10:
-                    flake[1] = flake[1] % 25 + 230
-                drawer.draw_image(flake, [25, 25], flake_img)
-        else:
-            background_crop = self.__background_crop
-            drawer.draw_image([0, 90], [320, 85], background_crop)
+            snow_pos = self.__snow_pos
+            for i in range(0, len(snow_pos), 2):
+                x = snow_pos[i] + random.randint(-1, 1)
+                y = snow_pos[i + 1] + random.randint(1, 5)
+                if x > 330:
+                    x = x % 25 * -1
+                if y > 250:
+                    y = y % 25 * -1
+                if x < -10:
+                    x = x % 25 + 310
+                if y < -10:
+                    y = y % 25 + 230
+                snow_pos[i] = x
+                snow_pos[i + 1] = y
+            drawer.draw_images(snow_pos, [25, 25], flake_img)
+            drawer.draw_rectangle([0, 90], [320, 85], self.__bg_color)
 
-        drawer.draw_rectangle([0, 90], [320, 85], self.__bg_color)
         drawer.draw_textline([32, 103], 72, time)
 
     def ambient_callback(self, color_rgb):
         """Callback for ambient_light"""
         if color_rgb == [0, 0, 0]:
             return
-        self.__bg_color = color_rgb + [ self.__watch_alpha ]
+        bg_color = color_rgb + [ self.__watch_alpha ]
+        if bg_color != self.__bg_color:
+            self.__bg_color = bg_color
+            self._drawer.invalidate_layers()
 
     def __stopwatch(self):
         if self.__freeze_time:
@@ -152,4 +154,5 @@ class Watch(Applet):
     def update_config(self):
         self.__load_config()
         self.__need_startup.set()
+        super(Watch, self).update_config()
 
@@ -3,23 +3,257 @@
 """ Helper for drawing"""
 import os
 import timeit
+import collections
+import functools
+import threading
+import weakref
 import PIL.Image as Img
 import PIL.ImageDraw as Draw
 import PIL.ImageFont as Font
 from g19d import libcdraw
 import ctypes
 
+FONT_FILE = os.path.dirname(__file__) + "/11676.otf"
+
+
+class FontFace(object):
+    """Loaded FreeType face of one size with LRU table of advance widths and
+    libcdraw.Atlas of rasterized glyphs"""
+
+    ADVANCES_CACHED = 512
+
+    def __init__(self, font, advances_cached=ADVANCES_CACHED):
+        super(FontFace, self).__init__()
+        self.__font = font
+        self.__advances = collections.OrderedDict()
+        self.__advances_cached = advances_cached
+        self.__mutex = threading.Lock()
+        self.__atlas = libcdraw.Atlas()
+        if hasattr(font, "getlength"):
+            self.__measure = lambda char: int(font.getlength(char))
+        else:
+            self.__measure = lambda char: font.getsize(char)[0]
+
+    def get_font(self):
+        """Getter for Pillow font"""
+        return self.__font
+
+    def get_advance(self, char):
+        """Width of char in pixels"""
+        with self.__mutex:
+            advance = self.__advances.get(char)
+            if advance is not None:
+                self.__advances.move_to_end(char)
+                return advance
+
+        advance = self.__measure(char)
+        with self.__mutex:
+            self.__advances[char] = advance
+            if len(self.__advances) > self.__advances_cached:
+                self.__advances.popitem(last=False)
+        return advance
+
+    def get_atlas(self, text):
+        """Getter for glyph atlas holding every char of text"""
+        for char in self.__atlas.missing(text):
+            self.__add_glyph(char)
+        return self.__atlas
+
+    def get_line_spacing(self):
+        """Distance between rows of text as Pillow lays them out"""
+        if hasattr(self.__font, "getbbox"):
+            return self.__font.getbbox("A")[3] + 4
+        return self.__font.getsize("A")[1] + 4
+
+    def __add_glyph(self, char):
+        """Rasterize char once into atlas"""
+        font = self.__font
+        if hasattr(font, "getbbox"):
+            advance = int(round(font.getlength(char) * 64))
+            left, top, right, bottom = font.getbbox(char)
+        else:
+            right, bottom = font.getsize(char)
+            left, top, advance = 0, 0, right * 64
+        width, height = max(right - left, 0), max(bottom - top, 0)
+        coverage = b""
+        if width and height:
+            img = Img.new("L", (width, height), 0)
+            Draw.Draw(img).text((-left, -top), char, 255, font=font)
+            coverage = img.tobytes()
+        self.__atlas.add(ord(char), left, top, advance, width, height, coverage)
+
+
+@functools.lru_cache(maxsize=32)
+def load_font(size, path=FONT_FILE):
+    """Load FontFace once per path and size for the whole process"""
+    return FontFace(Font.truetype(path, size))
+
+
+class SpriteCache(object):
+    """LRU cache of images converted to libcdraw.Sprite, keyed by image
+    identity and size and bounded by memory. Cached images must not be
+    changed in place."""
+
+    MAX_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        super(SpriteCache, self).__init__()
+        self.__sprites = collections.OrderedDict()
+        self.__bytes = 0
+        self.__max_bytes = max_bytes
+        self.__mutex = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, img, size):
+        """Getter for libcdraw.Sprite of img resized to size"""
+        key = (id(img), size[0], size[1])
+        with self.__mutex:
+            entry = self.__sprites.get(key)
+            if entry is not None and entry[0]() is img:
+                self.__sprites.move_to_end(key)
+                self.__hits += 1
+                return entry[1]
+            self.__misses += 1
+
+        sprite = self.__convert(img, size)
+        with self.__mutex:
+            old = self.__sprites.pop(key, None)
+            if old is not None:
+                self.__bytes -= old[1].get_nbytes()
+            self.__sprites[key] = (weakref.ref(img), sprite)
+            self.__bytes += sprite.get_nbytes()
+            while self.__bytes > self.__max_bytes and len(self.__sprites) > 1:
+                self.__bytes -= self.__sprites.popitem(last=False)[1][1].get_nbytes()
+        return sprite
+
+    def get_stats(self):
+        """Getter for dict of hits, misses, number of sprites and bytes held"""
+        with self.__mutex:
+            return {"hits": self.__hits, "misses": self.__misses,
+                    "sprites": len(self.__sprites), "bytes": self.__bytes}
+
+    @staticmethod
+    def __convert(img, size):
+        if img.size != (size[0], size[1]):
+            img = img.resize((size[0], size[1]), Img.BICUBIC)
+
+        pixels = libcdraw.pack_rgb565(img.convert("RGB").tobytes())
+        mask = None
+        if "A" in img.getbands():
+            mask = img.getchannel("A").tobytes()
+        return libcdraw.Sprite(size[0], size[1], pixels, mask)
+
+
+SPRITES = SpriteCache()
+
 
 class Drawer(object):
     """docstring for Drawer."""
     def __init__(self):
         super(Drawer, self).__init__()
         self.__frame = libcdraw.Frame()
+        # Where draw calls go: the frame or a DisplayList, see begin_list()
+        self.__target = self.__frame
+        # Static layers flattened into __base, see restore_base()
+        self.__base = None
+        self.__base_valid = False
+        self.__layers = collections.OrderedDict()
+        self.__layers_lock = threading.Lock()
 
     def get_frame_data(self):
         """Getter for frame data"""
         return self.__frame.get_bytes()
 
+    def copy_frame_to(self, frame):
+        """Copy frame data to libcdraw.Frame without allocations"""
+        frame.copy_from(self.__frame)
+
+    def get_checksum(self):
+        """Getter for fingerprint of frame data"""
+        return self.__frame.get_checksum()
+
+    def get_pixels(self):
+        """Writable view of frame without copying: uint16 pixels indexed
+        [x, y], numpy.asarray() takes it as is. Call add_damage() after
+        writing through it"""
+        return memoryview(self.__frame)
+
+    def add_damage(self, position=(0, 0), size=(320, 240)):
+        """Mark area written through get_pixels() as changed"""
+        self.__frame.add_damage(position[0], position[1], size[0], size[1])
+
+    def add_static_layer(self, name, paint):
+        """Add layer drawn by paint(drawer) into cached base frame
+
+        Layers are flattened in order of adding, over black. Adding a layer
+        under existing name replaces it in place.
+
+        """
+        with self.__layers_lock:
+            self.__layers[name] = paint
+            self.__base_valid = False
+
+    def remove_static_layer(self, name):
+        """Remove layer from base frame"""
+        with self.__layers_lock:
+            if self.__layers.pop(name, None) is not None:
+                self.__base_valid = False
+
+    def invalidate_layers(self):
+        """Make next restore_base() flatten static layers again, e.g. after
+        their content or config changes"""
+        with self.__layers_lock:
+            self.__base_valid = False
+
+    def restore_base(self):
+        """Start frame over from flattened static layers"""
+        with self.__layers_lock:
+            valid = self.__base_valid
+            layers = list(self.__layers.values())
+            self.__base_valid = True
+
+        if valid:
+            self.__frame.copy_from(self.__base)
+            return
+
+        target = self.__target
+        self.__target = self.__frame
+        try:
+            self.__frame.draw_rectangle(0, 0, 320, 240, 0, 1.0)
+            for paint in layers:
+                paint(self)
+        finally:
+            self.__target = target
+        if self.__base is None:
+            self.__base = libcdraw.Frame()
+        self.__base.copy_from(self.__frame)
+
+    def begin_list(self, display_list=None):
+        """Record following draw calls into display_list (a new one if None)
+        instead of drawing them, until end_list()
+
+        Conversions of colors, images and text are done while recording, so
+        a recorded list is drawn by draw_list() in one call, as often as
+        needed.
+
+        """
+        if display_list is None:
+            display_list = libcdraw.DisplayList()
+        else:
+            display_list.clear()
+        self.__target = display_list
+
+    def end_list(self):
+        """Stop recording, return libcdraw.DisplayList of begin_list()"""
+        display_list = self.__target
+        self.__target = self.__frame
+        return display_list if display_list is not self.__frame else None
+
+    def draw_list(self, display_list):
+        """Draw recorded display list"""
+        self.__frame.execute(display_list)
+
     def draw_rectangle(self, position, size, color_rgb):
         """Draw rectangle on frame"""
         color = libcdraw.rgb_to_uint16(color_rgb[0], color_rgb[1], color_rgb[2])
@@ -28,7 +262,7 @@ class Drawer(object):
         else:
             alpha = 1.0
 
-        new_frame = self.__frame.draw_rectangle(position[0], position[1], size[0], size[1], color, alpha)
+        new_frame = self.__target.draw_rectangle(position[0], position[1], size[0], size[1], color, alpha)
 
     def draw_image_from_file(self, position, size, filename):
         """Draw image frome file"""
@@ -37,24 +271,19 @@ class Drawer(object):
 
     def draw_image(self, position, size, img):
         """Draw image"""
-        if img.size != (size[0], size[1]):
-            img = img.resize((size[0], size[1]), Img.CUBIC)
-
-        image = img.convert(mode='BGR;16').tobytes()
-        if img.mode == "RGBA":
-            mask = img.split()[-1].tobytes()
-        else:
-            mask = bytes([255] * (size[0] * size[1]))
+        self.__target.blit(SPRITES.get(img, size), position[0], position[1])
 
-        new_frame = self.__frame.copy_rectangle(position[0], position[1], size[0], size[1], image, mask)
+    def draw_images(self, positions, size, img):
+        """Draw image at every x, y pair of positions, e.g. array('h'), in one call"""
+        self.__target.blit_many(SPRITES.get(img, size), positions)
 
     def draw_text(self, position, size, img, color=0x00):
         msk = img.tobytes()
-        new_frame = self.__frame.copy_text(position[0], position[1], size[0], size[1], color, msk)
+        new_frame = self.__target.copy_text(position[0], position[1], size[0], size[1], color, msk)
 
-    def draw_text_fitted(self, position, font_size, text):
+    def draw_text_fitted(self, position, font_size, text, color=0x00):
         """Draw text"""
-        font = Font.truetype(os.path.dirname(__file__) + "/11676.otf", font_size)
+        face = load_font(font_size)
         height = font_size
         maxwidth = 0
         i = 0
@@ -62,7 +291,7 @@ class Drawer(object):
         row = ""
         row_len = 0
         for char in text:
-            char_len = font.getsize(char)[0]
+            char_len = face.get_advance(char)
             overflow = row_len + char_len > 320 - position[0]
             if overflow:
                 if char == " " or char == "\n":
@@ -85,27 +314,25 @@ class Drawer(object):
             if maxwidth < row_len:
                 maxwidth = row_len
 
-        text = "\n".join(rows)
-        img = Img.new("L", (maxwidth, height), ("black"))
-        draw = Draw.Draw(img)
-        draw.text([0, 0], text, ("white"), font=font)
-        self.draw_text(position, [maxwidth, height], img)
+        atlas = face.get_atlas("".join(rows))
+        line_spacing = face.get_line_spacing()
+        clip = (position[0], position[1], maxwidth, height)
+        for i, row in enumerate(rows):
+            self.__target.draw_string(atlas, position[0], position[1] + i * line_spacing,
+                                     color, row, clip)
 
     def draw_textline(self, position, font_size, text, color=0x00):
         """Draw text"""
-        font = Font.truetype(os.path.dirname(__file__) + "/11676.otf", font_size)
+        face = load_font(font_size)
         width = 0
         for i in range(len(text)):
-            width += font.getsize(text[i])[0]
+            width += face.get_advance(text[i])
             if text[i] == '\n' or width > 320 - position[0]:
                 text = text[:i-1]
                 break
-        img = Img.new("L", (320 - position[0], font_size), ("black"))
-        draw = Draw.Draw(img)
-        draw.text([0, -int(font_size * 0.1875)], text, ("white"), font=font)
-
-        self.draw_text(position, [320 - position[0], font_size], img, color)
-
+        self.__target.draw_string(face.get_atlas(text), position[0],
+                                 position[1] - int(font_size * 0.1875), color, text,
+                                 (position[0], position[1], 320 - position[0], font_size))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,85 @@
+# coding: utf-8
+#
+""" Micro-benchmark of libcdraw blits: python -m g19d.libdraw"""
+import random
+import timeit
+from g19d import libcdraw
+
+
+def main():
+    """Prints time of full screen and small blits for every SIMD kernel set
+    and of reading and writing frame through its buffer"""
+    random.seed(0)
+    image = bytes(random.getrandbits(8) for _ in range(320 * 240 * 2))
+    opaque = bytes([255] * (320 * 240))
+    soft = bytes(random.choice([0, 60, 128, 255]) for _ in range(320 * 240))
+    text = bytes(random.choice([0, 0, 0, 0, 128, 255]) for _ in range(288 * 72))
+    sprite, sprite_mask = image[:25 * 25 * 2], soft[:25 * 25]
+    frame = libcdraw.Frame()
+
+    cases = [
+        ("copy_rectangle 320x240 opaque", 200,
+         lambda: frame.copy_rectangle(0, 0, 320, 240, image, opaque)),
+        ("copy_rectangle 320x240 masked", 200,
+         lambda: frame.copy_rectangle(0, 0, 320, 240, image, soft)),
+        ("copy_text 288x72", 200,
+         lambda: frame.copy_text(32, 103, 288, 72, 0xffff, text)),
+        ("draw_rectangle 320x240 a=1", 200,
+         lambda: frame.draw_rectangle(0, 0, 320, 240, 0x1234, 1.0)),
+        ("draw_rectangle 320x85 a=.6", 200,
+         lambda: frame.draw_rectangle(0, 90, 320, 85, 0x1234, 0.6)),
+        ("copy_rectangle 25x25 masked", 5000,
+         lambda: frame.copy_rectangle(100, 100, 25, 25, sprite, sprite_mask)),
+    ]
+
+    default = libcdraw.get_simd()
+    for simd in ("scalar", "sse2", "avx2"):
+        try:
+            libcdraw.set_simd(simd)
+        except ValueError:
+            continue
+        print("{0}:".format(simd))
+        for name, number, call in cases:
+            elapsed = min(timeit.repeat(call, number=number, repeat=5)) / number
+            print("    {0:<32} {1:8.1f} us {2:8.0f} Mpx/s".format(
+                name, elapsed * 1e6, _pixels(name) / elapsed / 1e6))
+    libcdraw.set_simd(default)
+
+    print("buffer access:")
+    access = [
+        ("get_bytes copy", lambda: frame.get_bytes()),
+        ("memoryview", lambda: memoryview(frame)),
+    ]
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        pixels = numpy.asarray(frame)
+
+        def fade():
+            # Halve every channel: drop lowest bit of each, then shift
+            numpy.right_shift(pixels & 0xf7de, 1, out=pixels)
+            frame.add_damage()
+
+        def scroll():
+            pixels[:, :-1] = pixels[:, 1:]
+            frame.add_damage()
+
+        access += [
+            ("numpy.asarray", lambda: numpy.asarray(frame)),
+            ("numpy fade 320x240", fade),
+            ("numpy scroll 320x240", scroll),
+        ]
+    for name, call in access:
+        elapsed = min(timeit.repeat(call, number=200, repeat=5)) / 200
+        print("    {0:<32} {1:8.1f} us".format(name, elapsed * 1e6))
+
+
+def _pixels(name):
+    width, height = name.split()[1].split("x")
+    return int(width) * int(height)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 #include <stdint.h>
 #include <stdio.h>
+#include <string.h>
 #include <byteswap.h>
 
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <pythread.h>
 
 /* TODO: Remove magic screen size G19_HEIGHT*G19_WIDTH */
 
@@ -12,185 +14,2112 @@
 #define G19_RESOLUTION (G19_HEIGHT * G19_WIDTH)
 #define G19_SIZE (G19_RESOLUTION * sizeof(uint16_t))
 #define G19_PIXEL(_x, _y) ((_x) * G19_HEIGHT + (_y))
+#define G19_PREAMBLE_SIZE 512
+#define G19_PACKET_SIZE (G19_PREAMBLE_SIZE + G19_SIZE)
 
+#define FNV_OFFSET_BASIS 0xcbf29ce484222325ULL
+#define FNV_PRIME 0x100000001b3ULL
+
+/*
+ * Header of bulk transfer: bytes 3-4 are the number of 256 byte blocks which
+ * follow the preamble, bytes 7-14 the window x0, y0, x1, y1 (inclusive,
+ * little-endian) these blocks fill column by column.  Full frame is window
+ * 0,0..319,239 in 600 blocks.
+ */
+static const uint8_t g19_preamble_head[16] = {
+	0x10, 0x0F, 0x00, 0x58, 0x02, 0x00, 0x00, 0x00,
+	0x00, 0x00, 0x00, 0x3F, 0x01, 0xEF, 0x00, 0x0F
+};
+
+/* Preamble of a full frame, pack() starts every packet from it */
+static uint8_t g19_preamble[G19_PREAMBLE_SIZE];
+
+static void _init_preamble(void)
+{
+	memcpy(g19_preamble, g19_preamble_head, sizeof(g19_preamble_head));
+	for (int i = sizeof(g19_preamble_head); i < 256; i++)
+		g19_preamble[i] = i;
+	for (int i = 0; i < 256; i++)
+		g19_preamble[256 + i] = i;
+}
+
+/*
+ * Transposes width source columns of height rows (src_stride items apart)
+ * into width spans of height items (dst_stride items apart): blits use it to
+ * turn row-major sources into column-major ones.
+ */
+static void _transpose16_scalar(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+                                int width, int height)
+{
+	for (int j = 0; j < height; j++, src += src_stride)
+		for (int i = 0; i < width; i++)
+			dst[(size_t)i * dst_stride + j] = src[i];
+}
+
+static void _transpose8_scalar(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+                               int width, int height)
+{
+	for (int j = 0; j < height; j++, src += src_stride)
+		for (int i = 0; i < width; i++)
+			dst[(size_t)i * dst_stride + j] = src[i];
+}
+
+typedef struct {
+	int start_x, start_y, end_x, end_y;
+} g19_clip_t;
+
+/* Clips rectangle to the screen, returns 0 if nothing is left */
+static inline int _clip(g19_clip_t * clip, int x, int y, int sx, int sy)
+{
+	clip->start_x = x < 0 ? 0 : x;
+	clip->start_y = y < 0 ? 0 : y;
+	clip->end_x = x + sx > G19_WIDTH ? G19_WIDTH : x + sx;
+	clip->end_y = y + sy > G19_HEIGHT ? G19_HEIGHT : y + sy;
+
+	return clip->start_x < clip->end_x && clip->start_y < clip->end_y;
+}
+
+/* Grows damage to cover clip as well */
+static inline void _add_damage(g19_clip_t * damage, const g19_clip_t * clip)
+{
+	if (damage->start_x >= damage->end_x)
+	{
+		*damage = *clip;
+		return;
+	}
+	if (clip->start_x < damage->start_x)
+		damage->start_x = clip->start_x;
+	if (clip->start_y < damage->start_y)
+		damage->start_y = clip->start_y;
+	if (clip->end_x > damage->end_x)
+		damage->end_x = clip->end_x;
+	if (clip->end_y > damage->end_y)
+		damage->end_y = clip->end_y;
+}
+
+typedef struct {
+	PyObject_HEAD
+	uint16_t * map;
+	/* Bumped on every change of map, so checksum is computed once per change */
+	uint64_t generation;
+	uint64_t checksum;
+	uint64_t checksum_generation;
+	/* Bounding box of changes since last clear_damage(), empty if end_x is 0 */
+	g19_clip_t damage;
+	/*
+	 * Guards map and counters above.  Pixel work runs without the GIL, so
+	 * applets on different threads draw in parallel, while two threads never
+	 * draw on one frame at once.  The lock is only taken with the GIL
+	 * released, so it can not deadlock against the GIL.
+	 */
+	PyThread_type_lock lock;
+} g19_frame_t;
+
+#define G19_LOCK(_frame) PyThread_acquire_lock((_frame)->lock, WAIT_LOCK)
+#define G19_UNLOCK(_frame) PyThread_release_lock((_frame)->lock)
+
+static PyObject * g19_get_bytes(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+{
+	PyObject * result = PyBytes_FromStringAndSize(NULL, G19_SIZE);
+	if (!result)
+		return NULL;
+
+	char * data = PyBytes_AS_STRING(result);
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	memcpy(data, self->map, G19_SIZE);
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	return result;
+}
+
+static PyObject * g19_copy_from(g19_frame_t * self, PyObject * args)
+{
+	g19_frame_t * src = NULL;
+
+	if(!PyArg_ParseTuple(args, "O!", Py_TYPE(self), &src))
+		return NULL;
+
+	if (src != self)
+	{
+		/* Address order, so a.copy_from(b) may run along with b.copy_from(a) */
+		g19_frame_t * first = src < self ? src : self,
+		            * second = src < self ? self : src;
+
+		Py_BEGIN_ALLOW_THREADS
+		G19_LOCK(first);
+		G19_LOCK(second);
+		/* Only changed columns are written, their span becomes damage */
+		int changed = 0;
+		for (int px = 0; px < G19_WIDTH; px++)
+		{
+			uint16_t * dst = self->map + G19_PIXEL(px, 0);
+			const uint16_t * from = src->map + G19_PIXEL(px, 0);
+			if (!memcmp(dst, from, G19_HEIGHT * sizeof(uint16_t)))
+				continue;
+
+			g19_clip_t clip = {px, 0, px + 1, G19_HEIGHT};
+			while (dst[clip.start_y] == from[clip.start_y])
+				clip.start_y++;
+			while (dst[clip.end_y - 1] == from[clip.end_y - 1])
+				clip.end_y--;
+			memcpy(dst + clip.start_y, from + clip.start_y,
+			       (clip.end_y - clip.start_y) * sizeof(uint16_t));
+			_add_damage(&self->damage, &clip);
+			changed = 1;
+		}
+		if (changed)
+			self->generation++;
+		G19_UNLOCK(second);
+		G19_UNLOCK(first);
+		Py_END_ALLOW_THREADS
+	}
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static PyObject * g19_get_generation(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+{
+	uint64_t generation;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	generation = self->generation;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	return PyLong_FromUnsignedLongLong(generation);
+}
+
+static PyObject * g19_get_checksum(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+{
+	uint64_t checksum;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	if (self->checksum_generation != self->generation)
+	{
+		/* FNV-1a over 64-bit words: cheap enough to run on every frame */
+		const uint64_t * words = (const uint64_t *)self->map;
+		uint64_t hash = FNV_OFFSET_BASIS;
+		for (size_t i = 0; i < G19_SIZE / sizeof(uint64_t); i++)
+		{
+			hash ^= words[i];
+			hash *= FNV_PRIME;
+		}
+		self->checksum = hash;
+		self->checksum_generation = self->generation;
+	}
+	checksum = self->checksum;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	return PyLong_FromUnsignedLongLong(checksum);
+}
+
+static PyObject * g19_get_damage(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+{
+	g19_clip_t damage;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	damage = self->damage;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	if (damage.start_x >= damage.end_x)
+	{
+		Py_INCREF(Py_None);
+		return Py_None;
+	}
+
+	return Py_BuildValue("(iiii)", damage.start_x, damage.start_y,
+	                     damage.end_x - damage.start_x, damage.end_y - damage.start_y);
+}
+
+static PyObject * g19_clear_damage(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+{
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	memset(&self->damage, 0, sizeof(self->damage));
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static PyObject * g19_add_damage(g19_frame_t * self, PyObject * args)
+{
+	int x  = 0,
+	    y  = 0,
+	    sx = G19_WIDTH,
+	    sy = G19_HEIGHT;
+
+	if(!PyArg_ParseTuple(args, "|iiii", &x, &y, &sx, &sy))
+		return NULL;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	g19_clip_t clip;
+	if (_clip(&clip, x, y, sx, sy))
+		_add_damage(&self->damage, &clip);
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static inline void _put_uint16(uint8_t * dst, unsigned value)
+{
+	dst[0] = value & 0xff;
+	dst[1] = value >> 8;
+}
+
+/* Size of packet updating width x height pixels: preamble and whole blocks */
+static inline size_t _packet_size(int width, int height)
+{
+	size_t blocks = ((size_t)width * height * sizeof(uint16_t) + 255) / 256;
+	return G19_PREAMBLE_SIZE + blocks * 256;
+}
+
+static PyObject * g19_pack(g19_frame_t * self, PyObject * args)
+{
+	Py_buffer dst = {0};
+	int x  = 0,
+	    y  = 0,
+	    sx = 0,
+	    sy = 0;
+
+	if(!PyArg_ParseTuple(args, "w*iiii", &dst, &x, &y, &sx, &sy))
+		return NULL;
+
+	g19_clip_t clip;
+	if (!_clip(&clip, x, y, sx, sy))
+	{
+		PyErr_SetString(PyExc_ValueError, "window is empty");
+		PyBuffer_Release(&dst);
+		return NULL;
+	}
+
+	int width = clip.end_x - clip.start_x,
+	    height = clip.end_y - clip.start_y;
+	size_t size = _packet_size(width, height);
+	if ((size_t)dst.len < size)
+	{
+		PyErr_Format(PyExc_ValueError, "buffer of %zd bytes is too small for %zu bytes packet",
+		             dst.len, size);
+		PyBuffer_Release(&dst);
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	uint8_t * packet = dst.buf;
+	memcpy(packet, g19_preamble, G19_PREAMBLE_SIZE);
+	_put_uint16(packet + 3, (size - G19_PREAMBLE_SIZE) / 256);
+	_put_uint16(packet + 7, clip.start_x);
+	_put_uint16(packet + 9, clip.start_y);
+	_put_uint16(packet + 11, clip.end_x - 1);
+	_put_uint16(packet + 13, clip.end_y - 1);
+
+	uint16_t * pixels = (uint16_t *)(packet + G19_PREAMBLE_SIZE);
+	for (int px = clip.start_x; px < clip.end_x; px++, pixels += height)
+		memcpy(pixels, self->map + G19_PIXEL(px, clip.start_y), height * sizeof(uint16_t));
+	memset(pixels, 0, packet + size - (uint8_t *)pixels);
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&dst);
+
+	return PyLong_FromSize_t(size);
+}
+
+static inline uint16_t _rgb_to_uint16(uint8_t red, uint8_t green, uint8_t blue)
+{
+	uint8_t red_bits =   ((uint8_t)(red   * (0b00011111 / 255.)) & 0b00011111);
+	uint8_t green_bits = ((uint8_t)(green * (0b00111111 / 255.)) & 0b00111111);
+	uint8_t blue_bits =  ((uint8_t)(blue  * (0b00011111 / 255.)) & 0b00011111);
+
+	return red_bits << 11 | green_bits << 5 | blue_bits;
+}
+
+static PyObject * rgb_to_uint16(PyObject * self, PyObject *args)
+{
+	uint8_t red   = 0,
+	        green = 0,
+	        blue  = 0;
+
+	if(!PyArg_ParseTuple(args, "bbb", &red, &green, &blue))
+		return NULL;
+
+	return Py_BuildValue("I", _rgb_to_uint16(red, green, blue));
+}
+
+static PyObject * pack_rgb565(PyObject * self, PyObject * args)
+{
+	Py_buffer rgb = {0};
+
+	if(!PyArg_ParseTuple(args, "y*", &rgb))
+		return NULL;
+
+	if (rgb.len % 3)
+	{
+		PyErr_SetString(PyExc_ValueError, "RGB data length is not a multiple of 3");
+		PyBuffer_Release(&rgb);
+		return NULL;
+	}
+
+	PyObject * result = PyBytes_FromStringAndSize(NULL, rgb.len / 3 * sizeof(uint16_t));
+	if (result)
+	{
+		const uint8_t * src = rgb.buf;
+		uint16_t * dst = (uint16_t *)PyBytes_AS_STRING(result);
+		Py_BEGIN_ALLOW_THREADS
+		for (Py_ssize_t i = 0; i < rgb.len / 3; i++, src += 3)
+			dst[i] = (src[0] >> 3) << 11 | (src[1] >> 2) << 5 | src[2] >> 3;
+		Py_END_ALLOW_THREADS
+	}
+	PyBuffer_Release(&rgb);
+
+	return result;
+}
+
+/* Blending uses 8-bit fixed point alpha in [0, G19_ALPHA_MAX] */
+#define G19_ALPHA_MAX 256
+
+static inline unsigned _alpha_from_float(float alpha)
+{
+	if (!(alpha > 0.f))
+		return 0;
+	if (alpha >= 1.f)
+		return G19_ALPHA_MAX;
+	return (unsigned)(alpha * G19_ALPHA_MAX + .5f);
+}
+
+/* Maps mask byte [0, 255] onto [0, G19_ALPHA_MAX], so 255 stays fully opaque */
+static inline unsigned _alpha_from_mask(uint8_t mask)
+{
+	return mask + (mask >> 7);
+}
+
+static inline uint16_t _blend(uint16_t dst, uint16_t src, unsigned alpha)
+{
+	unsigned inv = G19_ALPHA_MAX - alpha;
+	unsigned red   = ((src >> 11)       * alpha + (dst >> 11)       * inv) >> 8;
+	unsigned green = ((src >> 5 & 0x3f) * alpha + (dst >> 5 & 0x3f) * inv) >> 8;
+	unsigned blue  = ((src & 0x1f)      * alpha + (dst & 0x1f)      * inv) >> 8;
+
+	return red << 11 | green << 5 | blue;
+}
+
+static inline uint16_t _apply_alpha(uint16_t color1, uint16_t color2, float alpha)
+{
+	return _blend(color1, color2, _alpha_from_float(alpha));
+}
+
+static PyObject * apply_alpha(PyObject * self, PyObject *args)
+{
+	uint16_t color1 = 0,
+	         color2 = 0;
+	float alpha = 0.;
+
+	if(!PyArg_ParseTuple(args, "HHf", &color1, &color2, &alpha))
+		return NULL;
+
+	return Py_BuildValue("I", _apply_alpha(color1, color2, alpha));
+}
+
+/*
+ * Span kernels work on n contiguous pixels of one column (or of several whole
+ * columns).  Every kernel has a scalar version and, on x86, SSE2 and AVX2
+ * versions picked at runtime.
+ */
+
+static inline void _fill_span(uint16_t * dst, int n, uint16_t color)
+{
+	for (int i = 0; i < n; i++)
+		dst[i] = color;
+}
+
+static void _blend_solid_scalar(uint16_t * dst, int n, uint16_t color, unsigned alpha)
+{
+	unsigned inv = G19_ALPHA_MAX - alpha;
+	unsigned red   = (color >> 11)       * alpha,
+	         green = (color >> 5 & 0x3f) * alpha,
+	         blue  = (color & 0x1f)      * alpha;
+
+	for (int i = 0; i < n; i++)
+	{
+		uint16_t pixel = dst[i];
+		dst[i] = ((red   + (pixel >> 11)       * inv) >> 8) << 11 |
+		         ((green + (pixel >> 5 & 0x3f) * inv) >> 8) << 5  |
+		         ((blue  + (pixel & 0x1f)      * inv) >> 8);
+	}
+}
+
+static void _blend_mask_scalar(uint16_t * dst, int n, const uint16_t * src, const uint8_t * mask)
+{
+	for (int i = 0; i < n; i++)
+		dst[i] = _blend(dst[i], src[i], _alpha_from_mask(mask[i]));
+}
+
+static void _blend_mask_solid_scalar(uint16_t * dst, int n, uint16_t color, const uint8_t * mask)
+{
+	for (int i = 0; i < n; i++)
+		dst[i] = _blend(dst[i], color, _alpha_from_mask(mask[i]));
+}
+
+/* Premultiplied src: channels already scaled by alpha, so the sum never carries */
+static inline uint16_t _blend_premul(uint16_t dst, uint16_t pre, unsigned alpha)
+{
+	unsigned inv = G19_ALPHA_MAX - alpha;
+
+	return pre + (((dst >> 11)       * inv) >> 8 << 11 |
+	              ((dst >> 5 & 0x3f) * inv) >> 8 << 5  |
+	              ((dst & 0x1f)      * inv) >> 8);
+}
+
+static void _blend_premul_scalar(uint16_t * dst, int n, const uint16_t * pre, const uint8_t * mask)
+{
+	for (int i = 0; i < n; i++)
+		dst[i] = _blend_premul(dst[i], pre[i], _alpha_from_mask(mask[i]));
+}
+
+typedef struct {
+	const char * name;
+	/* dst = color with constant alpha */
+	void (*blend_solid)(uint16_t * dst, int n, uint16_t color, unsigned alpha);
+	/* dst = src with alpha from mask bytes */
+	void (*blend_mask)(uint16_t * dst, int n, const uint16_t * src, const uint8_t * mask);
+	/* dst = color with alpha from mask bytes */
+	void (*blend_mask_solid)(uint16_t * dst, int n, uint16_t color, const uint8_t * mask);
+	/* dst = premultiplied src with alpha from mask bytes */
+	void (*blend_premul)(uint16_t * dst, int n, const uint16_t * pre, const uint8_t * mask);
+	/* Row-major pixels and mask bytes to column-major, see _transpose16_scalar() */
+	void (*transpose16)(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+	                    int width, int height);
+	void (*transpose8)(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+	                   int width, int height);
+} g19_kernels_t;
+
+static const g19_kernels_t g19_kernels_scalar = {
+	.name = "scalar",
+	.blend_solid = _blend_solid_scalar,
+	.blend_mask = _blend_mask_scalar,
+	.blend_mask_solid = _blend_mask_solid_scalar,
+	.blend_premul = _blend_premul_scalar,
+	.transpose16 = _transpose16_scalar,
+	.transpose8 = _transpose8_scalar
+};
+
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#define G19_X86_SIMD
+#include <immintrin.h>
+
+/*
+ * All lanes stay below 2^16: 63 * 256 * 2 at most.
+ *
+ * The 8 pixel loops are always inlined, so AVX2 kernels finish spans with
+ * them in VEX encoding: calling into legacy SSE code with dirty upper
+ * halves of ymm registers costs more than the whole short span.
+ */
+#define G19_SIMD_INLINE static inline __attribute__((always_inline))
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _blend_solid_loop8(uint16_t * dst, int n, uint16_t color, unsigned alpha, int i)
+{
+	const __m128i inv   = _mm_set1_epi16(G19_ALPHA_MAX - alpha),
+	              red   = _mm_set1_epi16((color >> 11)       * alpha),
+	              green = _mm_set1_epi16((color >> 5 & 0x3f) * alpha),
+	              blue  = _mm_set1_epi16((color & 0x1f)      * alpha),
+	              bits6 = _mm_set1_epi16(0x3f),
+	              bits5 = _mm_set1_epi16(0x1f);
+
+	for (; i + 8 <= n; i += 8)
+	{
+		__m128i pixel = _mm_loadu_si128((const __m128i *)(dst + i));
+		__m128i r = _mm_mullo_epi16(_mm_srli_epi16(pixel, 11), inv);
+		__m128i g = _mm_mullo_epi16(_mm_and_si128(_mm_srli_epi16(pixel, 5), bits6), inv);
+		__m128i b = _mm_mullo_epi16(_mm_and_si128(pixel, bits5), inv);
+		r = _mm_slli_epi16(_mm_srli_epi16(_mm_add_epi16(r, red), 8), 11);
+		g = _mm_slli_epi16(_mm_srli_epi16(_mm_add_epi16(g, green), 8), 5);
+		b = _mm_srli_epi16(_mm_add_epi16(b, blue), 8);
+		_mm_storeu_si128((__m128i *)(dst + i), _mm_or_si128(_mm_or_si128(r, g), b));
+	}
+	return i;
+}
+
+__attribute__((target("sse2")))
+static void _blend_solid_sse2(uint16_t * dst, int n, uint16_t color, unsigned alpha)
+{
+	int i = _blend_solid_loop8(dst, n, color, alpha, 0);
+	_blend_solid_scalar(dst + i, n - i, color, alpha);
+}
+
+__attribute__((target("avx2")))
+static void _blend_solid_avx2(uint16_t * dst, int n, uint16_t color, unsigned alpha)
+{
+	const __m256i inv   = _mm256_set1_epi16(G19_ALPHA_MAX - alpha),
+	              red   = _mm256_set1_epi16((color >> 11)       * alpha),
+	              green = _mm256_set1_epi16((color >> 5 & 0x3f) * alpha),
+	              blue  = _mm256_set1_epi16((color & 0x1f)      * alpha),
+	              bits6 = _mm256_set1_epi16(0x3f),
+	              bits5 = _mm256_set1_epi16(0x1f);
+	int i = 0;
+
+	for (; i + 16 <= n; i += 16)
+	{
+		__m256i pixel = _mm256_loadu_si256((const __m256i *)(dst + i));
+		__m256i r = _mm256_mullo_epi16(_mm256_srli_epi16(pixel, 11), inv);
+		__m256i g = _mm256_mullo_epi16(_mm256_and_si256(_mm256_srli_epi16(pixel, 5), bits6), inv);
+		__m256i b = _mm256_mullo_epi16(_mm256_and_si256(pixel, bits5), inv);
+		r = _mm256_slli_epi16(_mm256_srli_epi16(_mm256_add_epi16(r, red), 8), 11);
+		g = _mm256_slli_epi16(_mm256_srli_epi16(_mm256_add_epi16(g, green), 8), 5);
+		b = _mm256_srli_epi16(_mm256_add_epi16(b, blue), 8);
+		_mm256_storeu_si256((__m256i *)(dst + i), _mm256_or_si256(_mm256_or_si256(r, g), b));
+	}
+	i = _blend_solid_loop8(dst, n, color, alpha, i);
+	_blend_solid_scalar(dst + i, n - i, color, alpha);
+}
+
+/* Blends 8 pixels with per pixel alpha, src given as channels */
+__attribute__((target("sse2")))
+G19_SIMD_INLINE __m128i _blend8_sse2(__m128i pixel, __m128i red, __m128i green, __m128i blue,
+                                   __m128i alpha)
+{
+	const __m128i bits6 = _mm_set1_epi16(0x3f),
+	              bits5 = _mm_set1_epi16(0x1f);
+	__m128i inv = _mm_sub_epi16(_mm_set1_epi16(G19_ALPHA_MAX), alpha);
+	__m128i r = _mm_add_epi16(_mm_mullo_epi16(red, alpha),
+	                          _mm_mullo_epi16(_mm_srli_epi16(pixel, 11), inv));
+	__m128i g = _mm_add_epi16(_mm_mullo_epi16(green, alpha),
+	                          _mm_mullo_epi16(_mm_and_si128(_mm_srli_epi16(pixel, 5), bits6), inv));
+	__m128i b = _mm_add_epi16(_mm_mullo_epi16(blue, alpha),
+	                          _mm_mullo_epi16(_mm_and_si128(pixel, bits5), inv));
+	r = _mm_slli_epi16(_mm_srli_epi16(r, 8), 11);
+	g = _mm_slli_epi16(_mm_srli_epi16(g, 8), 5);
+	b = _mm_srli_epi16(b, 8);
+
+	return _mm_or_si128(_mm_or_si128(r, g), b);
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE __m128i _mask8_sse2(const uint8_t * mask)
+{
+	__m128i alpha = _mm_unpacklo_epi8(_mm_loadl_epi64((const __m128i *)mask), _mm_setzero_si128());
+	return _mm_add_epi16(alpha, _mm_srli_epi16(alpha, 7));
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _blend_mask_loop8(uint16_t * dst, int n, const uint16_t * src, const uint8_t * mask, int i)
+{
+	const __m128i bits6 = _mm_set1_epi16(0x3f),
+	              bits5 = _mm_set1_epi16(0x1f);
+
+	for (; i + 8 <= n; i += 8)
+	{
+		__m128i color = _mm_loadu_si128((const __m128i *)(src + i));
+		__m128i pixel = _mm_loadu_si128((const __m128i *)(dst + i));
+		pixel = _blend8_sse2(pixel, _mm_srli_epi16(color, 11),
+		                     _mm_and_si128(_mm_srli_epi16(color, 5), bits6),
+		                     _mm_and_si128(color, bits5), _mask8_sse2(mask + i));
+		_mm_storeu_si128((__m128i *)(dst + i), pixel);
+	}
+	return i;
+}
+
+__attribute__((target("sse2")))
+static void _blend_mask_sse2(uint16_t * dst, int n, const uint16_t * src, const uint8_t * mask)
+{
+	int i = _blend_mask_loop8(dst, n, src, mask, 0);
+	_blend_mask_scalar(dst + i, n - i, src + i, mask + i);
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _blend_mask_solid_loop8(uint16_t * dst, int n, uint16_t color, const uint8_t * mask, int i)
+{
+	const __m128i red   = _mm_set1_epi16(color >> 11),
+	              green = _mm_set1_epi16(color >> 5 & 0x3f),
+	              blue  = _mm_set1_epi16(color & 0x1f);
+
+	for (; i + 8 <= n; i += 8)
+	{
+		__m128i pixel = _mm_loadu_si128((const __m128i *)(dst + i));
+		pixel = _blend8_sse2(pixel, red, green, blue, _mask8_sse2(mask + i));
+		_mm_storeu_si128((__m128i *)(dst + i), pixel);
+	}
+	return i;
+}
+
+__attribute__((target("sse2")))
+static void _blend_mask_solid_sse2(uint16_t * dst, int n, uint16_t color, const uint8_t * mask)
+{
+	int i = _blend_mask_solid_loop8(dst, n, color, mask, 0);
+	_blend_mask_solid_scalar(dst + i, n - i, color, mask + i);
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _blend_premul_loop8(uint16_t * dst, int n, const uint16_t * pre, const uint8_t * mask, int i)
+{
+	const __m128i bits6 = _mm_set1_epi16(0x3f),
+	              bits5 = _mm_set1_epi16(0x1f),
+	              max   = _mm_set1_epi16(G19_ALPHA_MAX);
+
+	for (; i + 8 <= n; i += 8)
+	{
+		__m128i pixel = _mm_loadu_si128((const __m128i *)(dst + i));
+		__m128i inv = _mm_sub_epi16(max, _mask8_sse2(mask + i));
+		__m128i r = _mm_mullo_epi16(_mm_srli_epi16(pixel, 11), inv);
+		__m128i g = _mm_mullo_epi16(_mm_and_si128(_mm_srli_epi16(pixel, 5), bits6), inv);
+		__m128i b = _mm_mullo_epi16(_mm_and_si128(pixel, bits5), inv);
+		pixel = _mm_or_si128(_mm_or_si128(_mm_slli_epi16(_mm_srli_epi16(r, 8), 11),
+		                                  _mm_slli_epi16(_mm_srli_epi16(g, 8), 5)),
+		                     _mm_srli_epi16(b, 8));
+		pixel = _mm_add_epi16(pixel, _mm_loadu_si128((const __m128i *)(pre + i)));
+		_mm_storeu_si128((__m128i *)(dst + i), pixel);
+	}
+	return i;
+}
+
+__attribute__((target("sse2")))
+static void _blend_premul_sse2(uint16_t * dst, int n, const uint16_t * pre, const uint8_t * mask)
+{
+	int i = _blend_premul_loop8(dst, n, pre, mask, 0);
+	_blend_premul_scalar(dst + i, n - i, pre + i, mask + i);
+}
+
+/* Blends 16 pixels with per pixel alpha, src given as channels */
+__attribute__((target("avx2")))
+G19_SIMD_INLINE __m256i _blend16_avx2(__m256i pixel, __m256i red, __m256i green, __m256i blue,
+                                    __m256i alpha)
+{
+	const __m256i bits6 = _mm256_set1_epi16(0x3f),
+	              bits5 = _mm256_set1_epi16(0x1f);
+	__m256i inv = _mm256_sub_epi16(_mm256_set1_epi16(G19_ALPHA_MAX), alpha);
+	__m256i r = _mm256_add_epi16(_mm256_mullo_epi16(red, alpha),
+	                             _mm256_mullo_epi16(_mm256_srli_epi16(pixel, 11), inv));
+	__m256i g = _mm256_add_epi16(_mm256_mullo_epi16(green, alpha),
+	                             _mm256_mullo_epi16(_mm256_and_si256(_mm256_srli_epi16(pixel, 5), bits6), inv));
+	__m256i b = _mm256_add_epi16(_mm256_mullo_epi16(blue, alpha),
+	                             _mm256_mullo_epi16(_mm256_and_si256(pixel, bits5), inv));
+	r = _mm256_slli_epi16(_mm256_srli_epi16(r, 8), 11);
+	g = _mm256_slli_epi16(_mm256_srli_epi16(g, 8), 5);
+	b = _mm256_srli_epi16(b, 8);
+
+	return _mm256_or_si256(_mm256_or_si256(r, g), b);
+}
+
+__attribute__((target("avx2")))
+G19_SIMD_INLINE __m256i _mask16_avx2(const uint8_t * mask)
+{
+	__m256i alpha = _mm256_cvtepu8_epi16(_mm_loadu_si128((const __m128i *)mask));
+	return _mm256_add_epi16(alpha, _mm256_srli_epi16(alpha, 7));
+}
+
+__attribute__((target("avx2")))
+static void _blend_mask_avx2(uint16_t * dst, int n, const uint16_t * src, const uint8_t * mask)
+{
+	const __m256i bits6 = _mm256_set1_epi16(0x3f),
+	              bits5 = _mm256_set1_epi16(0x1f);
+	int i = 0;
+
+	for (; i + 16 <= n; i += 16)
+	{
+		__m256i color = _mm256_loadu_si256((const __m256i *)(src + i));
+		__m256i pixel = _mm256_loadu_si256((const __m256i *)(dst + i));
+		pixel = _blend16_avx2(pixel, _mm256_srli_epi16(color, 11),
+		                      _mm256_and_si256(_mm256_srli_epi16(color, 5), bits6),
+		                      _mm256_and_si256(color, bits5), _mask16_avx2(mask + i));
+		_mm256_storeu_si256((__m256i *)(dst + i), pixel);
+	}
+	i = _blend_mask_loop8(dst, n, src, mask, i);
+	_blend_mask_scalar(dst + i, n - i, src + i, mask + i);
+}
+
+__attribute__((target("avx2")))
+static void _blend_mask_solid_avx2(uint16_t * dst, int n, uint16_t color, const uint8_t * mask)
+{
+	const __m256i red   = _mm256_set1_epi16(color >> 11),
+	              green = _mm256_set1_epi16(color >> 5 & 0x3f),
+	              blue  = _mm256_set1_epi16(color & 0x1f);
+	int i = 0;
+
+	for (; i + 16 <= n; i += 16)
+	{
+		__m256i pixel = _mm256_loadu_si256((const __m256i *)(dst + i));
+		pixel = _blend16_avx2(pixel, red, green, blue, _mask16_avx2(mask + i));
+		_mm256_storeu_si256((__m256i *)(dst + i), pixel);
+	}
+	i = _blend_mask_solid_loop8(dst, n, color, mask, i);
+	_blend_mask_solid_scalar(dst + i, n - i, color, mask + i);
+}
+
+__attribute__((target("avx2")))
+static void _blend_premul_avx2(uint16_t * dst, int n, const uint16_t * pre, const uint8_t * mask)
+{
+	const __m256i bits6 = _mm256_set1_epi16(0x3f),
+	              bits5 = _mm256_set1_epi16(0x1f),
+	              max   = _mm256_set1_epi16(G19_ALPHA_MAX);
+	int i = 0;
+
+	for (; i + 16 <= n; i += 16)
+	{
+		__m256i pixel = _mm256_loadu_si256((const __m256i *)(dst + i));
+		__m256i inv = _mm256_sub_epi16(max, _mask16_avx2(mask + i));
+		__m256i r = _mm256_mullo_epi16(_mm256_srli_epi16(pixel, 11), inv);
+		__m256i g = _mm256_mullo_epi16(_mm256_and_si256(_mm256_srli_epi16(pixel, 5), bits6), inv);
+		__m256i b = _mm256_mullo_epi16(_mm256_and_si256(pixel, bits5), inv);
+		pixel = _mm256_or_si256(_mm256_or_si256(_mm256_slli_epi16(_mm256_srli_epi16(r, 8), 11),
+		                                        _mm256_slli_epi16(_mm256_srli_epi16(g, 8), 5)),
+		                        _mm256_srli_epi16(b, 8));
+		pixel = _mm256_add_epi16(pixel, _mm256_loadu_si256((const __m256i *)(pre + i)));
+		_mm256_storeu_si256((__m256i *)(dst + i), pixel);
+	}
+	i = _blend_premul_loop8(dst, n, pre, mask, i);
+	_blend_premul_scalar(dst + i, n - i, pre + i, mask + i);
+}
+
+/*
+ * Transposes are done in 8x8 blocks with three rounds of unpacks.  AVX2 uses
+ * the same blocks: two side by side in 256-bit lanes write 16 columns at
+ * once and measured slower.  Edges of the area not covered by whole blocks
+ * are left to the scalar loops.
+ */
+__attribute__((target("sse2")))
+G19_SIMD_INLINE void _transpose16_8x8(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride)
+{
+	__m128i r[8], t[8], u[8];
+
+	for (int k = 0; k < 8; k++)
+		r[k] = _mm_loadu_si128((const __m128i *)(src + (size_t)k * src_stride));
+	for (int k = 0; k < 8; k += 2)
+	{
+		t[k]     = _mm_unpacklo_epi16(r[k], r[k + 1]);
+		t[k + 1] = _mm_unpackhi_epi16(r[k], r[k + 1]);
+	}
+	for (int k = 0; k < 8; k += 4)
+	{
+		u[k]     = _mm_unpacklo_epi32(t[k],     t[k + 2]);
+		u[k + 1] = _mm_unpackhi_epi32(t[k],     t[k + 2]);
+		u[k + 2] = _mm_unpacklo_epi32(t[k + 1], t[k + 3]);
+		u[k + 3] = _mm_unpackhi_epi32(t[k + 1], t[k + 3]);
+	}
+	for (int k = 0; k < 4; k++)
+	{
+		_mm_storeu_si128((__m128i *)(dst + (size_t)(2 * k) * dst_stride),
+		                 _mm_unpacklo_epi64(u[k], u[k + 4]));
+		_mm_storeu_si128((__m128i *)(dst + (size_t)(2 * k + 1) * dst_stride),
+		                 _mm_unpackhi_epi64(u[k], u[k + 4]));
+	}
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE void _transpose8_8x8(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride)
+{
+	__m128i t[4], u[4];
+
+	for (int k = 0; k < 4; k++)
+		t[k] = _mm_unpacklo_epi8(_mm_loadl_epi64((const __m128i *)(src + (size_t)(2 * k) * src_stride)),
+		                         _mm_loadl_epi64((const __m128i *)(src + (size_t)(2 * k + 1) * src_stride)));
+	u[0] = _mm_unpacklo_epi16(t[0], t[1]);
+	u[1] = _mm_unpackhi_epi16(t[0], t[1]);
+	u[2] = _mm_unpacklo_epi16(t[2], t[3]);
+	u[3] = _mm_unpackhi_epi16(t[2], t[3]);
+	for (int k = 0; k < 2; k++)
+	{
+		__m128i low  = _mm_unpacklo_epi32(u[k], u[k + 2]),
+		        high = _mm_unpackhi_epi32(u[k], u[k + 2]);
+		_mm_storel_epi64((__m128i *)(dst + (size_t)(4 * k) * dst_stride), low);
+		_mm_storel_epi64((__m128i *)(dst + (size_t)(4 * k + 1) * dst_stride), _mm_srli_si128(low, 8));
+		_mm_storel_epi64((__m128i *)(dst + (size_t)(4 * k + 2) * dst_stride), high);
+		_mm_storel_epi64((__m128i *)(dst + (size_t)(4 * k + 3) * dst_stride), _mm_srli_si128(high, 8));
+	}
+}
+
+/* Transposes 8x8 blocks from column i on, returns first column left */
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _transpose16_loop8(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+                                       int width, int height, int i)
+{
+	for (; i + 8 <= width; i += 8)
+		for (int j = 0; j + 8 <= height; j += 8)
+			_transpose16_8x8(dst + (size_t)i * dst_stride + j, dst_stride,
+			                 src + (size_t)j * src_stride + i, src_stride);
+	return i;
+}
+
+__attribute__((target("sse2")))
+G19_SIMD_INLINE int _transpose8_loop8(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+                                      int width, int height, int i)
+{
+	for (; i + 8 <= width; i += 8)
+		for (int j = 0; j + 8 <= height; j += 8)
+			_transpose8_8x8(dst + (size_t)i * dst_stride + j, dst_stride,
+			                src + (size_t)j * src_stride + i, src_stride);
+	return i;
+}
+
+/* Scalar transpose of the right and bottom edges left by the block loops */
+static void _transpose16_edges(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+                               int width, int height, int blocks_width)
+{
+	int blocks_height = height & ~7;
+
+	_transpose16_scalar(dst + (size_t)blocks_width * dst_stride, dst_stride, src + blocks_width,
+	                    src_stride, width - blocks_width, height);
+	_transpose16_scalar(dst + blocks_height, dst_stride, src + (size_t)blocks_height * src_stride,
+	                    src_stride, blocks_width, height - blocks_height);
+}
+
+static void _transpose8_edges(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+                              int width, int height, int blocks_width)
+{
+	int blocks_height = height & ~7;
+
+	_transpose8_scalar(dst + (size_t)blocks_width * dst_stride, dst_stride, src + blocks_width,
+	                   src_stride, width - blocks_width, height);
+	_transpose8_scalar(dst + blocks_height, dst_stride, src + (size_t)blocks_height * src_stride,
+	                   src_stride, blocks_width, height - blocks_height);
+}
+
+__attribute__((target("sse2")))
+static void _transpose16_sse2(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+                              int width, int height)
+{
+	int i = _transpose16_loop8(dst, dst_stride, src, src_stride, width, height, 0);
+	_transpose16_edges(dst, dst_stride, src, src_stride, width, height, i);
+}
+
+__attribute__((target("sse2")))
+static void _transpose8_sse2(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+                             int width, int height)
+{
+	int i = _transpose8_loop8(dst, dst_stride, src, src_stride, width, height, 0);
+	_transpose8_edges(dst, dst_stride, src, src_stride, width, height, i);
+}
+
+__attribute__((target("avx2")))
+static void _transpose16_avx2(uint16_t * dst, int dst_stride, const uint16_t * src, int src_stride,
+                              int width, int height)
+{
+	int i = _transpose16_loop8(dst, dst_stride, src, src_stride, width, height, 0);
+	_transpose16_edges(dst, dst_stride, src, src_stride, width, height, i);
+}
+
+__attribute__((target("avx2")))
+static void _transpose8_avx2(uint8_t * dst, int dst_stride, const uint8_t * src, int src_stride,
+                             int width, int height)
+{
+	int i = _transpose8_loop8(dst, dst_stride, src, src_stride, width, height, 0);
+	_transpose8_edges(dst, dst_stride, src, src_stride, width, height, i);
+}
+
+static const g19_kernels_t g19_kernels_sse2 = {
+	.name = "sse2",
+	.blend_solid = _blend_solid_sse2,
+	.blend_mask = _blend_mask_sse2,
+	.blend_mask_solid = _blend_mask_solid_sse2,
+	.blend_premul = _blend_premul_sse2,
+	.transpose16 = _transpose16_sse2,
+	.transpose8 = _transpose8_sse2
+};
+
+static const g19_kernels_t g19_kernels_avx2 = {
+	.name = "avx2",
+	.blend_solid = _blend_solid_avx2,
+	.blend_mask = _blend_mask_avx2,
+	.blend_mask_solid = _blend_mask_solid_avx2,
+	.blend_premul = _blend_premul_avx2,
+	.transpose16 = _transpose16_avx2,
+	.transpose8 = _transpose8_avx2
+};
+#endif
+
+static const g19_kernels_t * kernels = &g19_kernels_scalar;
+
+/* Picks kernels by name, "auto" for the best one CPU supports */
+static int _select_kernels(const char * name)
+{
+	int automatic = !strcmp(name, "auto");
+
+#ifdef G19_X86_SIMD
+	__builtin_cpu_init();
+	if ((automatic || !strcmp(name, "avx2")) && __builtin_cpu_supports("avx2"))
+	{
+		kernels = &g19_kernels_avx2;
+		return 0;
+	}
+	if ((automatic || !strcmp(name, "sse2")) && __builtin_cpu_supports("sse2"))
+	{
+		kernels = &g19_kernels_sse2;
+		return 0;
+	}
+#endif
+	if (automatic || !strcmp(name, "scalar"))
+	{
+		kernels = &g19_kernels_scalar;
+		return 0;
+	}
+
+	return -1;
+}
+
+static PyObject * get_simd(PyObject * self, PyObject * Py_UNUSED(ignored))
+{
+	return PyUnicode_FromString(kernels->name);
+}
+
+static PyObject * set_simd(PyObject * self, PyObject * args)
+{
+	const char * name = NULL;
+
+	if(!PyArg_ParseTuple(args, "s", &name))
+		return NULL;
+
+	if (_select_kernels(name) < 0)
+	{
+		PyErr_Format(PyExc_ValueError, "SIMD kernels '%s' are not supported", name);
+		return NULL;
+	}
+
+	return PyUnicode_FromString(kernels->name);
+}
+
+static void _draw_rectangle(const g19_kernels_t * blend, g19_frame_t * self,
+                            const g19_clip_t * clip, uint16_t color, unsigned fixed_alpha)
+{
+	/* Whole columns are contiguous in map, so they are one span */
+	int full_columns = clip->start_y == 0 && clip->end_y == G19_HEIGHT;
+	int columns = full_columns ? 1 : clip->end_x - clip->start_x;
+	int span = full_columns ? (clip->end_x - clip->start_x) * G19_HEIGHT
+	                        : clip->end_y - clip->start_y;
+
+	for (int px = clip->start_x; px < clip->start_x + columns; px++)
+	{
+		uint16_t * dst = self->map + G19_PIXEL(px, clip->start_y);
+		if (fixed_alpha == G19_ALPHA_MAX)
+			_fill_span(dst, span, color);
+		else
+			blend->blend_solid(dst, span, color, fixed_alpha);
+	}
+	_add_damage(&self->damage, clip);
+}
+
+static PyObject * draw_rectangle(g19_frame_t * self, PyObject * args)
+{
+	int x  = 0,
+	    y  = 0,
+	    sx = 0,
+	    sy = 0;
+
+	uint16_t color = 0;
+	float alpha = 0.;
+
+	if(!PyArg_ParseTuple(args, "iiiiHf", &x, &y, &sx, &sy, &color, &alpha))
+		return NULL;
+
+	unsigned fixed_alpha = _alpha_from_float(alpha);
+	const g19_kernels_t * blend = kernels;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	g19_clip_t clip;
+	if (fixed_alpha && _clip(&clip, x, y, sx, sy))
+		_draw_rectangle(blend, self, &clip, color, fixed_alpha);
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+/*
+ * Sources are row-major while map is column-major.  Blits go tile by tile:
+ * G19_TILE source rows of up to G19_TILE columns are transposed into a small
+ * column-major buffer which stays in L1, then every column of the tile is
+ * blended into map as one contiguous span.  Fully opaque tiles are copied
+ * without staging and fully transparent ones are skipped.
+ */
+#define G19_TILE 32
+
+static inline int _min(int a, int b)
+{
+	return a < b ? a : b;
+}
+
+/*
+ * Loops below walk source rows through pointers rather than row + i indices:
+ * Python builds extensions with -fwrapv, which keeps gcc from vectorizing
+ * the latter.
+ */
+
+/* Returns 0 if mask tile is fully transparent, 0xff if it is fully opaque */
+static inline int _tile_opacity(const uint8_t * mask, int sx, int width, int height)
+{
+	uint8_t opaque = 0xff,
+	        visible = 0;
+
+	for (int j = 0; j < height; j++, mask += sx)
+		for (int i = 0; i < width; i++)
+		{
+			opaque &= mask[i];
+			visible |= mask[i];
+		}
+
+	return opaque == 0xff ? 0xff : visible ? 1 : 0;
+}
+
+static void _blit_masked(const g19_kernels_t * blend, uint16_t * map,
+                         int x, int y, int sx, const g19_clip_t * clip,
+                         const uint16_t * img, const uint8_t * mask)
+{
+	uint16_t tile_img[G19_TILE][G19_TILE];
+	uint8_t tile_mask[G19_TILE][G19_TILE];
+
+	for (int tile_y = clip->start_y; tile_y < clip->end_y; tile_y += G19_TILE)
+	{
+		int height = _min(G19_TILE, clip->end_y - tile_y);
+		for (int tile_x = clip->start_x; tile_x < clip->end_x; tile_x += G19_TILE)
+		{
+			int width = _min(G19_TILE, clip->end_x - tile_x);
+			size_t origin = (size_t)(tile_y - y) * sx + (tile_x - x);
+			const uint16_t * src = img + origin;
+			const uint8_t * opacity = mask ? mask + origin : NULL;
+			uint16_t * dst = map + G19_PIXEL(tile_x, tile_y);
+
+			switch (mask ? _tile_opacity(opacity, sx, width, height) : 0xff)
+			{
+			case 0:
+				break;
+			case 0xff:
+				blend->transpose16(dst, G19_HEIGHT, src, sx, width, height);
+				break;
+			default:
+				blend->transpose16(tile_img[0], G19_TILE, src, sx, width, height);
+				blend->transpose8(tile_mask[0], G19_TILE, opacity, sx, width, height);
+				for (int i = 0; i < width; i++)
+					blend->blend_mask(dst + G19_PIXEL(i, 0), height,
+					                    tile_img[i], tile_mask[i]);
+			}
+		}
+	}
+}
+
+static void _blit_text(const g19_kernels_t * blend, uint16_t * map,
+                       int x, int y, int sx, const g19_clip_t * clip,
+                       uint16_t color, const uint8_t * mask)
+{
+	uint8_t tile_mask[G19_TILE][G19_TILE];
+
+	for (int tile_y = clip->start_y; tile_y < clip->end_y; tile_y += G19_TILE)
+	{
+		int height = _min(G19_TILE, clip->end_y - tile_y);
+		for (int tile_x = clip->start_x; tile_x < clip->end_x; tile_x += G19_TILE)
+		{
+			int width = _min(G19_TILE, clip->end_x - tile_x);
+			const uint8_t * opacity = mask + (size_t)(tile_y - y) * sx + (tile_x - x);
+			uint16_t * dst = map + G19_PIXEL(tile_x, tile_y);
+
+			switch (_tile_opacity(opacity, sx, width, height))
+			{
+			case 0:
+				break;
+			case 0xff:
+				for (int i = 0; i < width; i++)
+					_fill_span(dst + G19_PIXEL(i, 0), height, color);
+				break;
+			default:
+				blend->transpose8(tile_mask[0], G19_TILE, opacity, sx, width, height);
+				for (int i = 0; i < width; i++)
+					blend->blend_mask_solid(dst + G19_PIXEL(i, 0), height,
+					                          color, tile_mask[i]);
+			}
+		}
+	}
+}
+
+/* Checks that buffer holds sx * sy items of itemsize bytes */
+static int _check_size(const Py_buffer * buffer, int sx, int sy, size_t itemsize, const char * name)
+{
+	size_t expected = sx > 0 && sy > 0 ? (size_t)sx * sy * itemsize : 0;
+
+	if ((size_t)buffer->len < expected)
+	{
+		PyErr_Format(PyExc_ValueError, "%s holds %zd bytes, %zu expected",
+		             name, buffer->len, expected);
+		return -1;
+	}
+
+	return 0;
+}
+
+static PyObject * copy_rectangle(g19_frame_t * self, PyObject * args)
+{
+	Py_buffer src   = {0},
+	          alpha = {0};
+	int x  = 0,
+	    y  = 0,
+	    sx = 0,
+	    sy = 0;
+
+	/* Buffers stay pinned until released, so the GIL may go meanwhile; mask None is opaque */
+	if(!PyArg_ParseTuple(args, "iiiiy*z*", &x, &y, &sx, &sy, &src, &alpha))
+		return NULL;
+
+	if (_check_size(&src, sx, sy, sizeof(uint16_t), "picture") < 0 ||
+	    (alpha.buf && _check_size(&alpha, sx, sy, sizeof(uint8_t), "mask") < 0))
+	{
+		PyBuffer_Release(&src);
+		PyBuffer_Release(&alpha);
+		return NULL;
+	}
+
+	const g19_kernels_t * blend = kernels;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	g19_clip_t clip;
+	if (_clip(&clip, x, y, sx, sy))
+	{
+		_blit_masked(blend, self->map, x, y, sx, &clip,
+		             (const uint16_t *)src.buf, (const uint8_t *)alpha.buf);
+		_add_damage(&self->damage, &clip);
+	}
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&src);
+	PyBuffer_Release(&alpha);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static PyObject * copy_text(g19_frame_t * self, PyObject * args)
+{
+	Py_buffer alpha = {0};
+
+	int x  = 0,
+	    y  = 0,
+	    sx = 0,
+	    sy = 0;
+
+	uint16_t color;
+
+	if(!PyArg_ParseTuple(args, "iiiiHy*", &x, &y, &sx, &sy, &color, &alpha))
+		return NULL;
+
+	if (_check_size(&alpha, sx, sy, sizeof(uint8_t), "mask") < 0)
+	{
+		PyBuffer_Release(&alpha);
+		return NULL;
+	}
+
+	const g19_kernels_t * blend = kernels;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	g19_clip_t clip;
+	if (_clip(&clip, x, y, sx, sy))
+	{
+		_blit_text(blend, self->map, x, y, sx, &clip, color, (const uint8_t *)alpha.buf);
+		_add_damage(&self->damage, &clip);
+	}
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&alpha);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+/*
+ * Glyph atlas: coverage of every glyph of one face and size, rasterized once
+ * and stored column-major, so a glyph column is one span of map.
+ */
+typedef struct {
+	/* Offset of coverage from pen position */
+	int left, top;
+	/* Pen advance in 1/64 pixel */
+	int advance;
+	int width, height;
+	uint8_t coverage[];
+} g19_glyph_t;
+
+typedef struct {
+	PyObject_HEAD
+	/* Code point -> slot in glyphs */
+	PyObject * index;
+	g19_glyph_t ** glyphs;
+	Py_ssize_t count;
+	Py_ssize_t capacity;
+} g19_atlas_t;
+
+static PyTypeObject g19_atlas;
+
+/* Returns glyph of code or NULL if it is not in atlas yet, needs the GIL */
+static g19_glyph_t * _atlas_find(g19_atlas_t * atlas, Py_UCS4 code)
+{
+	PyObject * key = PyLong_FromUnsignedLong(code);
+	if (!key)
+		return NULL;
+
+	PyObject * slot = PyDict_GetItemWithError(atlas->index, key);
+	Py_DECREF(key);
+	if (!slot)
+		return NULL;
+
+	return atlas->glyphs[PyLong_AsSsize_t(slot)];
+}
+
+static PyObject * g19_atlas_add(g19_atlas_t * self, PyObject * args)
+{
+	unsigned long code = 0;
+	int left    = 0,
+	    top     = 0,
+	    advance = 0,
+	    width   = 0,
+	    height  = 0;
+	Py_buffer coverage = {0};
+
+	if(!PyArg_ParseTuple(args, "kiiiiiy*", &code, &left, &top, &advance, &width, &height, &coverage))
+		return NULL;
+
+	if (width < 0 || height < 0 || coverage.len < (Py_ssize_t)width * height)
+	{
+		PyErr_Format(PyExc_ValueError, "coverage holds %zd bytes, %dx%d expected",
+		             coverage.len, width, height);
+		PyBuffer_Release(&coverage);
+		return NULL;
+	}
+
+	PyObject * key = PyLong_FromUnsignedLong(code);
+	if (!key || PyDict_Contains(self->index, key))
+	{
+		Py_XDECREF(key);
+		PyBuffer_Release(&coverage);
+		if (PyErr_Occurred())
+			return NULL;
+		Py_INCREF(Py_None);
+		return Py_None;
+	}
+
+	if (self->count == self->capacity)
+	{
+		Py_ssize_t capacity = self->capacity ? self->capacity * 2 : 64;
+		g19_glyph_t ** glyphs = PyMem_Realloc(self->glyphs, capacity * sizeof(*glyphs));
+		if (!glyphs)
+		{
+			Py_DECREF(key);
+			PyBuffer_Release(&coverage);
+			return PyErr_NoMemory();
+		}
+		self->glyphs = glyphs;
+		self->capacity = capacity;
+	}
+
+	g19_glyph_t * glyph = PyMem_Malloc(sizeof(g19_glyph_t) + (size_t)width * height);
+	PyObject * slot = PyLong_FromSsize_t(self->count);
+	if (!glyph || !slot || PyDict_SetItem(self->index, key, slot) < 0)
+	{
+		PyMem_Free(glyph);
+		Py_XDECREF(slot);
+		Py_DECREF(key);
+		PyBuffer_Release(&coverage);
+		return PyErr_Occurred() ? NULL : PyErr_NoMemory();
+	}
+	Py_DECREF(slot);
+	Py_DECREF(key);
+
+	glyph->left = left;
+	glyph->top = top;
+	glyph->advance = advance;
+	glyph->width = width;
+	glyph->height = height;
+	const uint8_t * rows = coverage.buf;
+	for (int gx = 0; gx < width; gx++)
+		for (int gy = 0; gy < height; gy++)
+			glyph->coverage[gx * height + gy] = rows[(size_t)gy * width + gx];
+	self->glyphs[self->count++] = glyph;
+
+	PyBuffer_Release(&coverage);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static PyObject * g19_atlas_missing(g19_atlas_t * self, PyObject * args)
+{
+	PyObject * text = NULL;
+
+	if(!PyArg_ParseTuple(args, "U", &text))
+		return NULL;
+
+	PyObject * missing = PyList_New(0);
+	if (!missing)
+		return NULL;
+
+	Py_ssize_t length = PyUnicode_GET_LENGTH(text);
+	for (Py_ssize_t i = 0; i < length; i++)
+	{
+		Py_UCS4 code = PyUnicode_READ_CHAR(text, i);
+		if (_atlas_find(self, code))
+			continue;
+		if (PyErr_Occurred())
+			goto error;
+
+		PyObject * character = PyUnicode_FromOrdinal(code);
+		int known = character ? PySequence_Contains(missing, character) : -1;
+		if (known < 0 || (!known && PyList_Append(missing, character) < 0))
+		{
+			Py_XDECREF(character);
+			goto error;
+		}
+		Py_DECREF(character);
+	}
+
+	return missing;
+
+error:
+	Py_DECREF(missing);
+	return NULL;
+}
+
+static PyObject * g19_atlas_len(g19_atlas_t * self, PyObject * Py_UNUSED(ignored))
+{
+	return PyLong_FromSsize_t(self->count);
+}
+
+static int g19_atlas_init(g19_atlas_t * self, PyObject * args, PyObject * kwds)
+{
+	if (self->index)
+		return 0;
+
+	self->index = PyDict_New();
+	return self->index ? 0 : -1;
+}
+
+static void g19_atlas_dealloc(g19_atlas_t * self)
+{
+	for (Py_ssize_t i = 0; i < self->count; i++)
+		PyMem_Free(self->glyphs[i]);
+	PyMem_Free(self->glyphs);
+	Py_XDECREF(self->index);
+	Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyMethodDef g19_atlas_methods[] = {
+	{"add", (PyCFunction)g19_atlas_add, METH_VARARGS, "Add glyph: code, left, top, advance in 1/64 px, width, height, row-major coverage"},
+	{"missing", (PyCFunction)g19_atlas_missing, METH_VARARGS, "Get list of characters of text not in atlas yet"},
+	{"get_count", (PyCFunction)g19_atlas_len, METH_NOARGS, "Get number of glyphs"},
+	{NULL, NULL, 0, NULL}
+};
+
+static PyTypeObject g19_atlas = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "libcdraw.Atlas",
+	.tp_doc = "Glyph coverage cache of one font face and size",
+	.tp_basicsize = sizeof(g19_atlas_t),
+	.tp_itemsize = 0,
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_new = PyType_GenericNew,
+	.tp_init = (initproc)g19_atlas_init,
+	.tp_dealloc = (destructor)g19_atlas_dealloc,
+	.tp_methods = g19_atlas_methods
+};
+
+/* Pen advance of a run of glyphs in 1/64 px, missing glyphs take no room */
+static int _glyphs_advance(g19_glyph_t * const * glyphs, Py_ssize_t length)
+{
+	int pen = 0;
+	for (Py_ssize_t i = 0; i < length; i++)
+		if (glyphs[i])
+			pen += glyphs[i]->advance;
+	return pen;
+}
+
+/* Looks glyphs of text up in atlas, NULL with exception set on failure */
+static g19_glyph_t ** _atlas_lookup(g19_atlas_t * atlas, PyObject * text)
+{
+	Py_ssize_t length = PyUnicode_GET_LENGTH(text);
+	g19_glyph_t ** glyphs = PyMem_Malloc((length ? length : 1) * sizeof(*glyphs));
+	if (!glyphs)
+		return (g19_glyph_t **)PyErr_NoMemory();
+
+	for (Py_ssize_t i = 0; i < length; i++)
+	{
+		glyphs[i] = _atlas_find(atlas, PyUnicode_READ_CHAR(text, i));
+		if (!glyphs[i] && PyErr_Occurred())
+		{
+			PyMem_Free(glyphs);
+			return NULL;
+		}
+	}
+
+	return glyphs;
+}
+
+static void _draw_glyphs(const g19_kernels_t * blend, g19_frame_t * self,
+                         g19_glyph_t * const * glyphs, Py_ssize_t length,
+                         int x, int y, uint16_t color, const g19_clip_t * clip)
+{
+	int pen = 0;
+
+	for (Py_ssize_t i = 0; i < length; i++)
+	{
+		const g19_glyph_t * glyph = glyphs[i];
+		if (!glyph)
+			continue;
+
+		int gx = x + (pen >> 6) + glyph->left,
+		    gy = y + glyph->top;
+		pen += glyph->advance;
+
+		int start_x = gx < clip->start_x ? clip->start_x : gx,
+		    start_y = gy < clip->start_y ? clip->start_y : gy,
+		    end_x = gx + glyph->width > clip->end_x ? clip->end_x : gx + glyph->width,
+		    end_y = gy + glyph->height > clip->end_y ? clip->end_y : gy + glyph->height;
+		if (start_y >= end_y || start_x >= end_x)
+			continue;
+
+		g19_clip_t drawn = {start_x, start_y, end_x, end_y};
+		_add_damage(&self->damage, &drawn);
+
+		for (int px = start_x; px < end_x; px++)
+			blend->blend_mask_solid(self->map + G19_PIXEL(px, start_y), end_y - start_y, color,
+			                        glyph->coverage + (px - gx) * glyph->height + (start_y - gy));
+	}
+}
+
+static PyObject * draw_string(g19_frame_t * self, PyObject * args)
+{
+	g19_atlas_t * atlas = NULL;
+	PyObject * text = NULL;
+	int x  = 0,
+	    y  = 0,
+	    cx = 0,
+	    cy = 0,
+	    sx = 0,
+	    sy = 0;
+	uint16_t color = 0;
+
+	if(!PyArg_ParseTuple(args, "O!iiHU(iiii)", &g19_atlas, &atlas, &x, &y, &color, &text,
+	                     &cx, &cy, &sx, &sy))
+		return NULL;
+
+	/* Glyphs are looked up with the GIL, then drawn without it */
+	Py_ssize_t length = PyUnicode_GET_LENGTH(text);
+	g19_glyph_t ** glyphs = _atlas_lookup(atlas, text);
+	if (!glyphs)
+		return NULL;
+
+	const g19_kernels_t * blend = kernels;
+	g19_clip_t clip;
+	int pen = _glyphs_advance(glyphs, length);
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	if (_clip(&clip, cx, cy, sx, sy))
+		_draw_glyphs(blend, self, glyphs, length, x, y, color, &clip);
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	PyMem_Free(glyphs);
+
+	return PyLong_FromLong(x + (pen >> 6));
+}
+
+/*
+ * Sprite: picture converted once for repeated blits.  Pixels are
+ * premultiplied by alpha and, like map, stored column-major, so every
+ * sprite column is blended as one span.
+ */
 typedef struct {
 	PyObject_HEAD
-	uint16_t * map;
-} g19_frame_t;
+	int width, height;
+	/* Premultiplied pixels */
+	uint16_t * pixels;
+	/* Alpha of pixels, NULL if sprite is opaque */
+	uint8_t * alpha;
+} g19_sprite_t;
 
-static PyObject * g19_get_bytes(g19_frame_t * self, PyObject * Py_UNUSED(ignored))
+static PyTypeObject g19_sprite;
+
+static int g19_sprite_init(g19_sprite_t * self, PyObject * args, PyObject * kwds)
 {
-	PyObject * result = PyBytes_FromStringAndSize((const char *)self->map, G19_SIZE);
+	static char * kwlist[] = {"width", "height", "pixels", "mask", NULL};
+	Py_buffer pixels = {0},
+	          mask   = {0};
+	int width  = 0,
+	    height = 0;
+
+	if (self->pixels)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "Sprite is already initialized");
+		return -1;
+	}
+
+	if(!PyArg_ParseTupleAndKeywords(args, kwds, "iiy*|z*", kwlist, &width, &height, &pixels, &mask))
+		return -1;
+
+	int result = -1;
+	if (width <= 0 || height <= 0)
+	{
+		PyErr_Format(PyExc_ValueError, "Sprite size %dx%d is empty", width, height);
+		goto out;
+	}
+	if (_check_size(&pixels, width, height, sizeof(uint16_t), "picture") < 0 ||
+	    (mask.buf && _check_size(&mask, width, height, sizeof(uint8_t), "mask") < 0))
+		goto out;
+
+	size_t count = (size_t)width * height;
+	self->pixels = PyMem_Malloc(count * sizeof(uint16_t));
+	self->alpha = mask.buf ? PyMem_Malloc(count) : NULL;
+	if (!self->pixels || (mask.buf && !self->alpha))
+	{
+		PyErr_NoMemory();
+		goto out;
+	}
+
+	const uint16_t * src = pixels.buf;
+	const uint8_t * opacity = mask.buf;
+	int opaque = 1;
+	for (int py = 0; py < height; py++)
+		for (int px = 0; px < width; px++)
+		{
+			size_t idx = (size_t)py * width + px,
+			       pos = (size_t)px * height + py;
+			uint16_t pixel = src[idx];
+			if (opacity)
+			{
+				unsigned a = _alpha_from_mask(opacity[idx]);
+				self->alpha[pos] = opacity[idx];
+				opaque &= opacity[idx] == 0xff;
+				pixel = ((pixel >> 11)       * a) >> 8 << 11 |
+				        ((pixel >> 5 & 0x3f) * a) >> 8 << 5  |
+				        ((pixel & 0x1f)      * a) >> 8;
+			}
+			self->pixels[pos] = pixel;
+		}
+
+	if (opaque && self->alpha)
+	{
+		PyMem_Free(self->alpha);
+		self->alpha = NULL;
+	}
+	self->width = width;
+	self->height = height;
+	result = 0;
+
+out:
+	PyBuffer_Release(&pixels);
+	PyBuffer_Release(&mask);
 	return result;
 }
 
-static inline uint16_t _rgb_to_uint16(uint8_t red, uint8_t green, uint8_t blue)
+static void g19_sprite_dealloc(g19_sprite_t * self)
 {
-	uint8_t red_bits =   ((uint8_t)(red   * (0b00011111 / 255.)) & 0b00011111);
-	uint8_t green_bits = ((uint8_t)(green * (0b00111111 / 255.)) & 0b00111111);
-	uint8_t blue_bits =  ((uint8_t)(blue  * (0b00011111 / 255.)) & 0b00011111);
+	PyMem_Free(self->pixels);
+	PyMem_Free(self->alpha);
+	Py_TYPE(self)->tp_free((PyObject *)self);
+}
 
-	return red_bits << 11 | green_bits << 5 | blue_bits;
+static PyObject * g19_sprite_get_size(g19_sprite_t * self, PyObject * Py_UNUSED(ignored))
+{
+	return Py_BuildValue("(ii)", self->width, self->height);
 }
 
-static PyObject * rgb_to_uint16(PyObject * self, PyObject *args)
+static PyObject * g19_sprite_get_nbytes(g19_sprite_t * self, PyObject * Py_UNUSED(ignored))
 {
-	uint8_t red   = 0,
-	        green = 0,
-	        blue  = 0;
+	size_t count = (size_t)self->width * self->height;
+	return PyLong_FromSize_t(count * sizeof(uint16_t) + (self->alpha ? count : 0));
+}
 
-	if(!PyArg_ParseTuple(args, "bbb", &red, &green, &blue))
-		return NULL;
+static PyObject * g19_sprite_is_opaque(g19_sprite_t * self, PyObject * Py_UNUSED(ignored))
+{
+	return PyBool_FromLong(self->pixels && !self->alpha);
+}
 
-	return Py_BuildValue("I", _rgb_to_uint16(red, green, blue));
+static PyMethodDef g19_sprite_methods[] = {
+	{"get_size", (PyCFunction)g19_sprite_get_size, METH_NOARGS, "Get (width, height)"},
+	{"get_nbytes", (PyCFunction)g19_sprite_get_nbytes, METH_NOARGS, "Get memory held by pixels and alpha"},
+	{"is_opaque", (PyCFunction)g19_sprite_is_opaque, METH_NOARGS, "Check if sprite has no transparent pixels"},
+	{NULL, NULL, 0, NULL}
+};
+
+static PyTypeObject g19_sprite = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "libcdraw.Sprite",
+	.tp_doc = "Sprite(width, height, pixels, mask=None): premultiplied picture for Frame.blit_many",
+	.tp_basicsize = sizeof(g19_sprite_t),
+	.tp_itemsize = 0,
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_new = PyType_GenericNew,
+	.tp_init = (initproc)g19_sprite_init,
+	.tp_dealloc = (destructor)g19_sprite_dealloc,
+	.tp_methods = g19_sprite_methods
+};
+
+static void _blit_sprite(const g19_kernels_t * blend, uint16_t * map, g19_clip_t * damage,
+                         const g19_sprite_t * sprite, int x, int y)
+{
+	g19_clip_t clip;
+
+	if (!_clip(&clip, x, y, sprite->width, sprite->height))
+		return;
+	_add_damage(damage, &clip);
+
+	int height = clip.end_y - clip.start_y;
+	for (int px = clip.start_x; px < clip.end_x; px++)
+	{
+		size_t offset = (size_t)(px - x) * sprite->height + (clip.start_y - y);
+		uint16_t * dst = map + G19_PIXEL(px, clip.start_y);
+		if (sprite->alpha)
+			blend->blend_premul(dst, height, sprite->pixels + offset, sprite->alpha + offset);
+		else
+			memcpy(dst, sprite->pixels + offset, height * sizeof(uint16_t));
+	}
 }
 
-static inline uint16_t _apply_alpha(uint16_t color1, uint16_t color2, float alpha)
+static PyObject * blit_many(g19_frame_t * self, PyObject * args)
 {
-	if (alpha == 1.)
-		return color2;
-	else if (alpha == 0.)
-		return color1;
+	g19_sprite_t * sprite = NULL;
+	PyObject * positions = NULL;
+
+	if(!PyArg_ParseTuple(args, "O!O", &g19_sprite, &sprite, &positions))
+		return NULL;
 
-	uint8_t red1 = color1 >> 11 & 0b00011111;
-	uint8_t red2 = color2 >> 11 & 0b00011111;
-	uint8_t green1 = color1 >> 5 & 0b00111111;
-	uint8_t green2 = color2 >> 5 & 0b00111111;
-	uint8_t blue1 = color1 & 0b00011111;
-	uint8_t blue2 = color2 & 0b00011111;
+	if (!sprite->pixels)
+	{
+		PyErr_SetString(PyExc_ValueError, "Sprite is not initialized");
+		return NULL;
+	}
 
-	uint8_t red_bits = (uint8_t)(red2 * alpha + red1 * (1 - alpha)) & 0b00011111;
-	uint8_t green_bits = (uint8_t)(green2 * alpha + green1 * (1 - alpha)) & 0b00111111;
-	uint8_t blue_bits = (uint8_t)(blue2 * alpha + blue1 * (1 - alpha)) & 0b00011111;
+	Py_buffer view = {0};
+	if (PyObject_GetBuffer(positions, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+		return NULL;
 
-	return red_bits << 11 | green_bits << 5 | blue_bits;
+	const char * format = view.format ? view.format : "B";
+	size_t length = strlen(format);
+	if (view.itemsize != sizeof(int16_t) || !length || format[length - 1] != 'h' ||
+	    view.len % (2 * sizeof(int16_t)))
+	{
+		PyErr_SetString(PyExc_TypeError, "positions must be x, y pairs of int16, e.g. array('h')");
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+
+	const int16_t * xy = view.buf;
+	Py_ssize_t count = view.len / (2 * sizeof(int16_t));
+	const g19_kernels_t * blend = kernels;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	for (Py_ssize_t i = 0; i < count; i++)
+		_blit_sprite(blend, self->map, &self->damage, sprite, xy[2 * i], xy[2 * i + 1]);
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&view);
+
+	Py_INCREF(Py_None);
+	return Py_None;
 }
 
-static PyObject * apply_alpha(PyObject * self, PyObject *args)
+static PyObject * blit(g19_frame_t * self, PyObject * args)
 {
-	uint16_t color1 = 0,
-	         color2 = 0;
-	float alpha = 0.;
+	g19_sprite_t * sprite = NULL;
+	int x = 0,
+	    y = 0;
 
-	if(!PyArg_ParseTuple(args, "HHf", &color1, &color2, &alpha))
+	if(!PyArg_ParseTuple(args, "O!ii", &g19_sprite, &sprite, &x, &y))
 		return NULL;
 
-	return Py_BuildValue("I", _apply_alpha(color1, color2, alpha));
+	if (!sprite->pixels)
+	{
+		PyErr_SetString(PyExc_ValueError, "Sprite is not initialized");
+		return NULL;
+	}
+
+	const g19_kernels_t * blend = kernels;
+
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	_blit_sprite(blend, self->map, &self->damage, sprite, x, y);
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+
+	Py_INCREF(Py_None);
+	return Py_None;
 }
 
-static PyObject * draw_rectangle(g19_frame_t * self, PyObject * args)
+/*
+ * DisplayList: drawing calls recorded for Frame.execute().  Arguments are
+ * parsed, clipped and looked up once when recording, so executing a list,
+ * possibly many times, is a single call drawing without the GIL.
+ */
+enum {
+	G19_OP_RECTANGLE,
+	G19_OP_TEXT,
+	G19_OP_SPRITE,
+	G19_OP_STRING
+};
+
+typedef struct {
+	int op;
+	/* Clipped area of rectangle and text, clip of string */
+	g19_clip_t clip;
+	/* Origin of text, sprites and string */
+	int x, y, sx;
+	uint16_t color;
+	unsigned alpha;
+	/* Sprite or Atlas the command uses, kept alive by the list */
+	PyObject * ref;
+	/* Mask of text, int16 positions of sprites, glyphs of string */
+	void * data;
+	Py_ssize_t length;
+} g19_command_t;
+
+typedef struct {
+	PyObject_HEAD
+	g19_command_t * commands;
+	Py_ssize_t count;
+	Py_ssize_t capacity;
+	/* Number of Frame.execute() running the list without the GIL */
+	int running;
+} g19_list_t;
+
+static PyTypeObject g19_list;
+
+/* Returns a new command at the end of list, NULL with exception set on failure */
+static g19_command_t * _list_append(g19_list_t * self, int op)
+{
+	if (self->running)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "DisplayList is being executed");
+		return NULL;
+	}
+
+	if (self->count == self->capacity)
+	{
+		Py_ssize_t capacity = self->capacity ? self->capacity * 2 : 16;
+		g19_command_t * commands = PyMem_Realloc(self->commands, capacity * sizeof(*commands));
+		if (!commands)
+			return (g19_command_t *)PyErr_NoMemory();
+		self->commands = commands;
+		self->capacity = capacity;
+	}
+
+	g19_command_t * command = self->commands + self->count++;
+	memset(command, 0, sizeof(*command));
+	command->op = op;
+	return command;
+}
+
+static void _list_clear(g19_list_t * self)
+{
+	for (Py_ssize_t i = 0; i < self->count; i++)
+	{
+		Py_XDECREF(self->commands[i].ref);
+		PyMem_Free(self->commands[i].data);
+	}
+	self->count = 0;
+}
+
+static PyObject * g19_list_draw_rectangle(g19_list_t * self, PyObject * args)
 {
 	int x  = 0,
 	    y  = 0,
 	    sx = 0,
 	    sy = 0;
-
 	uint16_t color = 0;
 	float alpha = 0.;
 
 	if(!PyArg_ParseTuple(args, "iiiiHf", &x, &y, &sx, &sy, &color, &alpha))
 		return NULL;
 
-	int end_x = x + sx;
-	if (end_x > G19_WIDTH)
-		end_x = G19_WIDTH;
-
-	int end_y = y + sy;
-	if (end_y > G19_HEIGHT)
-		end_y = G19_HEIGHT;
-
-	for (int px = x; px < end_x; px++)
+	g19_clip_t clip;
+	unsigned fixed_alpha = _alpha_from_float(alpha);
+	if (fixed_alpha && _clip(&clip, x, y, sx, sy))
 	{
-		for (int py = y; py < end_y; py++)
-			self->map[G19_PIXEL(px, py)] = _apply_alpha(self->map[G19_PIXEL(px, py)], color, alpha);
+		g19_command_t * command = _list_append(self, G19_OP_RECTANGLE);
+		if (!command)
+			return NULL;
+		command->clip = clip;
+		command->color = color;
+		command->alpha = fixed_alpha;
 	}
 
 	Py_INCREF(Py_None);
 	return Py_None;
 }
 
-static PyObject * copy_rectangle(g19_frame_t * self, PyObject * args)
+static PyObject * g19_list_copy_text(g19_list_t * self, PyObject * args)
 {
-	PyObject * bsrc   = NULL,
-	         * balpha = NULL;
+	Py_buffer alpha = {0};
 	int x  = 0,
 	    y  = 0,
 	    sx = 0,
 	    sy = 0;
+	uint16_t color;
 
-	if(!PyArg_ParseTuple(args, "iiiiSS", &x, &y, &sx, &sy, &bsrc, &balpha))
+	if(!PyArg_ParseTuple(args, "iiiiHy*", &x, &y, &sx, &sy, &color, &alpha))
 		return NULL;
 
-	char * src = PyBytes_AsString(bsrc);
-
-	char * alpha = PyBytes_AsString(balpha);
+	if (_check_size(&alpha, sx, sy, sizeof(uint8_t), "mask") < 0)
+	{
+		PyBuffer_Release(&alpha);
+		return NULL;
+	}
 
-	int end_x = x + sx;
+	g19_clip_t clip;
+	if (_clip(&clip, x, y, sx, sy))
+	{
+		/* Mask is copied, so the caller may reuse its buffer */
+		uint8_t * mask = PyMem_Malloc((size_t)sx * sy);
+		g19_command_t * command = mask ? _list_append(self, G19_OP_TEXT) : NULL;
+		if (!command)
+		{
+			PyMem_Free(mask);
+			PyBuffer_Release(&alpha);
+			return mask ? NULL : PyErr_NoMemory();
+		}
+		memcpy(mask, alpha.buf, (size_t)sx * sy);
+		command->clip = clip;
+		command->x = x;
+		command->y = y;
+		command->sx = sx;
+		command->color = color;
+		command->data = mask;
+	}
+	PyBuffer_Release(&alpha);
 
-	int end_y = y + sy;
+	Py_INCREF(Py_None);
+	return Py_None;
+}
 
-	uint16_t * img = (uint16_t *)src;
-	uint8_t * mask = (uint8_t *)alpha;
-	int img_idx = 0;
+/* Records count sprites at int16 x, y pairs of xy */
+static PyObject * _list_sprites(g19_list_t * self, g19_sprite_t * sprite,
+                                const int16_t * xy, Py_ssize_t count)
+{
+	if (!sprite->pixels)
+	{
+		PyErr_SetString(PyExc_ValueError, "Sprite is not initialized");
+		return NULL;
+	}
 
-	for (int py = y; py < end_y; py++)
+	int16_t * positions = PyMem_Malloc((count ? count : 1) * 2 * sizeof(int16_t));
+	g19_command_t * command = positions ? _list_append(self, G19_OP_SPRITE) : NULL;
+	if (!command)
 	{
-		if (py < 0 || py >= G19_HEIGHT)
-		{
-			img_idx += sx;
-			continue;
-		}
-		for (int px = x; px < end_x; px++)
-		{
-			if (px >= 0 && px < G19_WIDTH)
-				self->map[G19_PIXEL(px, py)] = _apply_alpha(self->map[G19_PIXEL(px, py)], img[img_idx],
-				                                            (float)mask[img_idx] / 255);
-			img_idx++;
-		}
+		PyMem_Free(positions);
+		return positions ? NULL : PyErr_NoMemory();
 	}
+	memcpy(positions, xy, count * 2 * sizeof(int16_t));
+	Py_INCREF(sprite);
+	command->ref = (PyObject *)sprite;
+	command->data = positions;
+	command->length = count;
 
 	Py_INCREF(Py_None);
 	return Py_None;
 }
 
-static PyObject * copy_text(g19_frame_t * self, PyObject * args)
+static PyObject * g19_list_blit(g19_list_t * self, PyObject * args)
 {
-	PyObject * balpha = NULL;
+	g19_sprite_t * sprite = NULL;
+	int x = 0,
+	    y = 0;
+
+	if(!PyArg_ParseTuple(args, "O!ii", &g19_sprite, &sprite, &x, &y))
+		return NULL;
+
+	/* Sprites further away than int16 can not be visible */
+	int16_t xy[2] = {x < INT16_MIN ? INT16_MIN : x > INT16_MAX ? INT16_MAX : x,
+	                 y < INT16_MIN ? INT16_MIN : y > INT16_MAX ? INT16_MAX : y};
+	return _list_sprites(self, sprite, xy, 1);
+}
+
+static PyObject * g19_list_blit_many(g19_list_t * self, PyObject * args)
+{
+	g19_sprite_t * sprite = NULL;
+	PyObject * positions = NULL;
+
+	if(!PyArg_ParseTuple(args, "O!O", &g19_sprite, &sprite, &positions))
+		return NULL;
 
+	Py_buffer view = {0};
+	if (PyObject_GetBuffer(positions, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+		return NULL;
+
+	const char * format = view.format ? view.format : "B";
+	size_t length = strlen(format);
+	if (view.itemsize != sizeof(int16_t) || !length || format[length - 1] != 'h' ||
+	    view.len % (2 * sizeof(int16_t)))
+	{
+		PyErr_SetString(PyExc_TypeError, "positions must be x, y pairs of int16, e.g. array('h')");
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+
+	/* Positions are copied, so the caller may go on moving them */
+	PyObject * result = _list_sprites(self, sprite, view.buf, view.len / (2 * sizeof(int16_t)));
+	PyBuffer_Release(&view);
+	return result;
+}
+
+static PyObject * g19_list_draw_string(g19_list_t * self, PyObject * args)
+{
+	g19_atlas_t * atlas = NULL;
+	PyObject * text = NULL;
 	int x  = 0,
 	    y  = 0,
+	    cx = 0,
+	    cy = 0,
 	    sx = 0,
 	    sy = 0;
+	uint16_t color = 0;
 
-	uint16_t color;
+	if(!PyArg_ParseTuple(args, "O!iiHU(iiii)", &g19_atlas, &atlas, &x, &y, &color, &text,
+	                     &cx, &cy, &sx, &sy))
+		return NULL;
+
+	/* Glyphs live as long as atlas, which the command keeps */
+	Py_ssize_t length = PyUnicode_GET_LENGTH(text);
+	g19_glyph_t ** glyphs = _atlas_lookup(atlas, text);
+	if (!glyphs)
+		return NULL;
+	int pen = _glyphs_advance(glyphs, length);
+
+	g19_clip_t clip;
+	if (length && _clip(&clip, cx, cy, sx, sy))
+	{
+		g19_command_t * command = _list_append(self, G19_OP_STRING);
+		if (!command)
+		{
+			PyMem_Free(glyphs);
+			return NULL;
+		}
+		Py_INCREF(atlas);
+		command->ref = (PyObject *)atlas;
+		command->clip = clip;
+		command->x = x;
+		command->y = y;
+		command->color = color;
+		command->data = glyphs;
+		command->length = length;
+	}
+	else
+		PyMem_Free(glyphs);
 
-	if(!PyArg_ParseTuple(args, "iiiiHS", &x, &y, &sx, &sy, &color, &balpha))
+	return PyLong_FromLong(x + (pen >> 6));
+}
+
+static PyObject * g19_list_clear(g19_list_t * self, PyObject * Py_UNUSED(ignored))
+{
+	if (self->running)
+	{
+		PyErr_SetString(PyExc_RuntimeError, "DisplayList is being executed");
 		return NULL;
+	}
+
+	_list_clear(self);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static PyObject * g19_list_get_count(g19_list_t * self, PyObject * Py_UNUSED(ignored))
+{
+	return PyLong_FromSsize_t(self->count);
+}
+
+static void g19_list_dealloc(g19_list_t * self)
+{
+	_list_clear(self);
+	PyMem_Free(self->commands);
+	Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyMethodDef g19_list_methods[] = {
+	{"draw_rectangle", (PyCFunction)g19_list_draw_rectangle, METH_VARARGS, "Record Frame.draw_rectangle"},
+	{"copy_text", (PyCFunction)g19_list_copy_text, METH_VARARGS, "Record Frame.copy_text, mask is copied"},
+	{"blit", (PyCFunction)g19_list_blit, METH_VARARGS, "Record Frame.blit"},
+	{"blit_many", (PyCFunction)g19_list_blit_many, METH_VARARGS, "Record Frame.blit_many, positions are copied"},
+	{"draw_string", (PyCFunction)g19_list_draw_string, METH_VARARGS, "Record Frame.draw_string; returns pen x"},
+	{"clear", (PyCFunction)g19_list_clear, METH_NOARGS, "Drop recorded commands"},
+	{"get_count", (PyCFunction)g19_list_get_count, METH_NOARGS, "Get number of recorded commands"},
+	{NULL, NULL, 0, NULL}
+};
 
-	char * alpha = PyBytes_AsString(balpha);
+static PyTypeObject g19_list = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	.tp_name = "libcdraw.DisplayList",
+	.tp_doc = "DisplayList(): drawing calls of Frame recorded for Frame.execute",
+	.tp_basicsize = sizeof(g19_list_t),
+	.tp_itemsize = 0,
+	.tp_flags = Py_TPFLAGS_DEFAULT,
+	.tp_new = PyType_GenericNew,
+	.tp_dealloc = (destructor)g19_list_dealloc,
+	.tp_methods = g19_list_methods
+};
 
-	int end_x = x + sx;
+static PyObject * execute(g19_frame_t * self, PyObject * args)
+{
+	g19_list_t * list = NULL;
 
-	int end_y = y + sy;
+	if(!PyArg_ParseTuple(args, "O!", &g19_list, &list))
+		return NULL;
 
-	uint8_t * mask = (uint8_t *)alpha;
-	int idx = 0;
+	const g19_kernels_t * blend = kernels;
 
-	for (int py = y; py < end_y; py++)
+	/* Recording into list fails meanwhile, so commands stay as they are */
+	list->running++;
+	Py_BEGIN_ALLOW_THREADS
+	G19_LOCK(self);
+	for (Py_ssize_t i = 0; i < list->count; i++)
 	{
-		if (py < 0 || py >= G19_HEIGHT)
+		const g19_command_t * command = list->commands + i;
+		switch (command->op)
 		{
-			idx += sx;
-			continue;
-		}
-		for (int px = x; px < end_x; px++)
+		case G19_OP_RECTANGLE:
+			_draw_rectangle(blend, self, &command->clip, command->color, command->alpha);
+			break;
+		case G19_OP_TEXT:
+			_blit_text(blend, self->map, command->x, command->y, command->sx, &command->clip,
+			           command->color, command->data);
+			_add_damage(&self->damage, &command->clip);
+			break;
+		case G19_OP_SPRITE:
 		{
-			if (px >= 0 && px < G19_WIDTH)
-				self->map[G19_PIXEL(px, py)] = _apply_alpha(self->map[G19_PIXEL(px, py)], color,
-			                                               (float)mask[idx] / 255);
-			idx++;
+			const int16_t * xy = command->data;
+			for (Py_ssize_t j = 0; j < command->length; j++)
+				_blit_sprite(blend, self->map, &self->damage,
+				             (const g19_sprite_t *)command->ref, xy[2 * j], xy[2 * j + 1]);
+			break;
+		}
+		case G19_OP_STRING:
+			_draw_glyphs(blend, self, command->data, command->length,
+			             command->x, command->y, command->color, &command->clip);
+			break;
 		}
 	}
+	self->generation++;
+	G19_UNLOCK(self);
+	Py_END_ALLOW_THREADS
+	list->running--;
 
 	Py_INCREF(Py_None);
 	return Py_None;
@@ -199,6 +2128,9 @@ static PyObject * copy_text(g19_frame_t * self, PyObject * args)
 static PyMethodDef LibCDrawMethods[] = {
 	{"rgb_to_uint16", rgb_to_uint16, METH_VARARGS, "Convert 3x1-byte color's channel to 2-byte color"},
 	{"apply_alpha", apply_alpha, METH_VARARGS, "Merge two pixel"},
+	{"pack_rgb565", pack_rgb565, METH_VARARGS, "Convert RGB 3-byte pixels to 2-byte pixels of map"},
+	{"get_simd", get_simd, METH_NOARGS, "Get name of blending kernels in use"},
+	{"set_simd", set_simd, METH_VARARGS, "Select blending kernels: auto, avx2, sse2 or scalar"},
 	{NULL, NULL, 0, NULL}
 };
 
@@ -212,27 +2144,114 @@ static struct PyModuleDef libcdrawmodule = {
 
 static void g19_dealloc(g19_frame_t * self)
 {
+	if (self->lock)
+		PyThread_free_lock(self->lock);
 	free(self->map);
 	Py_TYPE(self)->tp_free((PyObject *)self);
 }
 
 static int g19_init(g19_frame_t * self, PyObject * args, PyObject * kwds)
 {
-	self->map = calloc(sizeof(uint16_t), G19_RESOLUTION);
+	if (self->map && self->lock)
+		return 0;
+
+	if (!self->lock)
+		self->lock = PyThread_allocate_lock();
 	if (!self->map)
+		self->map = calloc(G19_RESOLUTION, sizeof(uint16_t));
+	if (!self->lock || !self->map)
+	{
+		PyErr_NoMemory();
 		return -1;
+	}
+
+	self->generation = 1;
+	self->checksum_generation = 0;
+	/* Nothing is known about what the display shows yet */
+	_clip(&self->damage, 0, 0, G19_WIDTH, G19_HEIGHT);
 
 	return 0;
 }
 
 static PyMethodDef g19_methods[] = {
 	{"get_bytes", (PyCFunction)g19_get_bytes, METH_NOARGS, "Get map in bytes"},
+	{"copy_from", (PyCFunction)g19_copy_from, METH_VARARGS, "Copy map of another frame to this one"},
+	{"get_generation", (PyCFunction)g19_get_generation, METH_NOARGS, "Get counter of map changes"},
+	{"get_checksum", (PyCFunction)g19_get_checksum, METH_NOARGS, "Get 64-bit fingerprint of map"},
+	{"get_damage", (PyCFunction)g19_get_damage, METH_NOARGS, "Get (x, y, width, height) bounding changes since clear_damage(), or None"},
+	{"clear_damage", (PyCFunction)g19_clear_damage, METH_NOARGS, "Forget changes made so far"},
+	{"add_damage", (PyCFunction)g19_add_damage, METH_VARARGS, "Mark window x, y, width, height (default whole map) as changed after writing pixels through the buffer"},
+	{"pack", (PyCFunction)g19_pack, METH_VARARGS, "Write packet updating window x, y, width, height into writable buffer; returns its size"},
 	{"draw_rectangle", (PyCFunction)draw_rectangle, METH_VARARGS, "Draw rectangle on map"},
 	{"copy_text", (PyCFunction)copy_text, METH_VARARGS, "Copy rectangle from 1-channel+alpha picture"},
-	{"copy_rectangle", (PyCFunction)copy_rectangle, METH_VARARGS, "Copy rectangle from BGR pillow picture to map"},
+	{"copy_rectangle", (PyCFunction)copy_rectangle, METH_VARARGS, "Copy rectangle from BGR pillow picture to map, mask None is opaque"},
+	{"blit", (PyCFunction)blit, METH_VARARGS, "Blit Sprite at x, y"},
+	{"blit_many", (PyCFunction)blit_many, METH_VARARGS, "Blit Sprite at every x, y pair of int16 buffer, e.g. array('h')"},
+	{"draw_string", (PyCFunction)draw_string, METH_VARARGS, "Draw text from Atlas: atlas, x, y, color, text, clip (x, y, width, height); returns pen x"},
+	{"execute", (PyCFunction)execute, METH_VARARGS, "Draw commands recorded in DisplayList"},
 	{NULL, NULL, 0, NULL}
 };
 
+static Py_ssize_t g19_shape[2] = {G19_WIDTH, G19_HEIGHT};
+static Py_ssize_t g19_strides[2] = {G19_HEIGHT * sizeof(uint16_t), sizeof(uint16_t)};
+
+/*
+ * Map is exported writable as uint16 [x][y], without copying.  Access
+ * through it is not guarded by the frame lock and not tracked: writers call
+ * add_damage() afterwards, so checksum and damage stay right.
+ */
+static int g19_getbuffer(g19_frame_t * self, Py_buffer * view, int flags)
+{
+	if (!self->map || (flags & PyBUF_F_CONTIGUOUS) == PyBUF_F_CONTIGUOUS)
+	{
+		PyErr_SetString(PyExc_BufferError, self->map ? "Frame map is C-contiguous"
+		                                                : "Frame is not initialized");
+		view->obj = NULL;
+		return -1;
+	}
+
+	view->obj = (PyObject *)self;
+	Py_INCREF(self);
+	view->buf = self->map;
+	view->len = G19_SIZE;
+	view->readonly = 0;
+	view->itemsize = sizeof(uint16_t);
+	view->format = (flags & PyBUF_FORMAT) ? "H" : NULL;
+	/* Without PyBUF_ND consumers see plain bytes */
+	view->shape = (flags & PyBUF_ND) == PyBUF_ND ? g19_shape : NULL;
+	view->ndim = view->shape ? 2 : 1;
+	view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? g19_strides : NULL;
+	view->suboffsets = NULL;
+	view->internal = NULL;
+
+	return 0;
+}
+
+/* NumPy array interface: numpy.asarray(frame) is a (320, 240) uint16 view of map */
+static PyObject * g19_array_interface(g19_frame_t * self, void * Py_UNUSED(closure))
+{
+	if (!self->map)
+	{
+		PyErr_SetString(PyExc_AttributeError, "Frame is not initialized");
+		return NULL;
+	}
+
+	return Py_BuildValue("{s:(ii),s:s,s:(NO),s:i}",
+	                     "shape", G19_WIDTH, G19_HEIGHT,
+	                     "typestr", PY_LITTLE_ENDIAN ? "<u2" : ">u2",
+	                     "data", PyLong_FromVoidPtr(self->map), Py_False,
+	                     "version", 3);
+}
+
+static PyGetSetDef g19_getset[] = {
+	{"__array_interface__", (getter)g19_array_interface, NULL, "NumPy view of map", NULL},
+	{NULL, NULL, NULL, NULL, NULL}
+};
+
+static PyBufferProcs g19_as_buffer = {
+	.bf_getbuffer = (getbufferproc)g19_getbuffer,
+	.bf_releasebuffer = NULL
+};
 
 static PyTypeObject g19_frame = {
 	PyVarObject_HEAD_INIT(NULL, 0)
@@ -244,12 +2263,18 @@ static PyTypeObject g19_frame = {
 	.tp_new = PyType_GenericNew,
 	.tp_init = (initproc)g19_init,
 	.tp_dealloc = (destructor)g19_dealloc,
-	.tp_methods = g19_methods
+	.tp_methods = g19_methods,
+	.tp_getset = g19_getset,
+	.tp_as_buffer = &g19_as_buffer
 };
 
 PyMODINIT_FUNC PyInit_libcdraw(void)
 {
-	if (PyType_Ready(&g19_frame) < 0)
+	_select_kernels("auto");
+	_init_preamble();
+
+	if (PyType_Ready(&g19_frame) < 0 || PyType_Ready(&g19_atlas) < 0 ||
+	    PyType_Ready(&g19_sprite) < 0 || PyType_Ready(&g19_list) < 0)
 		return NULL;
 
 	PyObject * module = PyModule_Create(&libcdrawmodule);
@@ -264,6 +2289,37 @@ PyMODINIT_FUNC PyInit_libcdraw(void)
 		return NULL;
 	}
 
+	Py_INCREF(&g19_atlas);
+	if (PyModule_AddObject(module, "Atlas", (PyObject *)&g19_atlas) < 0)
+	{
+		Py_DECREF(&g19_atlas);
+		Py_DECREF(module);
+		return NULL;
+	}
+
+	Py_INCREF(&g19_sprite);
+	if (PyModule_AddObject(module, "Sprite", (PyObject *)&g19_sprite) < 0)
+	{
+		Py_DECREF(&g19_sprite);
+		Py_DECREF(module);
+		return NULL;
+	}
+
+	Py_INCREF(&g19_list);
+	if (PyModule_AddObject(module, "DisplayList", (PyObject *)&g19_list) < 0)
+	{
+		Py_DECREF(&g19_list);
+		Py_DECREF(module);
+		return NULL;
+	}
+
+	if (PyModule_AddIntConstant(module, "PREAMBLE_SIZE", G19_PREAMBLE_SIZE) < 0 ||
+	    PyModule_AddIntConstant(module, "PACKET_SIZE", G19_PACKET_SIZE) < 0)
+	{
+		Py_DECREF(module);
+		return NULL;
+	}
+
 	return module;
 }
 
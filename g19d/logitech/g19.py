@@ -1,5 +1,11 @@
 from g19d.logitech.g19_receivers import G19Receiver
+from g19d.logitech.g19_virtual import VirtualG19Controller
+from g19d.logitech.latency import (LatencyStats, LatencyStages)
+from g19d.logitech.runnable import Runnable
 
+import array
+import collections
+import errno
 import sys
 import threading
 import time
@@ -14,15 +20,57 @@ class G19(object):
 
     '''
 
-    def __init__(self, resetOnStart=False):
-        '''Initializes and opens the USB device.'''
-        self.__usbDevice = G19UsbController(resetOnStart)
+    # Damage covering more of the display than this is sent as full frame
+    WINDOW_MAX_AREA = 320 * 240 // 2
+
+    def __init__(self, resetOnStart=False, frameKeepAlive=1.0, backend=None,
+                 partialUpdates=None):
+        '''Initializes and opens the USB device.
+
+        @param resetOnStart Reset the device before claiming it.
+        @param frameKeepAlive Seconds after which an unchanged frame is sent
+        again anyway.
+        @param backend "usb" (or None) for the real keyboard, "virtual" for an
+        emulated one (see VirtualG19Controller), or a controller object
+        providing handleIf0, handleIf1 and reset().
+        @param partialUpdates Send only the changed window of a frame where
+        possible, see send_frame().  None turns it on for all but the usb
+        backend: the windowed preamble is not confirmed on a real display,
+        which could show a misread packet without reporting an error.
+
+        '''
+        if backend is None or backend == "usb":
+            self.__usbDevice = G19UsbController(resetOnStart)
+        elif backend == "virtual":
+            self.__usbDevice = VirtualG19Controller(resetOnStart)
+        elif isinstance(backend, str):
+            raise ValueError("unknown G19 backend: " + backend)
+        else:
+            self.__usbDevice = backend
         self.__usbDeviceMutex = threading.Lock()
-        self.__keyReceiver = G19Receiver(self)
-        self.__threadDisplay = None
+        self.__inputLatency = LatencyStages()
+        self.__keyReceiver = G19Receiver(self, self.__inputLatency)
+        self.__scheduler = None
+        self.__threadScheduler = None
+        self.__frameKeepAlive = frameKeepAlive
+        self.__frameMutex = threading.Lock()
+        self.__lastFrameChecksum = None
+        self.__lastFrameTime = 0
+        self.__framesSent = 0
+        self.__framesSkipped = 0
+        self.__framesPartial = 0
+        self.__bytesWritten = 0
+        if partialUpdates is None:
+            partialUpdates = not (backend is None or backend == "usb")
+        self.__partialUpdates = partialUpdates
+        # Set whenever the display content is unknown, e.g. after an error
+        self.__fullFrameNeeded = True
         self.__framePreambule = bytes([0x10, 0x0F, 0x00, 0x58, 0x02, 0x00, 0x00, 0x00,
                                        0x00, 0x00, 0x00, 0x3F, 0x01, 0xEF, 0x00, 0x0F] + \
                                       [ i for i in range(16, 256) ] + [ i for i in range(256) ])
+        # pyusb hands array('B') to libusb as is, any other buffer is
+        # converted element by element, so frames are staged here
+        self.__frameBuffer = array.array('B', self.__framePreambule + bytes(320 * 240 * 2))
 
         logo = open(os.path.dirname(os.path.abspath(__file__))+"/logo", "rb")
         frame = logo.read()
@@ -30,42 +78,62 @@ class G19(object):
 
 
 
+    def get_device(self):
+        '''Returns the device controller, e.g. a VirtualG19Controller.'''
+        return self.__usbDevice
+
+    def get_input_stats(self):
+        '''Returns statistics of input event dispatching, see
+        InputDispatcher.get_stats().
+
+        '''
+        return self.__keyReceiver.get_stats()
+
+    def get_input_latency(self):
+        '''Returns LatencyStages of input handling, measured from packet
+        arrival.  Input processors add their own stages.
+
+        '''
+        return self.__inputLatency
+
     def add_key_listener(self, applet):
         '''Starts an applet.'''
         self.__keyReceiver.add_input_processor(applet.get_input_processor())
 
-    def read_g_and_m_keys(self, maxLen=20):
+    def read_g_and_m_keys(self, maxLen=20, timeout=10):
         '''Reads interrupt data from G, M and light switch keys.
 
+        Does not take the device lock: libusb handles transfers on distinct
+        endpoints concurrently, so a blocking read never delays display
+        writes or control transfers.
+
         @return maxLen Maximum number of bytes to read.
+        @param timeout Milliseconds to wait for a packet.
         @return Read data or empty list.
 
         '''
-        self.__usbDeviceMutex.acquire()
         val = []
         try:
             val = list(self.__usbDevice.handleIf1.interruptRead(
-                0x83, maxLen, 10))
+                0x83, maxLen, timeout))
         except usb.USBError:
             pass
-        finally:
-            self.__usbDeviceMutex.release()
         return val
 
-    def read_display_menu_keys(self):
+    def read_display_menu_keys(self, timeout=10):
         '''Reads interrupt data from display keys.
 
+        Does not take the device lock, see read_g_and_m_keys().
+
+        @param timeout Milliseconds to wait for a packet.
         @return Read data or empty list.
 
         '''
-        self.__usbDeviceMutex.acquire()
         val = []
         try:
-            val = list(self.__usbDevice.handleIf0.interruptRead(0x81, 2, 10))
+            val = list(self.__usbDevice.handleIf0.interruptRead(0x81, 2, timeout))
         except usb.USBError:
             pass
-        finally:
-            self.__usbDeviceMutex.release()
         return val
 
     def read_multimedia_keys(self):
@@ -100,14 +168,56 @@ class G19(object):
         '''
         rtype = usb.TYPE_CLASS | usb.RECIP_INTERFACE
         colorData = [7, r, g, b]
-        self.__usbDeviceMutex.acquire()
-        try:
-            self.__usbDevice.handleIf1.controlMsg(
-                rtype, 0x09, colorData, 0x308, 0x01, 1000)
-        finally:
-            self.__usbDeviceMutex.release()
+        self.__control_msg('default_bg_color', rtype, 0x09, colorData, 0x308, 0x01, 1000)
 
-    def send_frame(self, data):
+    def __control_msg(self, kind, requestType, request, buffer, value, index, timeout):
+        '''Runs a control transfer on interface 1.
+
+        If the command scheduler is running, the transfer is queued there and
+        replaces a pending one of the same kind.  Otherwise it is done right
+        away.
+
+        '''
+        def command():
+            self.__usbDeviceMutex.acquire()
+            try:
+                self.__usbDevice.handleIf1.controlMsg(
+                    requestType, request, buffer, value, index, timeout)
+            finally:
+                self.__usbDeviceMutex.release()
+
+        scheduler = self.__scheduler
+        if scheduler:
+            scheduler.submit_control(kind, command)
+        else:
+            command()
+
+    def get_frame_stats(self):
+        '''Returns counters of frames sent to and skipped for display.
+
+        @return Dict with keys 'sent', 'skipped', 'partial' (frames sent as
+        window) and 'bytes' (written to the device), plus the ones of
+        G19CommandScheduler.get_stats() if the scheduler is running.
+
+        '''
+        stats = {'sent': self.__framesSent, 'skipped': self.__framesSkipped,
+                 'partial': self.__framesPartial, 'bytes': self.__bytesWritten}
+        scheduler = self.__scheduler
+        if scheduler:
+            stats.update(scheduler.get_stats())
+        return stats
+
+    def get_frame_backlog(self):
+        '''Returns number of frames waiting for or on the wire, 0 without the
+        scheduler.
+
+        '''
+        scheduler = self.__scheduler
+        if scheduler:
+            return scheduler.get_queue_depth()
+        return 0
+
+    def send_frame(self, data, checksum=None, damage=None):
         '''Sends a frame to display.
 
         @param data 320x240x2 bytes, containing the frame in little-endian
@@ -115,34 +225,107 @@ class G19(object):
         Image must be row-wise, starting at upper left corner and ending at
         lower right.  This means (data[0], data[1]) is the first pixel and
         (data[239 * 2], data[239 * 2 + 1]) the lower left one.
+        Any object supporting the buffer protocol is accepted.  It may also
+        already hold the 512 bytes preamble.  A libcdraw.Frame is packed by
+        itself, see libcdraw.Frame.pack().
+        @param checksum Fingerprint of data.  If it matches the one of the
+        previous frame, the transfer is skipped unless the keep-alive period
+        has expired.  None forces the transfer.
+        @param damage (x, y, width, height) bounding everything changed since
+        the previous call, e.g. from libcdraw.Frame.get_damage().  If data is
+        a libcdraw.Frame and damage is small, only this window is sent.  None
+        sends the whole frame.
+        @return True if frame was transferred, False if skipped.
 
         '''
-        if len(data) != (320 * 240 * 2):
-            raise ValueError("illegal frame size: " + str(len(data))
-                    + " should be 320x240x2=" + str(320 * 240 * 2))
+        if hasattr(data, 'pack'):
+            source = data
+        else:
+            view = memoryview(data).cast('B')
+            if len(view) == len(self.__frameBuffer):
+                source = view[len(self.__framePreambule):]
+            elif len(view) == (320 * 240 * 2):
+                source = view
+            else:
+                raise ValueError("illegal frame size: " + str(len(view))
+                        + " should be 320x240x2=" + str(320 * 240 * 2))
+            damage = None
+
+        now = time.monotonic()
+        with self.__frameMutex:
+            if checksum is not None and checksum == self.__lastFrameChecksum and \
+                    now - self.__lastFrameTime < self.__frameKeepAlive:
+                self.__framesSkipped += 1
+                return False
+            self.__lastFrameChecksum = checksum
+            self.__lastFrameTime = now
+            self.__framesSent += 1
+            window = None
+            if damage is not None and self.__partialUpdates and \
+                    not self.__fullFrameNeeded and \
+                    0 < damage[2] * damage[3] <= self.WINDOW_MAX_AREA:
+                window = tuple(damage)
+                self.__framesPartial += 1
+            self.__fullFrameNeeded = False
+
+        scheduler = self.__scheduler
+        if scheduler:
+            scheduler.submit_frame(source, window)
+            return True
+
+        self.__usbDeviceMutex.acquire()
+        try:
+            length = stage_frame(self.__frameBuffer, self.__framePreambule, source, window)
+            self.__write_packet(self.__frameBuffer, length)
+        finally:
+            self.__usbDeviceMutex.release()
+        return True
+
+    def _write_frame(self, frame, length=None):
+        '''Writes a frame packet (preamble included) to display.
 
-        frame = self.__framePreambule + data
+        @param frame array('B') holding the packet.
+        @param length Size of the packet if it does not fill frame.
 
+        '''
         self.__usbDeviceMutex.acquire()
         try:
-            self.__usbDevice.handleIf0.bulkWrite(2, frame, 1000)
-        except usb.USBError as err:
-            print("USB error({0}): {1}".format(err.errno, err.strerror))
+            self.__write_packet(frame, length)
         finally:
             self.__usbDeviceMutex.release()
 
+    def __write_packet(self, packet, length):
+        '''Writes a frame packet.  __usbDeviceMutex must be held.
+
+        After a failure the next frame is sent in full.  If the device stalls
+        on a window, partial updates are turned off for good.
+
+        '''
+        if length is not None and length < len(packet):
+            # Slicing array('B') copies just the window; pyusb would convert
+            # a memoryview element by element
+            packet = packet[:length]
+        try:
+            self.__usbDevice.handleIf0.bulkWrite(2, packet, 1000)
+            self.__bytesWritten += len(packet)
+        except usb.USBError as err:
+            print("USB error({0}): {1}".format(err.errno, err.strerror))
+            with self.__frameMutex:
+                self.__fullFrameNeeded = True
+                self.__lastFrameChecksum = None
+                if err.errno == errno.EPIPE and len(packet) < len(self.__frameBuffer) \
+                        and self.__partialUpdates:
+                    print("Display rejected partial update, sending full frames")
+                    self.__partialUpdates = False
+
     def set_bg_color(self, r, g, b):
         '''Sets backlight to given color.'''
         rtype = usb.TYPE_CLASS | usb.RECIP_INTERFACE
         colorData = [7, int(r), int(g), int(b)]
-        self.__usbDeviceMutex.acquire()
         try:
-            self.__usbDevice.handleIf1.controlMsg(
-                rtype, 0x09, bytes(colorData), 0x307, 0x01, 10)
+            self.__control_msg('bg_color', rtype, 0x09, bytes(colorData), 0x307, 0x01, 10)
         except usb.core.USBTimeoutError as err:
             print(err)
-        finally:
-            self.__usbDeviceMutex.release()
 
     def set_enabled_m_keys(self, keys):
         '''Sets currently lit keys as an OR-combination of LIGHT_KEY_M1..3,R.
@@ -154,12 +337,7 @@ class G19(object):
 
         '''
         rtype = usb.TYPE_CLASS | usb.RECIP_INTERFACE
-        self.__usbDeviceMutex.acquire()
-        try:
-            self.__usbDevice.handleIf1.controlMsg(
-                rtype, 0x09, [5, keys], 0x305, 0x01, 10)
-        finally:
-            self.__usbDeviceMutex.release()
+        self.__control_msg('m_keys', rtype, 0x09, [5, keys], 0x305, 0x01, 10)
 
     def set_display_brightness(self, val):
         '''Sets display brightness.
@@ -169,11 +347,7 @@ class G19(object):
         '''
         data = [val, 0xe2, 0x12, 0x00, 0x8c, 0x11, 0x00, 0x10, 0x00]
         rtype = usb.TYPE_VENDOR | usb.RECIP_INTERFACE
-        self.__usbDeviceMutex.acquire()
-        try:
-            self.__usbDevice.handleIf1.controlMsg(rtype, 0x0a, data, 0x0, 0x0)
-        finally:
-            self.__usbDeviceMutex.release()
+        self.__control_msg('display_brightness', rtype, 0x0a, data, 0x0, 0x0, 100)
 
     def start_event_handling(self):
         '''Start event processing (aka keyboard driver).
@@ -182,10 +356,7 @@ class G19(object):
 
         '''
         self.stop_event_handling()
-        self.__threadDisplay = threading.Thread(
-                target=self.__keyReceiver.run)
         self.__keyReceiver.start()
-        self.__threadDisplay.start()
 
     def stop_event_handling(self):
         '''Stops event processing (aka keyboard driver).
@@ -194,9 +365,222 @@ class G19(object):
 
         '''
         self.__keyReceiver.stop()
-        if self.__threadDisplay:
-            self.__threadDisplay.join()
-            self.__threadDisplay = None
+
+    def start_command_scheduler(self, depth=3):
+        '''Start running USB transfers on a dedicated thread.
+
+        Control transfers and send_frame() return as soon as the transfer is
+        queued, so rendering continues while the previous frame is on the
+        wire, and control transfers never wait behind more than one frame.
+
+        This method is NOT thread-safe.
+
+        @param depth Number of frame buffers; one on the wire, the rest
+        waiting.
+
+        '''
+        self.stop_command_scheduler()
+        scheduler = G19CommandScheduler(self._write_frame, self.__framePreambule, depth)
+        scheduler.start()
+        self.__threadScheduler = threading.Thread(target=scheduler.run,
+                                                  name='G19 command scheduler')
+        self.__threadScheduler.start()
+        self.__scheduler = scheduler
+
+    def stop_command_scheduler(self):
+        '''Stops running USB transfers on a dedicated thread.  Pending
+        control transfers are done, waiting frames are dropped, later
+        transfers are done synchronously.
+
+        This method is NOT thread-safe.
+
+        '''
+        scheduler = self.__scheduler
+        self.__scheduler = None
+        if scheduler:
+            scheduler.stop()
+            self.__threadScheduler.join()
+            self.__threadScheduler = None
+
+
+class G19CommandScheduler(Runnable):
+    '''Runs USB transfers of one device on its own thread.
+
+    Control transfers take priority over display frames.  A pending control
+    transfer is replaced by a newer one of the same kind, so only the latest
+    backlight or LED value reaches the device.
+
+    Frames are staged into a few preallocated transfer buffers, which pyusb
+    passes to libusb without copying.  While one buffer is on the wire the
+    others take new frames; when all of them are busy the oldest waiting
+    frame is dropped in favour of the new one, which then also updates the
+    window of the dropped one.
+
+    '''
+
+    def __init__(self, write, preamble, depth=3):
+        '''Creates a scheduler.
+
+        @param write Callable writing a complete frame packet to the device.
+        @param preamble Bytes put in front of every frame.
+        @param depth Number of frame buffers, at least 2.
+
+        '''
+        Runnable.__init__(self)
+        self.__write = write
+        self.__preamble = preamble
+        self.__free = [array.array('B', preamble + bytes(320 * 240 * 2))
+                       for i in range(max(depth, 2))]
+        self.__pending = collections.deque()
+        self.__controls = {}
+        self.__cond = threading.Condition()
+        self.__inFlight = 0
+        self.__dropped = 0
+        self.__superseded = 0
+        self.__latency = LatencyStats()
+        self.__controlLatency = {}
+
+    def submit_control(self, kind, command):
+        '''Queues a control transfer.  Returns without waiting for it.
+
+        @param kind Type of the command.  A pending command of the same type
+        is discarded.
+        @param command Callable doing the transfer.
+
+        '''
+        with self.__cond:
+            if kind in self.__controls:
+                self.__superseded += 1
+            self.__controls[kind] = (command, time.monotonic())
+            self.__cond.notify()
+
+    def submit_frame(self, frame, window=None):
+        '''Queues a frame.  Returns without waiting for the transfer.
+
+        @param frame libcdraw.Frame or buffer holding 320x240x2 bytes of
+        frame.
+        @param window (x, y, width, height) to update, see stage_frame().
+        None updates the whole display.
+
+        '''
+        with self.__cond:
+            if self.__free:
+                buf = self.__free.pop()
+            else:
+                buf, length, dropped, queued = self.__pending.popleft()
+                self.__dropped += 1
+                window = union_window(window, dropped)
+            length = stage_frame(buf, self.__preamble, frame, window)
+            self.__pending.append((buf, length, window, time.monotonic()))
+            self.__cond.notify()
+
+    def execute(self):
+        with self.__cond:
+            if not self.__controls and not self.__pending:
+                self.__cond.wait(0.1)
+            if self.__controls:
+                kind = next(iter(self.__controls))
+                command, queued = self.__controls.pop(kind)
+                latency = self.__controlLatency.get(kind)
+                if not latency:
+                    latency = self.__controlLatency[kind] = LatencyStats()
+            elif self.__pending:
+                buf, length, window, queued = self.__pending.popleft()
+                self.__inFlight = 1
+                command = None
+            else:
+                return
+
+        if command:
+            try:
+                command()
+            except usb.USBError as err:
+                print("USB error({0}): {1}".format(err.errno, err.strerror))
+            latency.add(time.monotonic() - queued)
+            return
+
+        self.__write(buf, length)
+        self.__latency.add(time.monotonic() - queued)
+
+        with self.__cond:
+            self.__inFlight = 0
+            self.__free.append(buf)
+
+    def run(self):
+        Runnable.run(self)
+        # Do not lose the last backlight or LED change on shutdown
+        with self.__cond:
+            controls = list(self.__controls.values())
+            self.__controls.clear()
+        for command, queued in controls:
+            try:
+                command()
+            except usb.USBError as err:
+                print("USB error({0}): {1}".format(err.errno, err.strerror))
+
+    def stop(self):
+        Runnable.stop(self)
+        with self.__cond:
+            self.__cond.notify_all()
+
+    def get_queue_depth(self):
+        '''Returns number of frames waiting and on the wire.'''
+        with self.__cond:
+            return len(self.__pending) + self.__inFlight
+
+    def get_stats(self):
+        '''Returns a dict with current frame queue depth (frames waiting and
+        on the wire), number of dropped frames, number of superseded control
+        transfers, frame transfer latency summary (from submit_frame() to
+        completed write, see LatencyStats.get_summary()) and a dict of such
+        summaries per kind of control transfer.
+
+        '''
+        with self.__cond:
+            depth = len(self.__pending) + self.__inFlight
+            dropped = self.__dropped
+            superseded = self.__superseded
+            controlLatency = dict(self.__controlLatency)
+        return {'queue_depth': depth,
+                'dropped': dropped,
+                'superseded': superseded,
+                'latency': self.__latency.get_summary(),
+                'control_latency': dict((kind, stats.get_summary())
+                                        for kind, stats in controlLatency.items())}
+
+
+def stage_frame(packet, preamble, frame, window=None):
+    '''Puts a frame packet into a transfer buffer.
+
+    @param packet array('B') of len(preamble) + 320x240x2 bytes.
+    @param preamble Bytes of full frame preamble.
+    @param frame libcdraw.Frame or buffer holding 320x240x2 bytes of frame.
+    @param window (x, y, width, height) to update, only for libcdraw.Frame.
+    None updates the whole display.
+    @return Size of the packet at the start of packet.
+
+    '''
+    if hasattr(frame, 'pack'):
+        if window is None:
+            window = (0, 0, 320, 240)
+        return frame.pack(packet, *window)
+    view = memoryview(packet)
+    view[:len(preamble)] = preamble
+    view[len(preamble):] = frame
+    return len(packet)
+
+
+def union_window(first, second):
+    '''Returns (x, y, width, height) bounding both windows, None (the whole
+    display) if any of them is None.
+
+    '''
+    if first is None or second is None:
+        return None
+    x = min(first[0], second[0])
+    y = min(first[1], second[1])
+    return (x, y, max(first[0] + first[2], second[0] + second[2]) - x,
+            max(first[1] + first[3], second[1] + second[3]) - y)
 
 
 class G19UsbController(object):
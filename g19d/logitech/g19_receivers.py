@@ -1,8 +1,11 @@
 from g19d.logitech.g19_keys import (Data, Key)
+from g19d.logitech.latency import LatencyStages
 from g19d.logitech.runnable import Runnable
 
+import collections
 import threading
 import time
+import traceback
 
 class InputProcessor(object):
     '''Object to process key presses.'''
@@ -20,209 +23,385 @@ class InputProcessor(object):
         return False
 
 
+def _keys_of_mask(mask):
+    '''Returns keys set in a key bitmask, lowest key first.'''
+    keys = []
+    while mask:
+        low = mask & -mask
+        keys.append(low.bit_length() - 1)
+        mask ^= low
+    return keys
+
+
+def _mask_of_keys(keys):
+    '''Returns bitmask of given keys.'''
+    mask = 0
+    for key in keys:
+        mask |= 1 << key
+    return mask
+
+
+def _byte_table(codes, shift=0, marker=0):
+    '''Builds a table mapping every value of one packet byte to the bitmask
+    of keys it encodes.
+
+    @param codes Dict of key codes to keys, like Data.gmKeys.
+    @param shift Position of the byte in the code, in bits.
+    @param marker Bits (already shifted) that must be set in the byte and do
+    not encode a key.
+    @return List of 256 bitmasks, None for values with unknown bits.
+
+    '''
+    table = []
+    for byte in range(256):
+        value = byte << shift
+        if value & marker != marker:
+            table.append(None)
+            continue
+        value ^= marker
+        mask = 0
+        for code, key in codes.items():
+            if code & value == code:
+                value ^= code
+                mask |= 1 << key
+        table.append(None if value else mask)
+    return table
+
+
+_DISPLAY_TABLE = _byte_table(Data.displayKeys)
+_G_AND_M_TABLES = (_byte_table(Data.gmKeys, 0),
+                   _byte_table(Data.gmKeys, 8),
+                   _byte_table(Data.gmKeys, 16, 0x400000))
+_MM_TABLE = _byte_table(Data.mmKeys)
+
+_DISPLAY_MASK = _mask_of_keys(Key.displayKeys)
+_G_AND_M_MASK = _mask_of_keys(Key.gmKeys)
+_WINKEY_MASK = 1 << Key.WINKEY_SWITCH
+_MM_MASK = _mask_of_keys(Key.mmKeys) & ~_WINKEY_MASK
+
+
 class InputEvent(object):
-    '''Event created by a key press or release.'''
+    '''Event created by a key press or release.
+
+    Keys are kept as bitmasks (bit n set for key n); set views are built on
+    first access only.
+
+    '''
+
+    __slots__ = ('oldMask', 'newMask', 'pressed', 'released', 'timestamp',
+                 'dispatched', '_keysDown', '_keysUp')
 
-    def __init__(self, oldState, newState, keysDown, keysUp):
+    def __init__(self, oldMask, newMask, timestamp=None):
         '''Creates an InputEvent.
 
-        @param oldState State before event happened.
-        @param newState State after event happened.
-        @param keysDown Keys newly pressed.
-        @param keysUp Kys released by this event.
+        @param oldMask Bitmask of keys held before event happened.
+        @param newMask Bitmask of keys held after event happened.
+        @param timestamp time.monotonic() of packet arrival, now if None.
 
         '''
-        self.oldState = oldState
-        self.newState = newState
-        self.keysDown = keysDown
-        self.keysUp = keysUp
+        self.oldMask = oldMask
+        self.newMask = newMask
+        self.pressed = newMask & ~oldMask
+        self.released = oldMask & ~newMask
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        # time.monotonic() when handed to input processors
+        self.dispatched = None
+        self._keysDown = None
+        self._keysUp = None
+
+    def is_pressed(self, key):
+        '''Returns whether key was newly pressed by this event.'''
+        return self.pressed >> key & 1 == 1
+
+    def is_released(self, key):
+        '''Returns whether key was released by this event.'''
+        return self.released >> key & 1 == 1
+
+    @property
+    def keysDown(self):
+        '''Keys newly pressed.'''
+        if self._keysDown is None:
+            self._keysDown = frozenset(_keys_of_mask(self.pressed))
+        return self._keysDown
+
+    @property
+    def keysUp(self):
+        '''Keys released by this event.'''
+        if self._keysUp is None:
+            self._keysUp = frozenset(_keys_of_mask(self.released))
+        return self._keysUp
+
+    @property
+    def oldState(self):
+        '''State before event happened.'''
+        return State(self.oldMask)
+
+    @property
+    def newState(self):
+        '''State after event happened.'''
+        return State(self.newMask)
 
 
 class State(object):
-    '''Current state of keyboard.'''
+    '''Current state of keyboard, kept as a bitmask of held keys.'''
 
-    def __init__(self):
-        self.__keysDown = set()
+    __slots__ = ('mask',)
 
-    def _data_to_keys_display(self, data):
-        '''Converts a G/M keys data package to a set of keys defined as
-        pressed by it.
+    def __init__(self, mask=0):
+        self.mask = mask
+
+    def get_keys_down(self):
+        '''Returns set of held keys.'''
+        return set(_keys_of_mask(self.mask))
+
+    def is_down(self, key):
+        '''Returns whether key is held.'''
+        return self.mask >> key & 1 == 1
+
+    def _data_to_mask_display(self, data):
+        '''Converts a display keys data package to a bitmask of keys defined
+        as pressed by it.
 
         '''
-        #print(data)
         if len(data) != 2:
             raise ValueError("not a multimedia key packet: " + str(data))
-        empty = 0x400000
-        curVal = data[0]
-        keys = []
-        while curVal:
-            foundAKey = False
-            for val in Data.displayKeys.keys():
-                if val & curVal == val:
-                    curVal ^= val
-                    keys.append(Data.displayKeys[val])
-                    foundAKey = True
-            if not foundAKey:
-                raise ValueError("incorrect multimedia key packet: " +
-                        str(data))
-
-        #print(keys)
-        return set(keys)
+        return _DISPLAY_TABLE[data[0]]
 
-    def _data_to_keys_g_and_m(self, data):
-        '''Converts a G/M keys data package to a set of keys defined as
+    def _data_to_mask_g_and_m(self, data):
+        '''Converts a G/M keys data package to a bitmask of keys defined as
         pressed by it.
 
         '''
         if len(data) != 4 or data[0] != 2:
             raise ValueError("not a multimedia key packet: " + str(data))
-        empty = 0x400000
-        curVal = data[3] << 16 | data[2] << 8 | data[1]
-        keys = []
-        while curVal != empty:
-            foundAKey = False
-            for val in Data.gmKeys.keys():
-                if val & curVal == val:
-                    curVal ^= val
-                    keys.append(Data.gmKeys[val])
-                    foundAKey = True
-            if not foundAKey:
-                raise ValueError("incorrect g/m key packet: " +
-                        str(data))
+        low, mid, high = _G_AND_M_TABLES
+        try:
+            return low[data[1]] | mid[data[2]] | high[data[3]]
+        except TypeError:
+            raise ValueError("incorrect g/m key packet: " + str(data))
 
-        return set(keys)
-
-    def _data_to_keys_mm(self, data):
-        '''Converts a multimedia keys data package to a set of keys defined as
-        pressed by it.
+    def _data_to_mask_mm(self, data):
+        '''Converts a multimedia keys data package to a bitmask of keys
+        defined as pressed by it.
 
         '''
         if len(data) != 2 or data[0] not in [1, 3]:
             raise ValueError("not a multimedia key packet: " + str(data))
         if data[0] == 1:
-            curVal = data[1]
-            keys = []
-            while curVal:
-                foundAKey = False
-                for val in Data.mmKeys.keys():
-                    if val & curVal == val:
-                        curVal ^= val
-                        keys.append(Data.mmKeys[val])
-                        foundAKey = True
-                if not foundAKey:
-                    raise ValueError("incorrect multimedia key packet: " +
-                            str(data))
-        elif data == [3, 1]:
-            keys = [Key.WINKEY_SWITCH]
-        elif data == [3, 0]:
-            keys = []
+            mask = _MM_TABLE[data[1]]
+            if mask is None:
+                raise ValueError("incorrect multimedia key packet: " +
+                        str(data))
+        elif data[1] == 1:
+            mask = _WINKEY_MASK
+        elif data[1] == 0:
+            mask = 0
         else:
             raise ValueError("incorrect multimedia key packet: " + str(data))
+        return mask
 
-        return set(keys)
-
-    def _update_keys_down(self, possibleKeys, keys):
-        '''Updates internal keysDown set.
-
-        Updates the current state of all keys in 'possibleKeys' with state
-        given in 'keys'.
+    def _update_mask(self, possibleMask, mask, timestamp):
+        '''Updates state of all keys in possibleMask with state given in
+        mask.
 
-        Example:
-        Currently set as pressed in self.__keysDown: [A, B]
-        possibleKeys: [B, C, D]
-        keys: [C]
-
-        This would set self.__keysDown to [A, C] and return ([C], [B])
-
-        @param possibleKeys Keys whose state could be given as 'pressed' at the
-        same time by 'keys'.
-        @param keys Current state of all keys in possibleKeys.
-        @return A pair of sets listing newly pressed and newly released keys.
+        @return InputEvent describing the change.
 
         '''
-        keysDown = set()
-        keysUp = set()
-        for key in possibleKeys:
-            if key in keys:
-                if key not in self.__keysDown:
-                    self.__keysDown.add(key)
-                    keysDown.add(key)
-            else:
-                if key in self.__keysDown:
-                    self.__keysDown.remove(key)
-                    keysUp.add(key)
-        return (keysDown, keysUp)
+        oldMask = self.mask
+        self.mask = (oldMask & ~possibleMask) | (mask & possibleMask)
+        return InputEvent(oldMask, self.mask, timestamp)
 
     def clone(self):
         '''Returns an exact copy of this state.'''
-        state = State()
-        state.__keysDown = set(self.__keysDown)
-        return state
+        return State(self.mask)
 
-    def packet_received_display(self, data):
-        '''Mutates the state by given data packet from G- and M- keys.
+    def packet_received_display(self, data, timestamp=None):
+        '''Mutates the state by given data packet from display keys.
 
         @param data Data packet received.
+        @param timestamp time.monotonic() of packet arrival.
         @return InputEvent for data packet, or None if data packet was ignored.
 
         '''
-        oldState = self.clone()
-        evt = None
-        if len(data) == 2:
-            keys = self._data_to_keys_display(data)
-            keysDown, keysUp = self._update_keys_down(Key.displayKeys, keys)
-            newState = self.clone()
-            evt = InputEvent(oldState, newState, keysDown, keysUp)
-        return evt
-
-    def packet_received_g_and_m(self, data):
+        if len(data) != 2:
+            return None
+        mask = self._data_to_mask_display(data)
+        return self._update_mask(_DISPLAY_MASK, mask, timestamp)
+
+    def packet_received_g_and_m(self, data, timestamp=None):
         '''Mutates the state by given data packet from G- and M- keys.
 
         @param data Data packet received.
+        @param timestamp time.monotonic() of packet arrival.
         @return InputEvent for data packet, or None if data packet was ignored.
 
         '''
-        oldState = self.clone()
-        evt = None
-        if len(data) == 4:
-            keys = self._data_to_keys_g_and_m(data)
-            keysDown, keysUp = self._update_keys_down(Key.gmKeys, keys)
-            newState = self.clone()
-            evt = InputEvent(oldState, newState, keysDown, keysUp)
-        return evt
-
-    def packet_received_mm(self, data):
+        if len(data) != 4:
+            return None
+        mask = self._data_to_mask_g_and_m(data)
+        return self._update_mask(_G_AND_M_MASK, mask, timestamp)
+
+    def packet_received_mm(self, data, timestamp=None):
         '''Mutates the state by given data packet from multimedia keys.
 
         @param data Data packet received.
+        @param timestamp time.monotonic() of packet arrival.
         @return InputEvent for data packet.
 
         '''
-        oldState = self.clone()
         if len(data) != 2:
             raise ValueError("incorrect multimedia key packet: " + str(data))
-        keys = self._data_to_keys_mm(data)
-        winKeySet = set([Key.WINKEY_SWITCH])
+        mask = self._data_to_mask_mm(data)
         if data[0] == 1:
             # update state of all mm keys
-            possibleKeys = Key.mmKeys.difference(winKeySet)
-            keysDown, keysUp = self._update_keys_down(possibleKeys, keys)
-        else:
-            # update winkey state
-            keysDown, keysUp = self._update_keys_down(winKeySet, keys)
-        newState = self.clone()
-        return InputEvent(oldState, newState, keysDown, keysUp)
+            return self._update_mask(_MM_MASK, mask, timestamp)
+        # update winkey state
+        return self._update_mask(_WINKEY_MASK, mask, timestamp)
+
+
+class EndpointReader(Runnable):
+    '''Keeps one interrupt read outstanding on an endpoint and hands every
+    packet over the moment it arrives.
+
+    '''
+
+    def __init__(self, read, deliver, timeout=200):
+        '''Creates a reader.
+
+        @param read Callable taking a timeout in milliseconds and returning a
+        packet or an empty list, e.g. G19.read_display_menu_keys.
+        @param deliver Callable taking a packet and time.monotonic() of its
+        arrival.
+        @param timeout Milliseconds a read blocks.  Bounds the time stop()
+        takes, not the key latency.
+
+        '''
+        Runnable.__init__(self)
+        self.__read = read
+        self.__deliver = deliver
+        self.__timeout = timeout
+
+    def execute(self):
+        start = time.monotonic()
+        data = self.__read(self.__timeout)
+        now = time.monotonic()
+        if data:
+            self.__deliver(data, now)
+        elif now - start < self.__timeout / 2000.0:
+            # Read failed without waiting (e.g. device is gone), do not spin
+            time.sleep(self.__timeout / 1000.0)
+
+
+class InputDispatcher(Runnable):
+    '''Bounded queue of InputEvents handed to input processors on a worker
+    thread, so slow processors never hold up reading the endpoints.
+
+    Events are dispatched strictly in the order they were queued.  When the
+    queue is full, a new event is merged into the last queued one (keys go
+    from the older event's old state straight to the new event's new state),
+    so no key is left pressed or released twice; only a press and release
+    falling into the same merge is lost.
+
+    '''
 
+    def __init__(self, listProcessors, capacity=64, latency=None):
+        '''Creates a dispatcher.
 
-class G19Receiver(Runnable):
-    '''This receiver consumes all data sent by special keys.'''
+        @param listProcessors Callable returning processors to offer events
+        to, in order, until one consumes the event.
+        @param capacity Maximum number of queued events.
+        @param latency LatencyStages receiving stages 'dispatch' (packet
+        arrival to dispatch) and 'processed' (packet arrival to all
+        processors done).
 
-    def __init__(self, g19):
+        '''
         Runnable.__init__(self)
+        self.__listProcessors = listProcessors
+        self.__capacity = capacity
+        self.__queue = collections.deque()
+        self.__cond = threading.Condition()
+        self.__overflows = 0
+        self.__maxDepth = 0
+        self.__latency = latency if latency else LatencyStages()
+
+    def put(self, evt):
+        '''Queues an event.  Never blocks.'''
+        with self.__cond:
+            if len(self.__queue) >= self.__capacity:
+                last = self.__queue[-1]
+                self.__queue[-1] = InputEvent(last.oldMask, evt.newMask, last.timestamp)
+                self.__overflows += 1
+            else:
+                self.__queue.append(evt)
+                self.__maxDepth = max(self.__maxDepth, len(self.__queue))
+            self.__cond.notify()
+
+    def execute(self):
+        with self.__cond:
+            if not self.__queue:
+                self.__cond.wait(0.1)
+                if not self.__queue:
+                    return
+            evt = self.__queue.popleft()
+
+        evt.dispatched = time.monotonic()
+        self.__latency.add('dispatch', evt.dispatched - evt.timestamp)
+        try:
+            for proc in self.__listProcessors():
+                if proc.process_input(evt):
+                    break
+        except Exception:
+            traceback.print_exc()
+        self.__latency.add('processed', time.monotonic() - evt.timestamp)
+
+    def stop(self):
+        Runnable.stop(self)
+        with self.__cond:
+            self.__cond.notify_all()
+
+    def get_stats(self):
+        '''Returns a dict with current and maximal queue depth, number of
+        events merged on overflow and summary of lag between packet arrival
+        and dispatch (see LatencyStats.get_summary()).
+
+        '''
+        with self.__cond:
+            stats = {'queue_depth': len(self.__queue),
+                     'max_queue_depth': self.__maxDepth,
+                     'overflows': self.__overflows}
+        stats['lag'] = self.__latency.get('dispatch').get_summary()
+        return stats
+
+
+class G19Receiver(object):
+    '''This receiver consumes all data sent by special keys.
+
+    Every endpoint is read on its own thread and packets are decoded as soon
+    as they arrive.  Resulting events are handed to input processors by an
+    InputDispatcher on another thread.
+
+    '''
+
+    def __init__(self, g19, latency=None):
+        '''Creates a receiver.
+
+        @param g19 G19 to read.
+        @param latency LatencyStages for InputDispatcher.
+
+        '''
         self.__g19 = g19
         self.__ips = []
         self.__mutex = threading.Lock()
+        self.__stateMutex = threading.Lock()
         self.__state = State()
+        self.__dispatcher = InputDispatcher(self.list_all_input_processors,
+                                            latency=latency)
+        self.__readers = [
+            EndpointReader(lambda timeout: g19.read_g_and_m_keys(timeout=timeout),
+                           self.__g_and_m_received),
+            EndpointReader(g19.read_display_menu_keys, self.__display_received),
+        ]
+        self.__threads = []
 
     def add_input_processor(self, processor):
         '''Adds an input processor.'''
@@ -231,46 +410,56 @@ class G19Receiver(Runnable):
         self.__mutex.release()
         pass
 
-    def execute(self):
-        gotData = False
-        processors = self.list_all_input_processors()
-
-        # data = self.__g19.read_multimedia_keys()
-        # if data:
-        #     evt = self.__state.packet_received_mm(data)
-        #     if evt:
-        #         for proc in processors:
-        #             if proc.process_input(evt):
-        #                 break
-        #     else:
-        #         print "mm ignored: ", data
-        #     gotData = True
-
-        data = self.__g19.read_g_and_m_keys()
-        if data:
-            evt = self.__state.packet_received_g_and_m(data)
+    def start(self):
+        '''Starts reading all endpoints and dispatching events.
+
+        This method is NOT thread-safe.
+
+        '''
+        self.stop()
+        for runnable, name in [(self.__dispatcher, 'G19 input dispatcher')] + \
+                [(reader, 'G19 key reader') for reader in self.__readers]:
+            runnable.start()
+            thread = threading.Thread(target=runnable.run, name=name)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self):
+        '''Stops reading and dispatching and waits for the threads.
+
+        This method is NOT thread-safe.
+
+        '''
+        for reader in self.__readers:
+            reader.stop()
+        self.__dispatcher.stop()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def get_stats(self):
+        '''Returns InputDispatcher.get_stats().'''
+        return self.__dispatcher.get_stats()
+
+    def __g_and_m_received(self, data, timestamp):
+        # Events are queued under the state lock, so their order matches the
+        # order of state changes
+        self.__stateMutex.acquire()
+        try:
+            evt = self.__state.packet_received_g_and_m(data, timestamp)
             if evt:
-                for proc in processors:
-                    if proc.process_input(evt):
-                        break
-            #else:
-            #    print("m/g ignored: ", data)
-            gotData = True
-
-        data = self.__g19.read_display_menu_keys()
-        if data:
-            evt = self.__state.packet_received_display(data)
+                self.__dispatcher.put(evt)
+        finally:
+            self.__stateMutex.release()
+
+    def __display_received(self, data, timestamp):
+        self.__stateMutex.acquire()
+        try:
+            evt = self.__state.packet_received_display(data, timestamp)
             if evt:
-                for proc in processors:
-                    if proc.process_input(evt):
-                        break
-            #else:
-            #    print("m/g ignored: ", data)
-            #print("dis: ", data)
-            gotData = True
-
-        if not gotData:
-            time.sleep(0.03)
+                self.__dispatcher.put(evt)
+        finally:
+            self.__stateMutex.release()
 
     def list_all_input_processors(self):
         '''Returns a list of all input processors currently registered to this
@@ -284,3 +473,31 @@ class G19Receiver(Runnable):
         allProcessors = list(self.__ips)
         self.__mutex.release()
         return allProcessors
+
+
+def main():
+    '''Micro-benchmark of key decoding over a synthetic packet stream.'''
+    import random
+    import timeit
+
+    random.seed(0)
+    packets = []
+    for i in range(20000):
+        packets.append(('g', [0x02, random.randint(0, 255), random.randint(0, 255),
+                              random.choice([0x40, 0x48])]))
+        packets.append(('d', [random.randint(0, 255), 0x80]))
+
+    state = State()
+    def decode():
+        for kind, data in packets:
+            if kind == 'g':
+                evt = state.packet_received_g_and_m(data)
+            else:
+                evt = state.packet_received_display(data)
+            evt.pressed
+
+    elapsed = min(timeit.repeat(decode, number=1, repeat=5))
+    print("{0:.0f} packets/s".format(len(packets) / elapsed))
+
+if __name__ == '__main__':
+    main()
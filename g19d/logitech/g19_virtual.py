@@ -0,0 +1,307 @@
+from g19d.logitech.latency import LatencyStats
+
+import collections
+import errno
+import heapq
+import itertools
+import threading
+import time
+import usb
+
+class VirtualG19Controller(object):
+    '''Emulated G19 for running g19d without the keyboard.
+
+    Drop-in replacement for G19UsbController: handleIf0 and handleIf1 accept
+    the same legacy pyusb calls G19 makes.
+
+        * bulk writes to EP 0x02 are validated like the display does and the
+          decoded frame is kept (see get_frame_rgb565() and save_frame_png()),
+          packets updating a window of the display are applied to it
+        * control messages are recorded (see get_control_messages())
+        * interrupt reads on EP 0x81 (display keys) and EP 0x83 (G/M keys)
+          return packets injected with inject_key_packet() or play_script()
+
+    '''
+
+    WIDTH = 320
+    HEIGHT = 240
+    FRAME_SIZE = WIDTH * HEIGHT * 2
+    PREAMBLE = bytes([0x10, 0x0F, 0x00, 0x58, 0x02, 0x00, 0x00, 0x00,
+                      0x00, 0x00, 0x00, 0x3F, 0x01, 0xEF, 0x00, 0x0F] + \
+                     [ i for i in range(16, 256) ] + [ i for i in range(256) ])
+
+    def __init__(self, resetOnStart=False, bandwidth=None, history=1024, windows=True):
+        '''Creates an emulated device.
+
+        @param resetOnStart Ignored, kept for G19UsbController compatibility.
+        @param bandwidth Simulated bulk transfer speed in bytes per second, or
+        None for instant transfers.
+        @param history Number of control messages kept.
+        @param windows False to reject packets which do not update the whole
+        display, like a device not supporting them would.
+
+        '''
+        self.__bandwidth = bandwidth
+        self.__windows = windows
+        self.__cond = threading.Condition()
+        self.__frame = bytearray(self.FRAME_SIZE)
+        self.__frames = 0
+        self.__partial = 0
+        self.__bytes = 0
+        self.__rejected = 0
+        self.__controls = collections.deque(maxlen=history)
+        self.__packets = collections.defaultdict(list)
+        self.__sequence = itertools.count()
+        self.__writeLatency = LatencyStats()
+        self.handleIf0 = VirtualHandle(self)
+        self.handleIf1 = VirtualHandle(self)
+
+    def reset(self):
+        '''Resets the device: drops pending key packets.'''
+        with self.__cond:
+            self.__packets.clear()
+
+    def bulk_write(self, endpoint, data, timeout):
+        '''Handles a bulk write.
+
+        @return Number of bytes written.
+
+        '''
+        start = time.monotonic()
+        data = memoryview(data).cast('B')
+        if endpoint != 0x02:
+            raise usb.USBError("Invalid endpoint", errno=errno.EPIPE)
+        window = self.__parse_window(data)
+        if window is None:
+            with self.__cond:
+                self.__rejected += 1
+            raise usb.USBError("Invalid frame preamble", errno=errno.EPIPE)
+
+        if self.__bandwidth:
+            time.sleep(len(data) / self.__bandwidth)
+        x0, y0, x1, y1 = window
+        column = (y1 - y0 + 1) * 2
+        pixels = data[len(self.PREAMBLE):]
+        with self.__cond:
+            if column == self.HEIGHT * 2:
+                offset = x0 * self.HEIGHT * 2
+                self.__frame[offset:offset + column * (x1 - x0 + 1)] = \
+                    pixels[:column * (x1 - x0 + 1)]
+            else:
+                for x in range(x0, x1 + 1):
+                    offset = (x * self.HEIGHT + y0) * 2
+                    self.__frame[offset:offset + column] = pixels[:column]
+                    pixels = pixels[column:]
+            self.__frames += 1
+            self.__bytes += len(data)
+            if window != (0, 0, self.WIDTH - 1, self.HEIGHT - 1):
+                self.__partial += 1
+        self.__writeLatency.add(time.monotonic() - start)
+        return len(data)
+
+    def __parse_window(self, data):
+        '''Returns window (x0, y0, x1, y1) of a valid frame packet, None for
+        an invalid one.
+
+        The preamble is the one of a full frame except for the number of 256
+        byte blocks (bytes 3-4) and the inclusive window bounds (bytes 7-14),
+        pixels fill the window column by column.
+
+        '''
+        size = len(self.PREAMBLE)
+        if len(data) < size or data[:3] != self.PREAMBLE[:3] or \
+                data[5:7] != self.PREAMBLE[5:7] or data[15:size] != self.PREAMBLE[15:]:
+            return None
+        blocks = data[3] | data[4] << 8
+        window = tuple(data[i] | data[i + 1] << 8 for i in range(7, 15, 2))
+        x0, y0, x1, y1 = window
+        if not (x0 <= x1 < self.WIDTH and y0 <= y1 < self.HEIGHT):
+            return None
+        if len(data) != size + blocks * 256 or \
+                blocks * 256 < (x1 - x0 + 1) * (y1 - y0 + 1) * 2:
+            return None
+        if not self.__windows and window != (0, 0, self.WIDTH - 1, self.HEIGHT - 1):
+            return None
+        return window
+
+    def control_msg(self, requestType, request, buffer, value, index, timeout):
+        '''Records a control message.
+
+        @return Number of bytes written.
+
+        '''
+        with self.__cond:
+            self.__controls.append((time.monotonic(), requestType, request,
+                                    bytes(buffer), value, index))
+        return len(buffer)
+
+    def interrupt_read(self, endpoint, size, timeout):
+        '''Returns the next injected packet for endpoint, waiting for it at
+        most timeout milliseconds.
+
+        '''
+        deadline = time.monotonic() + timeout / 1000.0
+        with self.__cond:
+            packets = self.__packets[endpoint]
+            while True:
+                now = time.monotonic()
+                if packets and packets[0][0] <= now:
+                    return heapq.heappop(packets)[2][:size]
+                wakeup = deadline
+                if packets:
+                    wakeup = min(wakeup, packets[0][0])
+                if now >= deadline:
+                    raise usb.core.USBTimeoutError("Operation timed out",
+                                                   errno=errno.ETIMEDOUT)
+                self.__cond.wait(wakeup - now)
+
+    def inject_key_packet(self, endpoint, packet, delay=0):
+        '''Makes packet readable from endpoint.
+
+        @param endpoint 0x81 for display keys, 0x83 for G/M keys.
+        @param packet Raw packet, e.g. [0x02, 0x04, 0x00, 0x40] for G3.
+        @param delay Seconds before the packet arrives.
+
+        '''
+        with self.__cond:
+            heapq.heappush(self.__packets[endpoint], (time.monotonic() + delay,
+                                                      next(self.__sequence),
+                                                      bytes(packet)))
+            self.__cond.notify_all()
+
+    def play_script(self, script):
+        '''Injects a sequence of key packets.
+
+        @param script Iterable of (delay, endpoint, packet), delays in seconds
+        relative to the call.
+
+        '''
+        for delay, endpoint, packet in script:
+            self.inject_key_packet(endpoint, packet, delay)
+
+    def get_control_messages(self):
+        '''Returns recorded control messages as a list of
+        (monotonic time, requestType, request, data, value, index).
+
+        '''
+        with self.__cond:
+            return list(self.__controls)
+
+    def get_stats(self):
+        '''Returns a dict with number of accepted frames, number of those
+        updating only a window, bytes of accepted frames, number of rejected
+        frames, number of recorded control messages and bulk write latency
+        summary.
+
+        '''
+        with self.__cond:
+            stats = {'frames': self.__frames,
+                     'partial': self.__partial,
+                     'bytes': self.__bytes,
+                     'rejected': self.__rejected,
+                     'controls': len(self.__controls)}
+        stats['write_latency'] = self.__writeLatency.get_summary()
+        return stats
+
+    def get_frame_rgb565(self):
+        '''Returns last displayed frame as sent: little-endian RGB565, column
+        by column.
+
+        '''
+        with self.__cond:
+            return bytes(self.__frame)
+
+    def get_frame_image(self):
+        '''Returns last displayed frame as 320x240 RGB PIL image.'''
+        import PIL.Image as Img
+        img = Img.frombytes("RGB", (self.HEIGHT, self.WIDTH),
+                            self.get_frame_rgb565(), "raw", "BGR;16")
+        return img.transpose(Img.TRANSPOSE)
+
+    def save_frame_png(self, filename):
+        '''Saves last displayed frame as PNG.'''
+        self.get_frame_image().save(filename, "PNG")
+
+
+class VirtualHandle(object):
+    '''Legacy pyusb DeviceHandle look-alike of one VirtualG19Controller
+    interface.
+
+    '''
+
+    def __init__(self, device):
+        self.__device = device
+
+    def bulkWrite(self, endpoint, buffer, timeout=100):
+        return self.__device.bulk_write(endpoint, buffer, timeout)
+
+    def controlMsg(self, requestType, request, buffer, value=0, index=0, timeout=100):
+        return self.__device.control_msg(requestType, request, buffer, value, index, timeout)
+
+    def interruptRead(self, endpoint, size, timeout=100):
+        return self.__device.interrupt_read(endpoint, size, timeout)
+
+    def reset(self):
+        self.__device.reset()
+
+
+def main():
+    '''Measures frame throughput and key latency against the emulated
+    device.
+
+    '''
+    from g19d.logitech.g19 import G19
+    from g19d.logitech.g19_receivers import InputProcessor
+    from g19d import libcdraw
+
+    class Recorder(InputProcessor):
+        def __init__(self):
+            self.latency = LatencyStats()
+            self.injected = collections.deque()
+
+        def process_input(self, inputEvent):
+            if inputEvent.keysDown:
+                self.latency.add(time.monotonic() - self.injected.popleft())
+            return True
+
+        def get_input_processor(self):
+            return self
+
+    lg19 = G19(backend="virtual")
+    device = lg19.get_device()
+    recorder = Recorder()
+    lg19.add_key_listener(recorder)
+    lg19.start_event_handling()
+    lg19.start_command_scheduler()
+
+    frame = libcdraw.Frame()
+    count = 500
+    start = time.monotonic()
+    for i in range(count):
+        frame.draw_rectangle(0, 0, 320, 240, i & 0xffff, 1.0)
+        lg19.send_frame(frame, frame.get_checksum())
+    lg19.stop_command_scheduler()
+    elapsed = time.monotonic() - start
+    print("frames: {0:.0f}/s {1}".format(count / elapsed, lg19.get_frame_stats()))
+
+    # Clock-like updates: only a small window changes per frame
+    sent = device.get_stats()['bytes']
+    for i in range(count):
+        frame.draw_rectangle(254, 107, 34, 52, i & 0xffff, 1.0)
+        lg19.send_frame(frame, frame.get_checksum(), frame.get_damage())
+        frame.clear_damage()
+    print("partial frames: {0:.0f} bytes/frame".format(
+        (device.get_stats()['bytes'] - sent) / count))
+
+    for i in range(50):
+        recorder.injected.append(time.monotonic())
+        device.inject_key_packet(0x83, [0x02, 0x04, 0x00, 0x40])
+        time.sleep(0.02)
+        device.inject_key_packet(0x83, [0x02, 0x00, 0x00, 0x40])
+        time.sleep(0.02)
+    lg19.stop_event_handling()
+    print("key latency: {0}".format(recorder.latency))
+    print("device: {0}".format(device.get_stats()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import threading
+
+class LatencyStats(object):
+    '''Thread-safe accumulator of durations.
+
+    Samples are counted in a histogram with power-of-two buckets (in
+    microseconds), so memory use does not grow with the number of samples and
+    percentiles are approximate (upper bound of the bucket).
+
+    '''
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.__mutex = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''Drops all samples.'''
+        self.__mutex.acquire()
+        self.__histogram = [0] * self.BUCKETS
+        self.__count = 0
+        self.__total = 0.0
+        self.__max = 0.0
+        self.__mutex.release()
+
+    def add(self, seconds):
+        '''Records one sample.
+
+        @param seconds Duration in seconds.
+
+        '''
+        bucket = min(max(int(seconds * 1000000), 0).bit_length(), self.BUCKETS - 1)
+        self.__mutex.acquire()
+        self.__histogram[bucket] += 1
+        self.__count += 1
+        self.__total += seconds
+        if seconds > self.__max:
+            self.__max = seconds
+        self.__mutex.release()
+
+    def percentile(self, fraction):
+        '''Returns upper bound of given percentile in seconds.
+
+        @param fraction Percentile in [0,1], e.g. 0.99.
+        @return Duration in seconds or 0 if there are no samples.
+
+        '''
+        self.__mutex.acquire()
+        histogram = list(self.__histogram)
+        count = self.__count
+        maxValue = self.__max
+        self.__mutex.release()
+        return self.__percentile(histogram, count, maxValue, fraction)
+
+    @staticmethod
+    def __percentile(histogram, count, maxValue, fraction):
+        if not count:
+            return 0.0
+        threshold = fraction * count
+        seen = 0
+        for bucket, hits in enumerate(histogram):
+            seen += hits
+            if hits and seen >= threshold:
+                return min((1 << bucket) / 1000000.0, maxValue)
+        return maxValue
+
+    def get_summary(self):
+        '''Returns a dict with count, mean, p50, p90, p99 and max in
+        milliseconds.
+
+        '''
+        self.__mutex.acquire()
+        histogram = list(self.__histogram)
+        count = self.__count
+        total = self.__total
+        maxValue = self.__max
+        self.__mutex.release()
+        summary = {'count': count,
+                   'mean': total / count * 1000 if count else 0.0,
+                   'max': maxValue * 1000}
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            summary[name] = self.__percentile(histogram, count, maxValue, fraction) * 1000
+        return summary
+
+    def get_histogram(self):
+        '''Returns a list of (upper bound in milliseconds, hits) for all
+        non-empty buckets.
+
+        '''
+        self.__mutex.acquire()
+        histogram = list(self.__histogram)
+        self.__mutex.release()
+        return [((1 << bucket) / 1000.0, hits)
+                for bucket, hits in enumerate(histogram) if hits]
+
+    def __str__(self):
+        summary = self.get_summary()
+        return ("n={count} mean={mean:.2f}ms p50={p50:.2f}ms p90={p90:.2f}ms "
+                "p99={p99:.2f}ms max={max:.2f}ms").format(**summary)
+
+
+class LatencyStages(object):
+    '''Thread-safe set of LatencyStats by stage name, created on first use.'''
+
+    def __init__(self):
+        self.__mutex = threading.Lock()
+        self.__stages = {}
+
+    def get(self, stage):
+        '''Returns LatencyStats of stage.'''
+        self.__mutex.acquire()
+        stats = self.__stages.get(stage)
+        if stats is None:
+            stats = self.__stages[stage] = LatencyStats()
+        self.__mutex.release()
+        return stats
+
+    def add(self, stage, seconds):
+        '''Records one sample of stage.'''
+        self.get(stage).add(seconds)
+
+    def get_stages(self):
+        '''Returns a dict of stage names to LatencyStats.'''
+        self.__mutex.acquire()
+        stages = dict(self.__stages)
+        self.__mutex.release()
+        return stages
+
+    def format(self):
+        '''Returns a list of text lines with summary and histogram of every
+        stage.
+
+        '''
+        lines = []
+        for stage, stats in sorted(self.get_stages().items()):
+            lines.append("{0}: {1}".format(stage, stats))
+            lines.append("    " + " ".join("<={0:g}ms:{1}".format(bound, hits)
+                                           for bound, hits in stats.get_histogram()))
+        return lines
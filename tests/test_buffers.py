@@ -0,0 +1,84 @@
+from g19d import libcdraw
+from g19d.apps.buffers import TripleBuffer
+
+
+def _publish(buffers, frame):
+    buffers.get_back().copy_from(frame)
+    return buffers.publish()
+
+
+def test_acquire_returns_only_newer_frames():
+    buffers = TripleBuffer()
+    assert buffers.acquire() is None
+    assert buffers.get_front()[1:] == (0, None)
+
+    frame = libcdraw.Frame()
+    frame.draw_rectangle(0, 0, 10, 10, 0xffff, 1.0)
+    assert _publish(buffers, frame)
+    assert buffers.has_newer()
+    front, sequence, checksum, damage = buffers.acquire()
+    assert sequence == 1 and checksum == frame.get_checksum()
+    assert front.get_bytes() == frame.get_bytes()
+    assert damage == (0, 0, 320, 240)
+    assert buffers.acquire() is None
+    assert not buffers.has_newer()
+
+
+def test_unchanged_frame_is_not_published():
+    buffers = TripleBuffer()
+    frame = libcdraw.Frame()
+    frame.draw_rectangle(0, 0, 10, 10, 0xffff, 1.0)
+    _publish(buffers, frame)
+    buffers.acquire()
+    assert not _publish(buffers, frame)
+    assert buffers.get_sequence() == 1
+    assert buffers.acquire() is None
+
+
+def test_damage_covers_frames_published_between_acquires():
+    buffers = TripleBuffer()
+    frame = libcdraw.Frame()
+    _publish(buffers, frame)
+    buffers.acquire()
+
+    frame.draw_rectangle(10, 20, 5, 5, 0xffff, 1.0)
+    _publish(buffers, frame)
+    frame.draw_rectangle(100, 150, 10, 10, 0xf800, 1.0)
+    _publish(buffers, frame)
+    frame.draw_rectangle(50, 60, 2, 2, 0x07e0, 1.0)
+    _publish(buffers, frame)
+
+    front, sequence, checksum, damage = buffers.acquire()
+    assert sequence == 4
+    assert damage == (10, 20, 100, 140)
+    assert front.get_bytes() == frame.get_bytes()
+
+    frame.draw_rectangle(200, 10, 3, 3, 0xffff, 1.0)
+    _publish(buffers, frame)
+    assert buffers.acquire()[3] == (200, 10, 3, 3)
+
+
+def test_back_frame_follows_published_frames():
+    buffers = TripleBuffer()
+    frame = libcdraw.Frame()
+    for i in range(10):
+        frame.draw_rectangle(i * 20, 0, 20, 20, 0x1000 + i, 1.0)
+        _publish(buffers, frame)
+        assert buffers.get_back().get_bytes() == frame.get_bytes()
+        if i % 3 == 0:
+            assert buffers.acquire()[0].get_bytes() == frame.get_bytes()
+    # Back, latest and front frames are never the same object
+    front = buffers.get_front()[0]
+    assert buffers.get_back() is not front
+
+
+def test_listener_is_called_on_publish():
+    buffers = TripleBuffer()
+    published = []
+    buffers.set_listener(lambda: published.append(buffers.get_sequence()))
+    frame = libcdraw.Frame()
+    _publish(buffers, frame)
+    _publish(buffers, frame)
+    frame.draw_rectangle(0, 0, 1, 1, 0xffff, 1.0)
+    _publish(buffers, frame)
+    assert published == [1, 2]
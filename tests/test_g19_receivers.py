@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from g19d.logitech.g19_keys import (Data, Key)
+from g19d.logitech.g19_receivers import (InputDispatcher, InputEvent,
+                                         InputProcessor, State)
+
+
+def _reference_keys(codes, value, empty=0):
+    '''Greedy decoding the tables replaced: strips key codes off value until
+    only empty is left, raises ValueError on unknown bits.
+
+    '''
+    keys = set()
+    while value != empty:
+        found = False
+        for code, key in codes.items():
+            if code & value == code:
+                value ^= code
+                keys.add(key)
+                found = True
+        if not found:
+            raise ValueError(value)
+    return keys
+
+
+def _decode(decode, data):
+    try:
+        return State(decode(data)).get_keys_down()
+    except ValueError:
+        return ValueError
+
+
+def _expected(codes, value, empty=0):
+    try:
+        return _reference_keys(codes, value, empty)
+    except ValueError:
+        return ValueError
+
+
+def test_display_packets_decode_like_reference():
+    state = State()
+    for byte in range(256):
+        assert _decode(state._data_to_mask_display, [byte, 0x80]) == \
+            _expected(Data.displayKeys, byte)
+
+
+def test_g_and_m_packets_decode_like_reference():
+    state = State()
+    random.seed(7)
+    packets = [[0x02, low, mid, high]
+               for low, mid, high in [(1 << i, 0, 0x40) for i in range(8)] +
+               [(0, 1 << i, 0x40) for i in range(8)] +
+               [(0, 0, 0x40 | 1 << i) for i in range(8)] +
+               [(0, 0, high) for high in range(256)]]
+    packets += [[0x02, random.getrandbits(8), random.getrandbits(8),
+                 random.choice([0x40, 0x48, random.getrandbits(8)])]
+                for i in range(3000)]
+    for data in packets:
+        value = data[3] << 16 | data[2] << 8 | data[1]
+        assert _decode(state._data_to_mask_g_and_m, data) == \
+            _expected(Data.gmKeys, value, 0x400000), data
+
+
+def test_multimedia_packets_decode_like_reference():
+    state = State()
+    for byte in range(256):
+        assert _decode(state._data_to_mask_mm, [1, byte]) == \
+            _expected(Data.mmKeys, byte)
+    assert _decode(state._data_to_mask_mm, [3, 1]) == {Key.WINKEY_SWITCH}
+    assert _decode(state._data_to_mask_mm, [3, 0]) == set()
+    assert _decode(state._data_to_mask_mm, [3, 2]) is ValueError
+
+
+def test_state_reports_presses_and_releases():
+    state = State()
+    evt = state.packet_received_g_and_m([0x02, 0x03, 0x00, 0x40])
+    assert evt.keysDown == {Key.G01, Key.G02}
+    assert not evt.keysUp
+    evt = state.packet_received_g_and_m([0x02, 0x02, 0x00, 0x40])
+    assert evt.keysUp == {Key.G01}
+    assert state.get_keys_down() == {Key.G02}
+
+
+class _Recorder(InputProcessor):
+    def __init__(self):
+        self.events = []
+
+    def process_input(self, inputEvent):
+        self.events.append(inputEvent)
+        return True
+
+
+def test_dispatcher_merges_overflow_into_last_event():
+    recorder = _Recorder()
+    dispatcher = InputDispatcher(lambda: [recorder], capacity=2)
+    g01, g02, g03 = 1 << Key.G01, 1 << Key.G02, 1 << Key.G03
+    dispatcher.put(InputEvent(0, g01, 1.0))
+    dispatcher.put(InputEvent(g01, g01 | g02, 2.0))
+    # Queue is full: these two are folded into the second event
+    dispatcher.put(InputEvent(g01 | g02, g01, 3.0))
+    dispatcher.put(InputEvent(g01, g01 | g03, 4.0))
+    assert dispatcher.get_stats()['overflows'] == 2
+
+    while dispatcher.get_stats()['queue_depth']:
+        dispatcher.execute()
+    first, merged = recorder.events
+    assert first.keysDown == {Key.G01}
+    # G02 pressed and released within the merge is lost, G03 is kept
+    assert merged.oldMask == g01 and merged.newMask == g01 | g03
+    assert merged.keysDown == {Key.G03} and not merged.keysUp
+    assert merged.timestamp == 2.0
+
+
+@pytest.mark.parametrize("capacity", [1, 4])
+def test_dispatcher_keeps_final_state(capacity):
+    recorder = _Recorder()
+    dispatcher = InputDispatcher(lambda: [recorder], capacity=capacity)
+    state = State()
+    random.seed(capacity)
+    for i in range(50):
+        low = random.getrandbits(8)
+        dispatcher.put(state.packet_received_g_and_m([0x02, low, 0x00, 0x40]))
+    while dispatcher.get_stats()['queue_depth']:
+        dispatcher.execute()
+    masks = [0] + [evt.newMask for evt in recorder.events]
+    assert all(evt.oldMask == old for evt, old in zip(recorder.events, masks))
+    assert masks[-1] == state.mask
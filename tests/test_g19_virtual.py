@@ -0,0 +1,119 @@
+import random
+import time
+
+import pytest
+import usb
+
+from g19d import libcdraw
+from g19d.logitech.g19 import G19
+from g19d.logitech.g19_virtual import VirtualG19Controller
+
+
+def _send(lg19, frame):
+    sent = lg19.send_frame(frame, frame.get_checksum(), frame.get_damage())
+    frame.clear_damage()
+    return sent
+
+
+def test_frame_reaches_display():
+    device = VirtualG19Controller()
+    lg19 = G19(backend=device)
+    frames = device.get_stats()['frames']
+    frame = libcdraw.Frame()
+    frame.draw_rectangle(10, 20, 30, 40, 0xf800, 1.0)
+    assert lg19.send_frame(frame, frame.get_checksum())
+    assert device.get_frame_rgb565() == frame.get_bytes()
+    assert device.get_stats()['frames'] == frames + 1
+
+
+def test_unchanged_frame_is_skipped():
+    device = VirtualG19Controller()
+    lg19 = G19(backend=device)
+    frame = libcdraw.Frame()
+    assert lg19.send_frame(frame, frame.get_checksum())
+    frames = device.get_stats()['frames']
+    assert not lg19.send_frame(frame, frame.get_checksum())
+    assert device.get_stats()['frames'] == frames
+
+
+def test_invalid_packet_is_rejected():
+    device = VirtualG19Controller()
+    with pytest.raises(usb.USBError):
+        device.handleIf0.bulkWrite(2, bytes(512 + 100))
+    assert device.get_stats()['rejected'] == 1
+
+
+def test_injected_key_packet_is_read():
+    device = VirtualG19Controller()
+    device.inject_key_packet(0x83, [0x02, 0x04, 0x00, 0x40])
+    assert device.handleIf1.interruptRead(0x83, 4, 100) == bytes([0x02, 0x04, 0x00, 0x40])
+    with pytest.raises(usb.USBError):
+        device.handleIf1.interruptRead(0x83, 4, 10)
+
+
+def test_partial_updates_keep_display_in_sync():
+    device = VirtualG19Controller()
+    lg19 = G19(backend=device)
+    frame = libcdraw.Frame()
+    _send(lg19, frame)
+    full = device.get_stats()
+
+    random.seed(8)
+    for i in range(30):
+        frame.draw_rectangle(random.randint(-20, 320), random.randint(-20, 240),
+                             random.randint(1, 60), random.randint(1, 60),
+                             random.getrandbits(16), 1.0)
+        assert _send(lg19, frame)
+    stats = device.get_stats()
+    assert stats['partial'] - full['partial'] == 30
+    assert stats['bytes'] - full['bytes'] < 30 * 320 * 240 * 2 / 4
+    assert device.get_frame_rgb565() == frame.get_bytes()
+
+
+def test_rejected_window_falls_back_to_full_frames():
+    device = VirtualG19Controller(windows=False)
+    lg19 = G19(backend=device)
+    frame = libcdraw.Frame()
+    _send(lg19, frame)
+
+    frame.draw_rectangle(10, 10, 5, 5, 0xffff, 1.0)
+    _send(lg19, frame)
+    frame.draw_rectangle(20, 10, 5, 5, 0xf800, 1.0)
+    _send(lg19, frame)
+    frame.draw_rectangle(30, 10, 5, 5, 0x07e0, 1.0)
+    _send(lg19, frame)
+    stats = device.get_stats()
+    assert stats['rejected'] == 1
+    assert stats['partial'] == 0
+    assert device.get_frame_rgb565() == frame.get_bytes()
+
+
+def test_partial_updates_can_be_turned_off():
+    device = VirtualG19Controller()
+    lg19 = G19(backend=device, partialUpdates=False)
+    frame = libcdraw.Frame()
+    _send(lg19, frame)
+    frame.draw_rectangle(10, 10, 5, 5, 0xffff, 1.0)
+    _send(lg19, frame)
+    assert device.get_stats()['partial'] == 0
+
+
+def test_scheduler_delivers_last_frame_and_color():
+    device = VirtualG19Controller(bandwidth=20e6)
+    lg19 = G19(backend=device)
+    lg19.start_command_scheduler()
+    frame = libcdraw.Frame()
+    try:
+        for i in range(20):
+            frame.draw_rectangle(i * 10, 0, 10, 240, 0x1000 + i, 1.0)
+            lg19.send_frame(frame, frame.get_checksum())
+        lg19.set_bg_color(1, 2, 3)
+        lg19.set_bg_color(4, 5, 6)
+        deadline = time.monotonic() + 5
+        while lg19.get_frame_stats()['queue_depth'] and time.monotonic() < deadline:
+            time.sleep(0.001)
+    finally:
+        lg19.stop_command_scheduler()
+    assert device.get_frame_rgb565() == frame.get_bytes()
+    colors = [message[3] for message in device.get_control_messages()]
+    assert colors[-1] == bytes([7, 4, 5, 6])
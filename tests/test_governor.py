@@ -0,0 +1,80 @@
+import pytest
+
+from g19d.apps.governor import FrameGovernor
+
+
+def _on_time(governor, now, send=0.001):
+    '''Sends a frame as soon as allowed after now, returns when it ended.'''
+    start = max(now, now + governor.get_delay(now))
+    governor.frame_sent(start, start, start + send, 1)
+    return start + send
+
+
+def test_first_frame_goes_out_right_away():
+    governor = FrameGovernor()
+    governor.reset(10, 30)
+    assert governor.get_delay(100.0) <= 0
+
+
+def test_frames_are_paced_at_target():
+    governor = FrameGovernor()
+    governor.reset(10, 30)
+    now = 100.0
+    starts = []
+    for i in range(5):
+        now = _on_time(governor, now)
+        starts.append(now - 0.001)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert gaps == pytest.approx([0.1] * 4)
+    assert governor.get_rate() == 10
+
+
+def test_misses_lower_rate_and_good_frames_restore_it():
+    governor = FrameGovernor()
+    governor.reset(10, 30)
+    now = 100.0
+    # Sends taking longer than a period are deadline misses
+    for expected in (7.5, 5.625):
+        governor.frame_sent(now, now, now + 0.5, 1)
+        now += 0.5
+        assert governor.get_rate() == pytest.approx(expected)
+    for i in range(20):
+        governor.frame_sent(now, now, now + 2.0, 1)
+        now += 2.0
+    assert governor.get_rate() == FrameGovernor.MIN_RATE
+
+    for i in range(4):
+        now = _on_time(governor, now)
+    assert governor.get_rate() == pytest.approx(1 + 4 * FrameGovernor.INCREASE)
+    for i in range(30):
+        now = _on_time(governor, now)
+    assert governor.get_rate() == 10
+    assert governor.get_stats()['misses'] == 22
+
+
+def test_bus_backlog_lowers_rate():
+    governor = FrameGovernor()
+    governor.reset(20, 30)
+    governor.frame_sent(100.0, 100.0, 100.001, 2)
+    assert governor.get_rate() == pytest.approx(15)
+    stats = governor.get_stats()
+    assert stats['stalls'] == 1 and stats['misses'] == 0
+
+
+def test_late_frame_is_followed_sooner_but_not_above_maximum():
+    governor = FrameGovernor()
+    governor.reset(10, 20)
+    governor.frame_sent(100.0, 100.0, 100.001, 1)
+    # Next deadline is 100.1; sent 80 ms late, still within a period
+    governor.frame_sent(100.1, 100.18, 100.181, 1)
+    # Back on the grid at 100.2, but no sooner than 1/20 s after the last one
+    assert governor.get_delay(100.181) == pytest.approx(100.23 - 100.181)
+
+
+def test_reset_restores_target_of_new_applet():
+    governor = FrameGovernor()
+    governor.reset(10, 30)
+    governor.frame_sent(100.0, 100.0, 100.5, 1)
+    governor.reset(30, 60)
+    assert governor.get_rate() == 30
+    assert governor.get_delay(101.0) <= 0
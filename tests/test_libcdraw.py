@@ -0,0 +1,176 @@
+import random
+import struct
+from array import array
+
+import pytest
+
+from g19d import libcdraw
+import g19d.libdraw as libdraw
+
+PREAMBLE_SIZE = 512
+
+
+def _random_frame(seed):
+    random.seed(seed)
+    frame = libcdraw.Frame()
+    frame.copy_rectangle(0, 0, 320, 240, bytes(random.getrandbits(8) for i in range(320 * 240 * 2)),
+                         None)
+    return frame
+
+
+def _pixel(frame, x, y):
+    return struct.unpack_from("<H", frame.get_bytes(), (x * 240 + y) * 2)[0]
+
+
+def _covers(damage, x, y, width, height):
+    dx, dy, dw, dh = damage
+    return dx <= x and dy <= y and x + width <= dx + dw and y + height <= dy + dh
+
+
+def test_copy_from_identical_frame_leaves_no_damage():
+    source = _random_frame(1)
+    target = libcdraw.Frame()
+    target.copy_from(source)
+    target.clear_damage()
+    generation = target.get_generation()
+
+    target.copy_from(source)
+    assert target.get_damage() is None
+    assert target.get_generation() == generation
+
+
+def test_copy_from_damages_changed_window_only():
+    source = _random_frame(2)
+    target = libcdraw.Frame()
+    target.copy_from(source)
+    target.clear_damage()
+
+    source.draw_rectangle(100, 50, 20, 10, 0x1234, 1.0)
+    source.draw_rectangle(130, 70, 5, 5, 0x4321, 1.0)
+    target.copy_from(source)
+    damage = target.get_damage()
+    assert _covers(damage, 100, 50, 20, 10) and _covers(damage, 130, 70, 5, 5)
+    assert damage[0] == 100 and damage[0] + damage[2] == 135
+    assert target.get_bytes() == source.get_bytes()
+
+
+def test_draw_damage_is_clipped():
+    frame = libcdraw.Frame()
+    frame.clear_damage()
+    frame.draw_rectangle(-10, 230, 30, 30, 0xffff, 1.0)
+    assert frame.get_damage() == (0, 230, 20, 10)
+    frame.clear_damage()
+    frame.draw_rectangle(400, 0, 10, 10, 0xffff, 1.0)
+    assert frame.get_damage() is None
+
+
+@pytest.mark.parametrize("window", [(0, 0, 320, 240), (10, 20, 30, 40), (319, 239, 1, 1),
+                                    (300, 200, 50, 50), (0, 100, 320, 1)])
+def test_pack_writes_window_column_by_column(window):
+    frame = _random_frame(3)
+    packet = bytearray(PREAMBLE_SIZE + 320 * 240 * 2)
+    size = frame.pack(packet, *window)
+
+    x, y = window[:2]
+    width, height = min(window[2], 320 - x), min(window[3], 240 - y)
+    blocks = (width * height * 2 + 255) // 256
+    assert size == PREAMBLE_SIZE + blocks * 256
+    assert packet[3] | packet[4] << 8 == blocks
+    assert struct.unpack_from("<4H", packet, 7) == (x, y, x + width - 1, y + height - 1)
+    pixels = struct.unpack_from("<{0}H".format(width * height), packet, PREAMBLE_SIZE)
+    assert list(pixels) == [_pixel(frame, x + i, y + j)
+                            for i in range(width) for j in range(height)]
+    assert not any(packet[PREAMBLE_SIZE + width * height * 2:size])
+
+
+def test_pack_rejects_empty_window_and_small_buffer():
+    frame = libcdraw.Frame()
+    with pytest.raises(ValueError):
+        frame.pack(bytearray(PREAMBLE_SIZE + 256), 320, 0, 10, 10)
+    with pytest.raises(ValueError):
+        frame.pack(bytearray(PREAMBLE_SIZE + 256), 0, 0, 20, 20)
+
+
+def _draw_ops():
+    face = libdraw.load_font(24)
+    atlas = face.get_atlas("Hello world 0123456789")
+    random.seed(4)
+    sprite = libcdraw.Sprite(30, 20, bytes(random.getrandbits(8) for i in range(30 * 20 * 2)),
+                             bytes(random.choice([0, 128, 255]) for i in range(30 * 20)))
+    positions = array('h', [random.randint(-40, 330) for i in range(40)])
+    text_mask = bytes(random.choice([0, 60, 255]) for i in range(50 * 30))
+    return [
+        ("draw_rectangle", (10, 10, 100, 50, 0x1234, 1.0)),
+        ("draw_rectangle", (-5, 100, 400, 50, 0xf00f, 0.4)),
+        ("blit", (sprite, 50, 60)),
+        ("blit", (sprite, 310, -5)),
+        ("blit_many", (sprite, positions)),
+        ("copy_text", (100, 150, 50, 30, 0xffff, text_mask)),
+        ("draw_string", (atlas, 20, 180, 0xffff, "Hello world 42", (10, 170, 200, 30))),
+        ("draw_string", (atlas, 20, 200, 0x07e0, "0123456789", (0, 0, 0, 0))),
+    ]
+
+
+def test_display_list_replay_matches_direct_drawing():
+    ops = _draw_ops()
+    direct = _random_frame(5)
+    replayed = _random_frame(5)
+    display_list = libcdraw.DisplayList()
+    for name, args in ops:
+        pen = getattr(direct, name)(*args)
+        assert getattr(display_list, name)(*args) == pen
+    assert 0 < display_list.get_count() <= len(ops)
+
+    replayed.clear_damage()
+    replayed.execute(display_list)
+    assert replayed.get_bytes() == direct.get_bytes()
+    assert replayed.get_damage() is not None
+
+    # Lists are kept for drawing again
+    for name, args in ops:
+        getattr(direct, name)(*args)
+    replayed.execute(display_list)
+    assert replayed.get_bytes() == direct.get_bytes()
+
+    display_list.clear()
+    assert display_list.get_count() == 0
+
+
+def test_drawer_records_into_display_list():
+    drawer = libdraw.Drawer()
+    drawer.begin_list()
+    drawer.draw_rectangle((10, 20), (30, 40), (255, 0, 0))
+    display_list = drawer.end_list()
+    assert display_list.get_count() == 1
+    before = drawer.get_checksum()
+    drawer.draw_list(display_list)
+    assert drawer.get_checksum() != before
+
+
+def test_simd_kernels_match_scalar():
+    default = libcdraw.get_simd()
+    kernels = []
+    for simd in ("scalar", "sse2", "avx2"):
+        try:
+            libcdraw.set_simd(simd)
+            kernels.append(simd)
+        except ValueError:
+            pass
+    random.seed(6)
+    try:
+        for i in range(40):
+            sx, sy = random.randint(1, 340), random.randint(1, 260)
+            x, y = random.randint(-40, 320), random.randint(-40, 240)
+            image = bytes(random.getrandbits(8) for j in range(sx * sy * 2))
+            mask = bytes(random.choice([0, 90, 255]) for j in range(sx * sy))
+            results = set()
+            for simd in kernels:
+                libcdraw.set_simd(simd)
+                frame = libcdraw.Frame()
+                frame.draw_rectangle(0, 0, 320, 240, 0x1234, 0.5)
+                frame.copy_rectangle(x, y, sx, sy, image, mask)
+                frame.copy_text(y, x, sx, sy, 0xf00f, mask)
+                results.add(frame.get_bytes())
+            assert len(results) == 1, (x, y, sx, sy)
+    finally:
+        libcdraw.set_simd(default)
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from g19d.apps import Applet
+from g19d.apps.runtime import AppletRuntime
+
+
+@pytest.fixture
+def runtime():
+    runtime = AppletRuntime()
+    yield runtime
+    runtime.stop()
+
+
+def _flush(runtime):
+    '''Waits until calls already due have run.'''
+    done = threading.Event()
+    runtime.call_soon(done.set)
+    assert done.wait(5)
+
+
+def test_periodic_call_does_not_drift(runtime):
+    deadlines = []
+    finished = threading.Event()
+
+    def tick():
+        deadlines.append(call.deadline)
+        time.sleep(0.003)
+        if len(deadlines) == 20:
+            runtime.cancel(call)
+            finished.set()
+
+    interval = 0.01
+    call = runtime.call_every(interval, tick)
+    runtime.start()
+    assert finished.wait(5)
+    # Deadlines advance by whole periods from the first one, however long
+    # ticks take or how late they run
+    periods = [(deadline - deadlines[0]) / interval for deadline in deadlines]
+    assert all(abs(period - round(period)) < 1e-6 for period in periods)
+    assert periods == sorted(set(periods))
+    # Cancelled from its own callback, it is not rescheduled
+    time.sleep(0.03)
+    _flush(runtime)
+    assert len(deadlines) == 20
+
+
+def test_cancelled_calls_do_not_run(runtime):
+    ran = []
+    runtime.cancel(runtime.call_later(0.01, ran.append, 'once'))
+    runtime.cancel(runtime.call_every(0.005, ran.append, 'periodic'))
+    runtime.call_later(0.02, ran.append, 'kept')
+    runtime.start()
+    time.sleep(0.05)
+    _flush(runtime)
+    assert ran == ['kept']
+
+
+def test_failing_call_does_not_stop_runtime(runtime):
+    def fail():
+        raise RuntimeError("expected")
+
+    runtime.start()
+    runtime.call_soon(fail)
+    _flush(runtime)
+    assert runtime.get_stats()['calls'] == 2
+
+
+class _Counter(Applet):
+    def __init__(self):
+        super(_Counter, self).__init__(None)
+        self.redraws = 0
+
+    def _redraw(self):
+        self.redraws += 1
+
+
+def test_invalidate_coalesces_redraws(runtime):
+    applet = _Counter()
+    applet.run(runtime)
+    applet.on_show()
+    for i in range(10):
+        applet.invalidate()
+    runtime.start()
+    _flush(runtime)
+    assert applet.redraws == 1
+
+    applet.invalidate()
+    _flush(runtime)
+    assert applet.redraws == 2
+
+
+def test_hidden_applet_redraws_when_shown(runtime):
+    applet = _Counter()
+    runtime.start()
+    applet.run(runtime)
+    for i in range(3):
+        applet.invalidate()
+    _flush(runtime)
+    assert applet.redraws == 0
+
+    applet.on_show()
+    _flush(runtime)
+    assert applet.redraws == 1
+    applet.on_hide()
+    applet.shutdown()
+    applet.invalidate()
+    _flush(runtime)
+    assert applet.redraws == 1